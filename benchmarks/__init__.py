@@ -0,0 +1,12 @@
+"""
+Benchmarks for taggivm hot paths.
+
+Run from the repository root after `pip install -e .`, e.g.:
+    python -m benchmarks.bench_walker
+    python -m benchmarks.suite --scale 10k --output results.json
+    python -m benchmarks.startup
+
+`suite` times scan, ingest and database paths on a reproducible synthetic
+library (see `synthetic`) and writes JSON that can be compared between runs.
+`startup` checks the modules imported by the CLI entry points (import budget).
+"""
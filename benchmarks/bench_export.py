@@ -0,0 +1,83 @@
+"""
+Time and peak memory of a full dump of the tracks table, scaled to a million tracks.
+
+    python -m benchmarks.bench_export --tracks 1000000
+
+fetchall: the former way, _fetch_all of the table (a dict per row) then json.dumps per row
+jsonl:    export_library, JSON encoded by SQLite, streamed with fetchmany
+csv:      export_library, csv.writer over the streamed tuples
++gzip / +zstd: the same, compressed
+
+Every mode runs in a new process: peak RSS is the whole process (interpreter and SQLite cache
+included), read from VmHWM (Linux) as ru_maxrss keeps the peak of the parent across fork and exec.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from db import init_db, close_all, ExportRepository
+from services import init_album_DB, export_library
+from services.export import zstandard
+from .synthetic import make_albums
+
+def run_mode(mode: str, db_path: str, out_dir: str):
+    """Worker process: (seconds, bytes written, peak RSS in MB)"""
+    start = time.perf_counter()
+    if mode == 'fetchall':
+        repo = ExportRepository(db_path)
+        path = Path(out_dir) / 'tracks.fetchall.jsonl'
+        with open(path, 'w', encoding='utf-8') as out:
+            for row in repo._fetch_all("SELECT * FROM tracks ORDER BY id"):
+                out.write(json.dumps(row, ensure_ascii=False) + '\n')
+        size = path.stat().st_size
+    else:
+        fmt, _, compression = mode.partition('+')
+        size = export_library(db_path, out_dir, tables=['tracks'], fmt=fmt, compression=compression or 'none').bytes_written
+    elapsed = time.perf_counter() - start
+    close_all()
+    return elapsed, size, peak_rss()
+
+def peak_rss() -> float:
+    """Peak resident memory of this process (MB)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=1_000_000)
+    parser.add_argument("--per-album", type=int, default=10)
+    args = parser.parse_args()
+
+    n_albums = args.tracks // args.per_album
+    n_tracks = n_albums * args.per_album
+    scale = 1_000_000 / n_tracks
+    modes = ['fetchall', 'jsonl', 'csv', 'jsonl+gzip', 'csv+gzip']
+    if zstandard is not None:
+        modes += ['jsonl+zstd', 'csv+zstd']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "export.db"
+        init_db(db_path)
+        start = time.perf_counter()
+        init_album_DB(make_albums(n_albums, args.per_album), db_path)
+        close_all()
+        print(f"{n_tracks} tracks ingested in {time.perf_counter() - start:.1f}s")
+
+        context = multiprocessing.get_context('spawn')
+        for mode in modes:
+            with context.Pool(1) as pool:
+                elapsed, size, rss = pool.apply(run_mode, (mode, str(db_path), tmp))
+            print(f"{mode:<11} {elapsed * scale:7.2f} s/M tracks {size / 2**20 * scale:8.1f} MB/M tracks   peak RSS {rss:6.1f} MB")
+
+if __name__ == "__main__":
+    main()
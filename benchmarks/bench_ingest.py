@@ -0,0 +1,50 @@
+"""Benchmark the per-album ingest against MusicRepository.bulk_ingest (tracks per second)"""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+from pathlib import Path
+
+from db import init_db, MusicRepository
+from .synthetic import make_albums
+
+def per_album(db_path: Path, albums: list) -> None:
+    """Original init_album_DB loop: one repository, connection and commit per insert"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        for album in albums:
+            MusicRepository(db_path).new_album_tracklist(album)
+
+def bulk(db_path: Path, albums: list, batch_size: int) -> None:
+    MusicRepository(db_path).bulk_ingest(albums, batch_size=batch_size)
+
+def run(label: str, fn, albums: list, tmp: Path) -> float:
+    db_path = tmp / f"{label.replace(' ', '_')}.db"
+    init_db(db_path)
+    start = time.perf_counter()
+    fn(db_path, albums)
+    elapsed = time.perf_counter() - start
+    n_tracks = sum(len(album.tracklist) for album in albums)
+    print(f"{label:<24} {elapsed:8.2f} s {n_tracks / elapsed:12.0f} tracks/s")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--albums", type=int, default=2000)
+    parser.add_argument("--tracks", type=int, default=12)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--skip-baseline", action="store_true", help="do not run the (slow) per-album ingest")
+    args = parser.parse_args()
+
+    albums = make_albums(args.albums, args.tracks)
+    print(f"{args.albums} albums x {args.tracks} tracks")
+    with tempfile.TemporaryDirectory(prefix="taggivm-bench-") as tmp:
+        tmp = Path(tmp)
+        baseline = None if args.skip_baseline else run("per-album (legacy)", per_album, albums, tmp)
+        for batch_size in args.batch_size:
+            elapsed = run(f"bulk, batch {batch_size}", lambda db, al: bulk(db, al, batch_size), albums, tmp)
+            if baseline:
+                print(f"{'':<24} x{baseline / elapsed:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Album/search result matching on a synthetic workload, scaled to 10k albums.
+
+    python -m benchmarks.bench_matcher --albums 10000 --candidates 50
+
+Every album has `--candidates` search results: the right release (case, accents,
+'The', edition notes, year and track count perturbed), other albums of the same
+artist and albums of other artists; a tenth of the albums have no right release.
+
+pairwise: the former way, every pair scored in Python (difflib ratios), on a sample
+batch:    AlbumMatcher.match, all the pairs scored with NumPy
+pool:     AlbumMatcher.match_pool, the candidates of all the albums pooled and blocked by artist
+          (every album is compared with all the candidates of its artist: ~8x the pairs)
+"""
+import argparse
+import difflib
+import random
+import time
+import unicodedata
+
+from services.fetch.matcher import AlbumMatcher, normalize_name, MATCH_THRESHOLD, WEIGHTS, YEAR_SPAN
+
+WORDS = ('blue', 'night', 'river', 'glass', 'echo', 'paper', 'silver', 'sun', 'ghost', 'garden', 'fire', 'winter',
+         'heart', 'machine', 'ocean', 'city', 'dream', 'stone', 'light', 'shadow', 'electric', 'golden', 'wild', 'road')
+EDITIONS = (' (Remastered)', ' [Deluxe Edition]', ' (2011 Remaster)', '', '', '')
+
+def make_workload(n_albums: int, n_candidates: int, seed: int = 0):
+    """(albums, candidate lists, expected index or None of every album)"""
+    rng = random.Random(seed)
+    artists = [' '.join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 3))) for _ in range(max(1, n_albums // 8))]
+    def title():
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+    def release(artist):
+        return {'title': title(), 'artist': artist, 'year': rng.randint(1960, 2024), 'tracks': rng.randint(6, 16)}
+
+    albums, candidates, expected = [], [], []
+    for _ in range(n_albums):
+        artist = rng.choice(artists)
+        album = release(artist)
+        albums.append({'title': album['title'], 'album_artist': artist, 'release_year': album['year'], 'total_tracks': album['tracks']})
+        results = [release(artist) for _ in range(n_candidates // 5)]
+        results += [release(rng.choice(artists)) for _ in range(n_candidates - len(results))]
+        if rng.random() < 0.9:
+            accented = unicodedata.normalize('NFC', album['title'].replace('e', 'é')) if rng.random() < 0.3 else album['title']
+            results[0] = {
+                'title': (accented.upper() if rng.random() < 0.3 else accented) + rng.choice(EDITIONS),
+                'artist': ('The ' + artist) if rng.random() < 0.2 else artist,
+                'year': album['year'] + rng.choice((0, 0, 0, 1, -1)),
+                'tracks': album['tracks'] + rng.choice((0, 0, 1, 2)),
+            }
+            position = rng.randrange(n_candidates)
+            results[0], results[position] = results[position], results[0]
+            expected.append(position)
+        else:
+            expected.append(None)
+        candidates.append(results)
+    return albums, candidates, expected
+
+def pairwise(albums, candidates):
+    """Python baseline: difflib ratios of every pair, same features and weights as the matcher"""
+    matches = []
+    for album, results in zip(albums, candidates):
+        title, artist = normalize_name(album['title']), normalize_name(album['album_artist'])
+        best, best_score = None, MATCH_THRESHOLD
+        for i, result in enumerate(results):
+            score = (WEIGHTS['title'] * difflib.SequenceMatcher(None, title, normalize_name(result['title'])).ratio()
+                     + WEIGHTS['artist'] * difflib.SequenceMatcher(None, artist, normalize_name(result['artist'])).ratio()
+                     + WEIGHTS['year'] * max(0, 1 - abs(album['release_year'] - result['year']) / YEAR_SPAN)
+                     + WEIGHTS['tracks'] * (1 - abs(album['total_tracks'] - result['tracks']) / max(album['total_tracks'], result['tracks'])))
+            if score >= best_score:
+                best, best_score = i, score
+        matches.append(best)
+    return matches
+
+def accuracy(found, expected) -> float:
+    return sum(f == e for f, e in zip(found, expected)) / len(expected)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--albums", type=int, default=10_000)
+    parser.add_argument("--candidates", type=int, default=50, help="search results per album")
+    parser.add_argument("--sample", type=int, default=500, help="albums scored by the pairwise baseline")
+    parser.add_argument("--threshold", type=float, default=MATCH_THRESHOLD)
+    args = parser.parse_args()
+
+    albums, candidates, expected = make_workload(args.albums, args.candidates)
+    pairs = args.albums * args.candidates
+    print(f"{args.albums} albums x {args.candidates} candidates ({pairs} pairs)")
+
+    def report(label: str, elapsed: float, n_albums: int, found: list, expected: list):
+        scaled = elapsed * args.albums / n_albums
+        print(f"{label:<9} {scaled:8.2f} s {args.albums / scaled:10.0f} albums/s   accuracy {accuracy(found, expected):6.1%}")
+
+    sample = min(args.sample, args.albums)
+    start = time.perf_counter()
+    found = pairwise(albums[:sample], candidates[:sample])
+    report("pairwise", time.perf_counter() - start, sample, found, expected[:sample])
+
+    matcher = AlbumMatcher(threshold=args.threshold)
+    normalize_name.cache_clear()
+    start = time.perf_counter()
+    matches = matcher.match(albums, candidates)
+    report("batch", time.perf_counter() - start, args.albums, [m.index if m else None for m in matches], expected)
+
+    # the same candidates as one pool: each album only sees the candidates of its artist
+    pool = [result for results in candidates for result in results]
+    offsets = [i * args.candidates for i in range(args.albums)]
+    normalize_name.cache_clear()
+    start = time.perf_counter()
+    matches = matcher.match_pool(albums, pool)
+    elapsed = time.perf_counter() - start
+    found = [m.index - offset if m and 0 <= m.index - offset < args.candidates else None for m, offset in zip(matches, offsets)]
+    report("pool", elapsed, args.albums, found, expected)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Memory and time of the track representations, scaled to a million tracks.
+
+    python -m benchmarks.bench_tracks --tracks 1000000
+
+objects: AlbumData/TrackData tracklists, as built by the scan
+batch:   the same tracks in a TrackBatch (columns, interned strings; the title and path
+         strings it shares with the objects are not counted)
+dicts:   one dict per row with per-row timestamps (the former TrackRepository.new_tracklist)
+tuples:  TrackBatch.rows, as bound to the multi-row INSERTs
+insert:  bulk_ingest of the albums into an empty database
+"""
+import argparse
+import gc
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from core import TrackBatch
+from db import init_db, close_all, MusicRepository
+from .synthetic import make_albums
+
+def measure(fn):
+    """(result, seconds, MB allocated and still alive when fn returns): timed and traced in two runs"""
+    gc.collect()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current / 2**20
+
+def dict_rows(albums: list) -> list:
+    return [{
+        'album_id': album_id, 'title': track.title, 'path': track.path, 'duration_ms': track.duration_ms,
+        'fingerprint': track.fingerprint, 'track_number': track.track_number, 'disc_number': track.disc_number,
+        'format': track.format,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    } for album_id, album in enumerate(albums, 1) for track in album.tracklist]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=1_000_000)
+    parser.add_argument("--per-album", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1000, help="albums per transaction of the insert")
+    args = parser.parse_args()
+
+    n_albums = args.tracks // args.per_album
+    n_tracks = n_albums * args.per_album
+    scale = 1_000_000 / n_tracks
+
+    def report(label: str, elapsed: float, mb: float):
+        print(f"{label:<8} {elapsed * scale:8.2f} s/M tracks {mb * scale:9.1f} MB/M tracks")
+
+    print(f"{n_albums} albums x {args.per_album} tracks")
+    albums, elapsed, mb = measure(lambda: make_albums(n_albums, args.per_album))
+    report("objects", elapsed, mb)
+    batch, elapsed, mb = measure(lambda: TrackBatch.from_albums(albums))
+    report("batch", elapsed, mb)
+
+    # row building on a tenth of the tracks (the dicts of a million rows would dominate the run)
+    sample = albums[:max(1, n_albums // 10)]
+    sample_batch = TrackBatch.from_albums(sample)
+    _, elapsed, mb = measure(lambda: dict_rows(sample))
+    report("dicts", elapsed * 10, mb * 10)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    _, elapsed, mb = measure(lambda: list(sample_batch.rows(range(1, len(sample) + 1), now, now)))
+    report("tuples", elapsed * 10, mb * 10)
+    del batch, sample_batch
+
+    with tempfile.TemporaryDirectory(prefix="taggivm-bench-") as tmp:
+        db_path = Path(tmp) / "tracks.db"
+        init_db(db_path)
+        start = time.perf_counter()
+        MusicRepository(db_path).bulk_ingest(albums, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        close_all()
+        print(f"{'insert':<8} {elapsed * scale:8.2f} s/M tracks {n_tracks / elapsed:12.0f} tracks/s")
+
+if __name__ == "__main__":
+    main()
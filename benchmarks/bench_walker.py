@@ -0,0 +1,94 @@
+"""Benchmark the scandir/thread-pool walker against the original os.walk scan"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from services.walker import walk_library
+
+ALBUM_NAME_PATTERN = re.compile(r"^\d{4} - .+")
+AUDIO_EXTS = ('.mp3', '.flac', '.wav', '.m4a')
+
+def legacy_discover_scan(src_filepath: Path) -> dict:
+    """The os.walk based discover_scan, kept as the baseline"""
+    scan_tree = {}
+    for root, dirs, files in os.walk(src_filepath):
+        root_path = Path(root)
+        if '.scanned' in files:
+            continue
+        if not any(f.lower().endswith(AUDIO_EXTS) for f in files):
+            continue
+        rel_parts = root_path.relative_to(src_filepath).parts
+        if len(rel_parts) != 2:
+            print(f"⚠️ Invalid folder structure: '{root_path}' should be two levels deep (e.g., 'Artist/Album').")
+            continue
+        album_folder = rel_parts[1]
+        if not ALBUM_NAME_PATTERN.match(album_folder):
+            print(f"⚠️  Naming issue: '{album_folder}' does not match 'YYYY - Album Title'")
+            continue
+        scan_tree.setdefault(rel_parts[0], {})[album_folder] = root_path
+    return scan_tree
+
+def make_tree(root: Path, artists: int, albums: int, tracks: int, depth: int) -> None:
+    """Synthetic library: artists x albums x tracks, plus non-audio nested folders `depth` levels deep"""
+    for a in range(artists):
+        artist = root / f"Artist {a:05d}"
+        for b in range(albums):
+            # titles unique library-wide: albums.artist_id is still the 0 placeholder
+            name = f"{1970 + b % 50} - Album {a:05d}-{b:03d}" if b % 10 else f"Album {b:03d} (bad name)"
+            album = artist / name
+            album.mkdir(parents=True)
+            for t in range(tracks):
+                (album / f"{t + 1:02d} - Track {t}.{AUDIO_EXTS[t % len(AUDIO_EXTS)][1:]}").touch()
+            (album / "cover.jpg").touch()
+            nested = album
+            for d in range(depth):
+                nested = nested / f"extras{d}"
+            nested.mkdir(parents=True, exist_ok=True)
+            (nested / "scan.png").touch()
+
+def timed(fn, repeat: int) -> float:
+    """Best wall time of `repeat` runs (warnings silenced)"""
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--artists", type=int, default=500)
+    parser.add_argument("--albums", type=int, default=8)
+    parser.add_argument("--tracks", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=3, help="nested non-audio folders per album")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--path", type=Path, help="benchmark an existing library instead of a synthetic one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="taggivm-bench-") as tmp:
+        root = args.path.resolve() if args.path else Path(tmp)
+        if not args.path:
+            make_tree(root, args.artists, args.albums, args.tracks, args.depth)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = legacy_discover_scan(root)
+        n_albums = sum(len(albums) for albums in expected.values())
+        print(f"library: {root} ({len(expected)} artists, {n_albums} valid albums)")
+
+        baseline = timed(lambda: legacy_discover_scan(root), args.repeat)
+        print(f"{'os.walk (legacy)':<22} {baseline * 1000:9.1f} ms")
+        for workers in args.workers:
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert walk_library(root, workers=workers) == expected, "walker result differs from the legacy scan"
+            elapsed = timed(lambda: walk_library(root, workers=workers), args.repeat)
+            print(f"{f'scandir, {workers} workers':<22} {elapsed * 1000:9.1f} ms   x{baseline / elapsed:.2f}")
+
+if __name__ == "__main__":
+    main()
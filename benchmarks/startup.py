@@ -0,0 +1,121 @@
+"""
+Startup time and import budget of the taggivm CLI.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --importtime
+
+Commands called from cron jobs and hooks pay the interpreter start and the
+imports on every call. `taggivm --help` must not import the application
+packages, `taggivm scan` on an empty library only the scan path: a command
+importing a module outside its budget makes the exit status 1. The same
+commands are timed by the suite (startup:* benchmarks).
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# command -> module prefixes it must not import
+BUDGETS: Dict[Tuple[str, ...], Tuple[str, ...]] = {
+    ('--help',): ('core', 'db', 'services', 'sqlite3', 'asyncio', 'dotenv', 'multiprocessing'),
+    ('scan', '--help'): ('services.fetch', 'services.tag_writer', 'services.dupes', 'asyncio', 'ssl', 'http'),
+    ('scan',): ('services.fetch', 'services.tag_writer', 'services.dupes', 'asyncio', 'ssl', 'http'),
+}
+
+_PROBE = """
+import json, sys, contextlib, io
+from cli import cli
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        cli(sys.argv[2:])
+    except SystemExit:
+        pass
+with open(sys.argv[1], 'w') as f:
+    json.dump(sorted(sys.modules), f)
+"""
+
+def cli_env(db_path: Path, library: Path) -> Dict[str, str]:
+    """Environment running the CLI of this checkout on db_path and library"""
+    src = Path(importlib.util.find_spec('cli').origin).parent.parent
+    pythonpath = os.pathsep.join(filter(None, [str(src), os.environ.get('PYTHONPATH')]))
+    return {**os.environ, 'PYTHONPATH': pythonpath, 'DATABASE_PATH': str(db_path), 'MUSIC_LIBRARY_PATH': str(library)}
+
+def run_cli(args: List[str], env: Dict[str, str], python_args: List[str] = ()) -> subprocess.CompletedProcess:
+    """Run `taggivm args` in a new interpreter"""
+    return subprocess.run([sys.executable, *python_args, '-c', 'from cli import cli; cli()', *args],
+                          env=env, capture_output=True, text=True)
+
+def imported_modules(args: List[str], env: Dict[str, str]) -> List[str]:
+    """Modules loaded by a new interpreter running `taggivm args`"""
+    with tempfile.NamedTemporaryFile(suffix='.json') as out:
+        subprocess.run([sys.executable, '-c', _PROBE, out.name, *args], env=env, check=True, capture_output=True)
+        return json.loads(Path(out.name).read_text())
+
+def over_budget(modules: List[str], forbidden: Tuple[str, ...]) -> List[str]:
+    """Modules equal to or below a forbidden prefix"""
+    return [name for name in modules if any(name == prefix or name.startswith(prefix + '.') for prefix in forbidden)]
+
+def empty_library(tmp: Path) -> Tuple[Path, Path]:
+    """(database, library): an initialized database and an empty library folder"""
+    from db import init_db, close_all
+    library = tmp / "library"
+    library.mkdir()
+    db_path = tmp / "startup.db"
+    init_db(db_path)
+    close_all()
+    return db_path, library
+
+def time_command(args: List[str], env: Dict[str, str], repeat: int) -> float:
+    """Best wall time of `taggivm args` (interpreter start included)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_cli(args, env)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--importtime", action="store_true", help="show the slowest imports of `taggivm --help`")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="taggivm-startup-") as tmp:
+        env = cli_env(*empty_library(Path(tmp)))
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            subprocess.run([sys.executable, '-c', 'pass'], env=env)
+        interpreter = (time.perf_counter() - start) / args.repeat
+
+        print(f"{'command':<20} {'best ms':>9} {'modules':>8}  over budget")
+        for command, forbidden in BUDGETS.items():
+            modules = imported_modules(list(command), env)
+            over = over_budget(modules, forbidden)
+            failed |= bool(over)
+            elapsed = time_command(list(command), env, args.repeat)
+            print(f"{' '.join(command):<20} {elapsed * 1000:9.1f} {len(modules):8}  {', '.join(over) or '-'}")
+        print(f"(bare interpreter: {interpreter * 1000:.1f} ms)")
+
+        if args.importtime:
+            stderr = run_cli(['--help'], env, ['-X', 'importtime']).stderr
+            rows = []
+            for line in stderr.splitlines():
+                if line.startswith('import time:') and '|' in line and 'cumulative' not in line:
+                    _, cumulative, name = line.split('|')
+                    rows.append((int(cumulative), name.rstrip()))
+            print("\nslowest imports of --help (cumulative us):")
+            for cumulative, name in sorted(rows, reverse=True)[:15]:
+                print(f"{cumulative:>10}  {name}")
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
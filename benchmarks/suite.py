@@ -0,0 +1,323 @@
+"""
+Benchmark suite of the scan, ingest, database and CLI startup paths on a synthetic library.
+
+    python -m benchmarks.suite --scale 1k --output before.json
+    python -m benchmarks.suite --scale 1k --output after.json --compare before.json
+
+Every benchmark is timed `--repeat` times (setup excluded) and reported as JSON:
+run metadata (commit, Python, SQLite, machine, library spec) and, per benchmark,
+the run times, min/median and throughput. With --compare, benchmarks slower than
+the baseline by more than --threshold (on the min time) are listed and the exit
+status is 1, so the suite can gate a change.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Any, Optional
+
+from db import init_db, close_all, AlbumRepository, TrackRepository, GenreRepository, StatsRepository
+from services import discover_scan, init_album_DB, stream_scan, incremental_scan
+from services.audio_meta import fill_audio_info
+from .synthetic import SCALES, LibrarySpec, generate_library
+from .startup import cli_env, empty_library, run_cli
+
+BENCHMARKS: Dict[str, Callable[['Context'], Any]] = {}
+
+def benchmark(name: str):
+    """
+    Register a benchmark: fn(ctx) does the untimed setup and returns the timed
+    callable, which returns the number of items it processed (albums, queries...).
+    It can return (prepare, timed) instead: prepare() runs untimed before every
+    run and its result is passed to timed().
+    """
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+class Context:
+    """Library and scratch directory shared by the benchmarks"""
+    def __init__(self, root: Path, tmp: Path, spec: LibrarySpec, workers: int):
+        self.root = root
+        self.tmp = tmp
+        self.spec = spec
+        self.workers = workers
+        self._albums = None
+        self._db = None
+        self._n = 0
+
+    def new_db_path(self) -> Path:
+        self._n += 1
+        return self.tmp / f"bench-{self._n}.db"
+
+    def new_empty_db(self) -> Path:
+        """New initialized database"""
+        db_path = self.new_db_path()
+        init_db(db_path)
+        return db_path
+
+    def albums(self) -> list:
+        """Discovered albums (cached)"""
+        if self._albums is None:
+            self._albums = quiet(lambda: list(discover_scan(self.root, workers=self.workers)))
+        return self._albums
+
+    def ingested_db(self) -> Path:
+        """Database with the library ingested (cached), for the query benchmarks"""
+        if self._db is None:
+            self._db = self.new_empty_db()
+            init_album_DB(self.albums(), self._db)
+        return self._db
+
+def quiet(fn: Callable[[], Any]) -> Any:
+    """Run fn with the scan warnings silenced"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn()
+
+#------------ BENCHMARKS -----------#
+
+@benchmark("discover")
+def bench_discover(ctx: Context):
+    return lambda: len(quiet(lambda: list(discover_scan(ctx.root, workers=ctx.workers))))
+
+@benchmark("discover+headers")
+def bench_headers(ctx: Context):
+    return lambda: len(quiet(lambda: list(fill_audio_info(discover_scan(ctx.root, workers=ctx.workers)))))
+
+@benchmark("init_db")
+def bench_init_db(ctx: Context):
+    """Schema + genre tree + closure table on a new database"""
+    def run():
+        db_path = ctx.new_db_path()
+        init_db(db_path)
+        return len(GenreRepository(db_path).get_genres())
+    return run
+
+@benchmark("ingest")
+def bench_ingest(ctx: Context):
+    """init_album_DB of the discovered albums into a new database (tracks/s)"""
+    albums = ctx.albums()
+
+    def run(db_path: Path):
+        init_album_DB(albums, db_path)
+        return sum(len(album.tracklist) for album in albums)
+    return ctx.new_empty_db, run
+
+@benchmark("stream_scan")
+def bench_stream_scan(ctx: Context):
+    """Discovery and ingest in one pass into a new database, headers not read"""
+    def run(db_path: Path):
+        return quiet(lambda: stream_scan(ctx.root, db_path, workers=ctx.workers, read_headers=False)).albums
+    return ctx.new_empty_db, run
+
+@benchmark("incremental_rescan")
+def bench_incremental(ctx: Context):
+    """Incremental scan of an unchanged library (manifest already built)"""
+    db_path = ctx.new_empty_db()
+    quiet(lambda: incremental_scan(ctx.root, db_path, read_headers=False))
+    return lambda: quiet(lambda: incremental_scan(ctx.root, db_path, read_headers=False)).unchanged
+
+@benchmark("query:album_paths")
+def bench_album_paths(ctx: Context):
+    album_repo = AlbumRepository(ctx.ingested_db())
+    return lambda: len(album_repo.get_album_paths())
+
+@benchmark("query:albums_by_status")
+def bench_albums_by_status(ctx: Context):
+    album_repo = AlbumRepository(ctx.ingested_db())
+    return lambda: len(album_repo.get_albums_by_status('pending'))
+
+@benchmark("query:file_states")
+def bench_file_states(ctx: Context):
+    track_repo = TrackRepository(ctx.ingested_db())
+    return lambda: len(track_repo.get_file_states())
+
+@benchmark("query:album_by_path")
+def bench_album_by_path(ctx: Context):
+    """1000 point lookups by album path"""
+    album_repo = AlbumRepository(ctx.ingested_db())
+    paths = sorted(album_repo.get_album_paths())
+    sample = random.Random(0).choices(paths, k=1000)
+
+    def run():
+        for path in sample:
+            album_repo._fetch_one("SELECT id FROM albums WHERE path = ?", (path,))
+        return len(sample)
+    return run
+
+@benchmark("query:genre_subtree")
+def bench_genre_subtree(ctx: Context):
+    """Subtrees and is_subgenre checks of 200 random genres"""
+    genre_repo = GenreRepository(ctx.ingested_db())
+    genres = genre_repo.get_genres()
+    sample = random.Random(0).choices(genres, k=200)
+
+    def run():
+        for genre in sample:
+            genre_repo.subtree(genre['id'])
+            genre_repo.is_subgenre(genre['name'], 'Rock')
+        return 2 * len(sample)
+    return run
+
+@benchmark("query:stats_summary")
+def bench_stats_summary(ctx: Context):
+    """1000 dashboard reads of the library totals (cache validated by the change counter)"""
+    stats_repo = StatsRepository(ctx.ingested_db())
+
+    def run():
+        for _ in range(1000):
+            stats_repo.summary()
+        return 1000
+    return run
+
+@benchmark("query:stats_browse")
+def bench_stats_browse(ctx: Context):
+    """Artist list, then albums and tracks of 200 random artists, cache cleared"""
+    stats_repo = StatsRepository(ctx.ingested_db())
+    artists = [row['album_artist'] for row in stats_repo.artists()]
+    sample = random.Random(0).choices(artists, k=200)
+
+    def run():
+        StatsRepository.clear_cache()
+        stats_repo.artists(limit=100)
+        for artist in sample:
+            albums = stats_repo.artist_albums(artist)
+            stats_repo.album_tracks(albums[0]['id'])
+        return 1 + 2 * len(sample)
+    return run
+
+@benchmark("startup:help")
+def bench_startup_help(ctx: Context):
+    """`taggivm --help` in a new interpreter"""
+    env = cli_env(*empty_library(Path(tempfile.mkdtemp(dir=ctx.tmp))))
+    return lambda: run_cli(['--help'], env).returncode == 0
+
+@benchmark("startup:scan_empty")
+def bench_startup_scan(ctx: Context):
+    """`taggivm scan` of an empty library in a new interpreter"""
+    env = cli_env(*empty_library(Path(tempfile.mkdtemp(dir=ctx.tmp))))
+    return lambda: run_cli(['scan'], env).returncode == 0
+
+#------------ RUNNER -----------#
+
+def run_benchmark(name: str, ctx: Context, repeat: int) -> Dict[str, Any]:
+    timed = BENCHMARKS[name](ctx)
+    prepare = None
+    if isinstance(timed, tuple):
+        prepare, timed = timed
+    runs, items = [], 0
+    for _ in range(repeat):
+        args = (prepare(),) if prepare else ()
+        start = time.perf_counter()
+        items = timed(*args)
+        runs.append(time.perf_counter() - start)
+    best = min(runs)
+    return {
+        'runs': [round(t, 6) for t in runs],
+        'min': round(best, 6),
+        'median': round(statistics.median(runs), 6),
+        'items': items,
+        'items_per_second': round(items / best, 1) if best else None,
+    }
+
+def metadata(spec: LibrarySpec, scale: Optional[str], repeat: int, workers: int) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scale': scale,
+        'library': spec.__dict__,
+        'repeat': repeat,
+        'workers': workers,
+    }
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print the min times against a baseline run, returning the regressed benchmarks"""
+    regressions = []
+    print(f"\n{'benchmark':<26} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, result in results['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            continue
+        change = result['min'] / old['min'] - 1 if old['min'] else 0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<26} {old['min'] * 1000:8.1f}ms {result['min'] * 1000:8.1f}ms {change:+7.1%}{flag}")
+    if baseline.get('meta', {}).get('library') != results['meta']['library']:
+        print("warning: the baseline ran on a different library, the comparison is not meaningful")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default='1k', help="library size (albums)")
+    parser.add_argument("--artists", type=int, help="override the scale: artists")
+    parser.add_argument("--albums", type=int, help="override the scale: albums per artist")
+    parser.add_argument("--tracks", type=int, help="override the scale: tracks per album")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--library", type=Path, help="directory of the synthetic library (kept and reused, default: temporary)")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8, help="walker threads")
+    parser.add_argument("--output", type=Path, help="write the results as JSON ('-' for stdout)")
+    parser.add_argument("--compare", type=Path, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="slowdown reported as a regression (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    artists, albums, tracks = SCALES[args.scale]
+    custom = any(v is not None for v in (args.artists, args.albums, args.tracks))
+    spec = LibrarySpec(artists=args.artists or artists, albums=args.albums or albums, tracks=args.tracks or tracks, seed=args.seed)
+    log = sys.stderr if args.output == Path('-') else sys.stdout
+
+    with tempfile.TemporaryDirectory(prefix="taggivm-bench-") as tmp:
+        tmp = Path(tmp)
+        root = args.library.resolve() if args.library else tmp / "library"
+        start = time.perf_counter()
+        spec = generate_library(root, spec)
+        print(f"library: {root} ({spec.artists} artists, {spec.valid_albums} valid albums, {spec.files} files), "
+              f"ready in {time.perf_counter() - start:.1f}s", file=log)
+
+        scratch = tmp / "db"
+        scratch.mkdir()
+        ctx = Context(root, scratch, spec, args.workers)
+        results = {'meta': metadata(spec, None if custom else args.scale, args.repeat, args.workers), 'results': {}}
+        for name in args.only or BENCHMARKS:
+            result = run_benchmark(name, ctx, args.repeat)
+            results['results'][name] = result
+            print(f"{name:<26} {result['min'] * 1000:10.1f} ms {result['items_per_second'] or 0:14.0f} items/s", file=log)
+        close_all()
+
+    if args.output == Path('-'):
+        json.dump(results, sys.stdout, indent=2)
+    elif args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        with contextlib.redirect_stdout(log):
+            regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold:.0%}: {', '.join(regressions)}", file=log)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Reproducible synthetic music libraries for the benchmarks.
+
+    Artist 00042/
+        1987 - Album 00042-003/     valid album: tiny but valid audio headers + cover
+            01 - Track 0.flac
+            02 - Track 1.mp3
+            ...
+        Album 004 (no year)/        invalid names (skipped by the scan with a warning)
+        loose track.mp3             audio at the artist level (invalid structure)
+
+The same (artists, albums, tracks, seed) always gives the same tree, so runs on
+different machines or commits are comparable. A `.synthetic.json` manifest at
+the root lets a large library be generated once and reused (see generate_library).
+"""
+import json
+import random
+import struct
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List
+
+from core import AlbumData, TrackData
+
+FORMATS = ('mp3', 'flac', 'wav', 'm4a')
+# (artists, albums per artist, tracks per album) of the named scales
+SCALES = {
+    '1k': (100, 10, 10),
+    '10k': (1000, 10, 10),
+    '100k': (10000, 10, 8),
+}
+MANIFEST = '.synthetic.json'
+# album folder names the scan must reject
+INVALID_NAMES = ('Album {b:03d} (no year)', '{year}-Album {b:03d}', '{short} - Album {b:03d}', 'Album {b:03d} - {year}')
+
+@dataclass
+class LibrarySpec:
+    artists: int
+    albums: int  # per artist
+    tracks: int  # per album
+    invalid_ratio: float = 0.05  # albums with a name not matching 'YYYY - Title'
+    seed: int = 0
+    valid_albums: int = 0  # filled by generate_library
+    files: int = 0  # audio files written
+
+#------------ AUDIO HEADERS -----------#
+
+def _atom(name: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), name) + payload
+
+def _syncsafe(n: int) -> bytes:
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+def flac_bytes(track: int, total: int, seconds: int, rate: int = 44100, padding: int = 1024) -> bytes:
+    """STREAMINFO + VORBIS_COMMENT + PADDING and a frame header"""
+    streaminfo = bytearray(34)
+    struct.pack_into('>HH', streaminfo, 0, 4096, 4096)
+    streaminfo[10:18] = ((rate << 44) | (1 << 41) | (15 << 36) | (seconds * rate)).to_bytes(8, 'big')
+    comments = [f"TRACKNUMBER={track}/{total}".encode(), b"DISCNUMBER=1", f"TITLE=Track {track}".encode()]
+    vorbis = (struct.pack('<I', 7) + b'taggivm' + struct.pack('<I', len(comments))
+              + b''.join(struct.pack('<I', len(c)) + c for c in comments))
+    return (b'fLaC' + bytes([0]) + len(streaminfo).to_bytes(3, 'big') + bytes(streaminfo)
+            + bytes([4]) + len(vorbis).to_bytes(3, 'big') + vorbis
+            + bytes([0x81]) + padding.to_bytes(3, 'big') + bytes(padding) + b'\xff\xf8' + bytes(64))
+
+def mp3_bytes(track: int, total: int, seconds: int) -> bytes:
+    """ID3v2.3 tag (TRCK, TIT2, padding) + MPEG1 layer III frames with a Xing header"""
+    def text_frame(frame_id: str, text: str) -> bytes:
+        data = b'\x03' + text.encode()
+        return frame_id.encode() + struct.pack('>I', len(data)) + b'\x00\x00' + data
+    body = text_frame('TRCK', f'{track}/{total}') + text_frame('TIT2', f'Track {track}') + bytes(256)
+    tag = b'ID3\x03\x00\x00' + _syncsafe(len(body)) + body
+    header = b'\xff\xfb\x90\x64'  # MPEG1 layer III, 128 kbps, 44.1 kHz, stereo
+    first = bytearray(417)
+    first[:4] = header
+    first[36:40] = b'Xing'
+    first[40:48] = struct.pack('>II', 1, seconds * 44100 // 1152)  # frame count
+    frame = bytearray(417)
+    frame[:4] = header
+    return tag + bytes(first) + bytes(frame) * 4
+
+def wav_bytes(track: int, seconds: int, rate: int = 8000) -> bytes:
+    """fmt + data chunk header (data size declared, payload truncated) + LIST/INFO ITRK"""
+    fmt = struct.pack('<HHIIHH', 1, 1, rate, rate * 2, 2, 16)
+    number = str(track).encode() + b'\x00'
+    info = b'INFO' + b'ITRK' + struct.pack('<I', len(number)) + number + (b'\x00' if len(number) % 2 else b'')
+    body = (b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+            + b'LIST' + struct.pack('<I', len(info)) + info
+            + b'data' + struct.pack('<I', rate * 2 * seconds) + bytes(256))
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+def m4a_bytes(track: int, total: int, seconds: int) -> bytes:
+    """ftyp + mdat + moov (mvhd, udta/meta/ilst with trkn and disk)"""
+    mvhd = _atom(b'mvhd', bytes(12) + struct.pack('>II', 1000, seconds * 1000) + bytes(80))
+    trkn = _atom(b'trkn', _atom(b'data', struct.pack('>II', 0, 0) + struct.pack('>HHHH', 0, track, total, 0)))
+    disk = _atom(b'disk', _atom(b'data', struct.pack('>II', 0, 0) + struct.pack('>HHH', 0, 1, 1)))
+    meta = _atom(b'meta', bytes(4) + _atom(b'hdlr', bytes(8) + b'mdirappl' + bytes(9)) + _atom(b'ilst', trkn + disk))
+    moov = _atom(b'moov', mvhd + _atom(b'udta', meta))
+    return _atom(b'ftyp', b'M4A \x00\x00\x00\x00M4A ') + _atom(b'mdat', bytes(256)) + moov
+
+def audio_bytes(fmt: str, track: int, total: int, seconds: int) -> bytes:
+    if fmt == 'flac':
+        return flac_bytes(track, total, seconds)
+    if fmt == 'mp3':
+        return mp3_bytes(track, total, seconds)
+    if fmt == 'wav':
+        return wav_bytes(track, seconds)
+    return m4a_bytes(track, total, seconds)
+
+#------------ LIBRARIES -----------#
+
+def generate_library(root: Path, spec: LibrarySpec) -> LibrarySpec:
+    """
+    Write a synthetic library under root (reused as is if its manifest matches the spec).
+
+    Returns:
+        LibrarySpec: the spec with the counts of valid albums and audio files
+    """
+    manifest = root / MANIFEST
+    wanted = {k: v for k, v in asdict(spec).items() if k not in ('valid_albums', 'files')}
+    if manifest.exists():
+        stored = json.loads(manifest.read_text())
+        if {k: stored.get(k) for k in wanted} == wanted:
+            return LibrarySpec(**stored)
+
+    rng = random.Random(spec.seed)
+    headers = {}  # identical files share their bytes
+    valid = files = 0
+    for a in range(spec.artists):
+        artist = root / f"Artist {a:05d}"
+        artist.mkdir(parents=True, exist_ok=True)
+        for b in range(spec.albums):
+            year = 1960 + rng.randrange(60)
+            if rng.random() < spec.invalid_ratio:
+                name = rng.choice(INVALID_NAMES).format(b=b, year=year, short=year % 100)
+            else:
+                # titles unique library-wide: albums.artist_id is still the 0 placeholder
+                name = f"{year} - Album {a:05d}-{b:03d}"
+                valid += 1
+            album = artist / name
+            album.mkdir(exist_ok=True)
+            for t in range(spec.tracks):
+                fmt = FORMATS[(a + b + t) % len(FORMATS)]
+                seconds = 120 + rng.randrange(300)
+                key = (fmt, t + 1, spec.tracks, seconds)
+                if key not in headers:
+                    headers[key] = audio_bytes(fmt, t + 1, spec.tracks, seconds)
+                (album / f"{t + 1:02d} - Track {t}.{fmt}").write_bytes(headers[key])
+                files += 1
+            (album / "cover.jpg").write_bytes(b'\xff\xd8\xff\xd9')
+        if rng.random() < spec.invalid_ratio:
+            (artist / "loose track.mp3").write_bytes(mp3_bytes(1, 1, 180))
+
+    spec = LibrarySpec(**{**wanted, 'valid_albums': valid, 'files': files})
+    manifest.write_text(json.dumps(asdict(spec)))
+    return spec
+
+def make_albums(albums: int, tracks: int) -> List[AlbumData]:
+    """Synthetic scanned albums, in memory (no files needed)"""
+    result = []
+    for a in range(albums):
+        path = f"/music/Artist {a // 10:05d}/{1970 + a % 50} - Album {a:06d}"
+        result.append(AlbumData(
+            title=f"Album {a:06d}",
+            release_year=str(1970 + a % 50),
+            album_artist=f"Artist {a // 10:05d}",
+            total_tracks=tracks,
+            path=path,
+            tracklist=[TrackData(title=f"{t + 1:02d} - Track {t}", path=f"{path}/{t + 1:02d} - Track {t}.{FORMATS[t % 4]}", format=FORMATS[t % 4]) for t in range(tracks)],
+        ))
+    return result
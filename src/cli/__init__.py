@@ -0,0 +1,178 @@
+"""
+Taggivm command line.
+
+Only click is imported at startup: every subcommand lives in its own module
+(imported with its services and database layer when it is dispatched) and the
+configuration is resolved on first use, so `taggivm --help` and the commands
+run from cron or hooks do not pay for the whole package.
+"""
+import click
+from importlib import import_module
+from pathlib import Path
+from typing import List
+
+SKIP_INIT_DB_COMMANDS = {"init", "help", "version"}
+
+# subcommand -> (module defining it, one-line help listed by `taggivm --help` without importing it)
+COMMANDS = {
+    "scan": ("cli.scan", "Scan the music library to initialize new album on the database"),
+    "watch": ("cli.watch", "Watch the music library and ingest new albums as soon as they are complete"),
+    "reconcile": ("cli.reconcile", "Apply renamed, moved, added and removed albums and tracks, keeping the fetched metadata"),
+    "search": ("cli.search", "Search artists, albums and tracks by name and by the metadata text of the sources (prefix, accents ignored)"),
+    "stats": ("cli.stats", "Show library statistics and browse artists, albums and tracks"),
+    "export": ("cli.export", "Export albums, tracks and final metadata to JSONL or CSV files, streaming with constant memory"),
+    "dupes": ("cli.dupes", "Find duplicate tracks (same audio, whatever the tags) and store their fingerprints"),
+    "meta_fetch": ("cli.fetch", "Search metadata of the pending albums on the metadata sources"),
+    "aggregate": ("cli.aggregate", "Merge the fetched metadata of the sources into the final metadata"),
+    "write_tags": ("cli.write_tags", "Write the aggregated metadata into the audio files"),
+    "init": ("cli.init", "Initialize the album database."),
+}
+
+class LazyGroup(click.Group):
+    """Group importing the module of a subcommand only when the subcommand is dispatched"""
+    def list_commands(self, ctx: click.Context):
+        return sorted({*super().list_commands(ctx), *COMMANDS})
+
+    def get_command(self, ctx: click.Context, cmd_name: str):
+        command = super().get_command(ctx, cmd_name)
+        if command is None and cmd_name in COMMANDS:
+            module = import_module(COMMANDS[cmd_name][0])
+            command = getattr(module, cmd_name)
+            self.add_command(command, cmd_name)
+        return command
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter):
+        """Command list from the COMMANDS table (the modules of the lazy commands stay unimported)"""
+        names = self.list_commands(ctx)
+        if not names:
+            return
+        limit = formatter.width - 6 - max(len(name) for name in names)
+        rows = []
+        for name in names:
+            if name in COMMANDS and name not in self.commands:
+                rows.append((name, click.utils.make_default_short_help(COMMANDS[name][1], limit)))
+            else:
+                command = self.commands[name]
+                if not command.hidden:
+                    rows.append((name, command.get_short_help_str(limit)))
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
+
+@click.group(cls=LazyGroup)
+@click.option("--profile", is_flag=True, help="Print stage timers, SQL statement counters and peak memory when the command ends.")
+@click.option("--profile-output", type=click.Path(dir_okay=False, path_type=Path), help="Write the profile to a file: Prometheus textfile if it ends in .prom, JSON otherwise.")
+@click.option("--cprofile", type=click.Path(dir_okay=False, path_type=Path), help="Dump the cProfile stats of the command (main thread) to a file, see `python -m pstats`.")
+@click.pass_context
+def cli(ctx: click.Context, profile: bool, profile_output: Path, cprofile: Path):
+    """Taggivm CLI - A tool for tagging your music collection."""
+    from core import MUSIC_LIBRARY_PATHS, DB_PATH
+
+    # context object
+    ctx.ensure_object(dict)
+    ctx.obj["music_directories"] = list(MUSIC_LIBRARY_PATHS)
+    ctx.obj["music_directory"] = MUSIC_LIBRARY_PATHS[0]
+    ctx.obj["db_path"] = Path(DB_PATH)
+
+    # before the database checks: init is profiled too
+    if profile or profile_output:
+        _start_profiling(ctx, profile, profile_output)
+    if cprofile:
+        _start_cprofile(ctx, cprofile)
+
+    if ctx.invoked_subcommand in SKIP_INIT_DB_COMMANDS:
+        return
+
+    if not DB_PATH.exists():
+        click.echo(click.style("Error:", fg="red", bold=True) + f" Database file '{DB_PATH}' not found. Run `taggivm init` first.")
+        exit(1)
+    _migrate_db(DB_PATH)
+
+def _migrate_db(db_path: Path):
+    """Upgrade the schema of a database created by an older version, exit with an error if it cannot"""
+    import sqlite3
+    from db import migrate_db, SCHEMA_VERSION
+
+    try:
+        version = migrate_db(db_path)
+    except (sqlite3.Error, ValueError) as e:
+        click.echo(click.style("Error:", fg="red", bold=True) + f" Cannot upgrade the schema of database file '{db_path}': {e}")
+        exit(1)
+    if version is not None:
+        click.echo(f"Database schema upgraded from version {version} to {SCHEMA_VERSION}.", err=True)
+
+def _start_profiling(ctx: click.Context, show: bool, output: Path):
+    """Collect the profile of the subcommand, reported when the context closes"""
+    from core import profiler
+
+    def report():
+        if show:
+            click.echo(profiler.summary(), err=True)
+        if output:
+            output.write_text(profiler.to_prometheus() if output.suffix == ".prom" else profiler.to_json())
+            click.echo(f"Profile written to {output}", err=True)
+
+    profiler.enable()
+    ctx.call_on_close(report)
+    # closed before report() runs (the context exits its resources in reverse order)
+    ctx.with_resource(profiler.stage(f"command.{ctx.invoked_subcommand}"))
+
+def _start_cprofile(ctx: click.Context, output: Path):
+    """Run the subcommand under cProfile, dumping the stats when the context closes"""
+    import cProfile
+
+    def dump():
+        prof.disable()
+        prof.dump_stats(output)
+        click.echo(f"cProfile stats written to {output}", err=True)
+
+    prof = cProfile.Profile()
+    ctx.call_on_close(dump)
+    prof.enable()
+
+def check_roots(roots: List[Path]) -> None:
+    """Exit with an error if a library root does not exist"""
+    for root in roots:
+        if not root.exists():
+            click.echo(click.style("Error:", fg="red", bold=True) + f" Music directory '{root}' does not exist. Please check the env variable " + click.style("MUSIC_LIBRARY_PATH", fg="yellow", bold=True))
+            exit(1)
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+## TODO
+##################### Decorator @require_db per comandi che usano il DB
+# import functools
+# def require_db(f):
+#     @functools.wraps(f)
+#     @click.pass_context
+#     def wrapper(ctx, *args, **kwargs):
+#         db_path = Path(DB_PATH)
+
+#         if not db_path.exists():
+#             click.echo(click.style("Error:", fg="red", bold=True) + f" Database '{db_path}' not found. Run `taggivm init` first.")
+#             ctx.exit(1)
+
+#         # (Opzionale) Verifica struttura minima del DB
+#         try:
+#             conn = sqlite3.connect(db_path)
+#             conn.execute("SELECT 1 FROM albums LIMIT 1")  # verifica tabella 'albums'
+#         except sqlite3.DatabaseError as e:
+#             click.echo(click.style("Invalid database:", fg="red") + f" {e}")
+#             ctx.exit(1)
+#         finally:
+#             conn.close()
+
+#         return ctx.invoke(f, *args, **kwargs)
+#     return wrapper
+
+# @cli.command()
+# @require_db
+# @click.pass_context
+# def scan(ctx):
+#     """Scan your music library."""
+#     ...
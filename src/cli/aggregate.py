@@ -0,0 +1,21 @@
+import click
+
+from services import aggregate_metadata
+
+@click.command()
+@click.option("--full", is_flag=True, help="Recompute every entity, not only the ones whose source metadata changed.")
+@click.pass_context
+def aggregate(ctx: click.Context, full: bool):
+    """Merge the fetched metadata of the sources into the final metadata"""
+    db_path = ctx.obj["db_path"]
+
+    report = aggregate_metadata(db_path, full=full)
+    if not any(report.changed.values()):
+        click.echo("Nothing to aggregate: no source metadata changed since the last run.")
+        return
+    for entity in ('artist', 'album', 'track'):
+        line = f"  {entity}s: {report.updated.get(entity, 0)} aggregated"
+        if report.removed.get(entity):
+            line += f", {report.removed[entity]} removed (no source metadata left)"
+        click.echo(line)
+    click.echo(click.style("Aggregation completed", fg="green") + f" in {report.elapsed:.2f}s.")
@@ -0,0 +1,24 @@
+import click
+
+from services import find_duplicates, DEFAULT_HASH_WORKERS
+from . import format_bytes
+
+@click.command()
+@click.option("--workers", "-w", type=click.IntRange(min=1), default=DEFAULT_HASH_WORKERS, show_default=True, help="Threads reading and hashing files.")
+@click.pass_context
+def dupes(ctx: click.Context, workers: int):
+    """Find duplicate tracks (same audio, whatever the tags) and store their fingerprints"""
+    db_path = ctx.obj["db_path"]
+
+    report = find_duplicates(db_path, workers=workers)
+    for paths in report.groups:
+        click.echo(click.style(f"{len(paths)} copies:", fg="yellow", bold=True))
+        for path in paths:
+            click.echo(f"  {path}")
+    click.echo(
+        f"{len(report.groups)} duplicate groups in {report.files} tracks "
+        f"({report.size_candidates} same size, {report.sample_candidates} same sample, {report.hashed} hashed now). "
+        f"Read {format_bytes(report.bytes_read)} of {format_bytes(report.bytes_total)} of audio."
+    )
+    if report.missing:
+        click.echo(click.style("Warning:", fg="yellow", bold=True) + f" {report.missing} track files not found.")
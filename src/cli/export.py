@@ -0,0 +1,27 @@
+from pathlib import Path
+import click
+
+from db import EXPORT_TABLES, DEFAULT_ARRAYSIZE
+from services import export_library, EXPORT_FORMATS, COMPRESSIONS
+from . import format_bytes
+
+@click.command()
+@click.argument("out_dir", type=click.Path(file_okay=False, path_type=Path))
+@click.option("--table", "-t", "tables", type=click.Choice(EXPORT_TABLES), multiple=True, help="Table to export (repeatable, default: all).")
+@click.option("--format", "fmt", type=click.Choice(EXPORT_FORMATS), default='jsonl', show_default=True, help="One JSON object per line, or CSV with a header row.")
+@click.option("--compress", "compression", type=click.Choice(COMPRESSIONS), default='none', show_default=True, help="Compress the files (zstd needs the 'zstandard' package).")
+@click.option("--arraysize", type=click.IntRange(min=1), default=DEFAULT_ARRAYSIZE, show_default=True, help="Rows fetched and written at a time.")
+@click.pass_context
+def export(ctx: click.Context, out_dir: Path, tables: tuple, fmt: str, compression: str, arraysize: int):
+    """Export albums, tracks and final metadata to JSONL or CSV files, streaming with constant memory"""
+    def on_table(table: str, rows: int):
+        click.echo(f"  {table}: {rows} rows")
+
+    try:
+        report = export_library(ctx.obj["db_path"], out_dir, tables=tables or None, fmt=fmt,
+                                compression=compression, arraysize=arraysize, progress=on_table)
+    except ValueError as e:
+        click.echo(click.style("Error:", fg="red", bold=True) + f" {e}")
+        exit(1)
+    click.echo(click.style("Export completed", fg="green")
+               + f": {len(report.files)} files, {format_bytes(report.bytes_written)} in '{out_dir}', {report.elapsed:.2f}s.")
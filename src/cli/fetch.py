@@ -0,0 +1,64 @@
+import click
+
+from core import FetchStats
+from services import FetchEngine, ADAPTERS, DEFAULT_RETRIES, DEFAULT_LEASE
+from . import format_bytes
+
+@click.command("meta_fetch")
+@click.option("--source", "-s", "sources", multiple=True, type=click.Choice(sorted(ADAPTERS), case_sensitive=False), help="Sources to query (repeatable, default: all the available ones).")
+@click.option("--limit", "-n", type=click.IntRange(min=1), default=None, help="Max queries fetched in this run.")
+@click.option("--enqueue/--no-enqueue", default=True, show_default=True, help="Queue a query per pending album before fetching.")
+@click.option("--retries", type=click.IntRange(min=0), default=DEFAULT_RETRIES, show_default=True, help="Retries of failed requests (connection errors, 429, 5xx).")
+@click.option("--refetch", is_flag=True, help="Fetch again the queries already done (responses come from the cache when fresh).")
+@click.option("--cache/--no-cache", "use_cache", default=True, show_default=True, help="Use the response cache.")
+@click.option("--refresh", is_flag=True, help="Revalidate cached responses even when still fresh.")
+@click.option("--retry-dead", is_flag=True, help="Give the dead-lettered queries a new round of attempts.")
+@click.option("--lease", type=click.FloatRange(min=10), default=DEFAULT_LEASE, show_default=True, help="Seconds a claimed query is reserved to this process (renewed while running).")
+@click.option("--match-threshold", type=click.FloatRange(0, 1), default=None, help="Minimum confidence of a search result matched to an album (default: 0.75).")
+@click.pass_context
+def meta_fetch(ctx: click.Context, sources: tuple, limit: int, enqueue: bool, retries: int, refetch: bool, use_cache: bool, refresh: bool, retry_dead: bool, lease: float,
+               match_threshold: float):
+    """Search metadata of the pending albums on the metadata sources"""
+    db_path = ctx.obj["db_path"]
+
+    names = [name for name in ADAPTERS if not sources or name.lower() in {s.lower() for s in sources}]
+    adapters = [ADAPTERS[name](match_threshold=match_threshold) for name in names]
+    for adapter in adapters:
+        ok, reason = adapter.available()
+        if not ok:
+            click.echo(click.style("Warning:", fg="yellow", bold=True) + f" {adapter.name} skipped: {reason}.")
+
+    engine = FetchEngine(db_path, adapters=adapters, retries=retries, progress=_fetch_progress, use_cache=use_cache, refresh=refresh, lease_seconds=lease)
+    if not engine.enabled():
+        click.echo(click.style("Error:", fg="red", bold=True) + " No metadata source available.")
+        exit(1)
+    if enqueue:
+        queued = engine.enqueue_albums()
+        click.echo(f"{queued} new queries queued on {', '.join(engine.enabled())}.")
+    if refetch:
+        click.echo(f"{engine.requeue()} queries queued again.")
+    if retry_dead:
+        click.echo(f"{engine.requeue(statuses=('dead',))} dead queries queued again.")
+
+    stats = engine.run(limit=limit)
+    click.echo()
+    click.echo(
+        f"Fetch completed: {stats.done} done, {stats.errors} errors, {stats.requeued} to retry of {stats.queries} queries "
+        f"({stats.requests} requests, {stats.coalesced} coalesced, {stats.retries} retries, "
+        f"{stats.connections} connections), {stats.elapsed:.1f}s."
+    )
+    if stats.lost:
+        click.echo(click.style("Warning:", fg="yellow", bold=True) + f" {stats.lost} results dropped: their lease expired and another worker took them.")
+    queue = engine.queue_status()
+    click.echo("Queue: " + ", ".join(f"{queue.get(status, 0)} {status}" for status in ('pending', 'in_progress', 'done', 'error', 'dead')) + ".")
+    if engine.cache is not None:
+        cache = engine.cache.stats
+        click.echo(
+            f"Cache: {cache.hits} hits ({cache.memory_hits} memory, {cache.disk_hits} disk, {cache.revalidated} revalidated), "
+            f"{cache.misses} misses, {format_bytes(cache.bytes_saved)} not downloaded; "
+            f"{cache.stored} responses stored ({format_bytes(cache.bytes_raw)} -> {format_bytes(cache.bytes_stored)})."
+        )
+
+def _fetch_progress(stats: FetchStats):
+    """Single-line fetch progress"""
+    click.echo(f"\r  {stats.done + stats.errors + stats.requeued}/{stats.queries} queries, {stats.requests} requests", nl=False)
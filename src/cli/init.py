@@ -0,0 +1,35 @@
+import click
+
+from db import init_db
+
+@click.command()
+@click.pass_context
+def init(ctx: click.Context):
+    """Initialize the album database."""
+    db_path = ctx.obj["db_path"]
+
+    if db_path.exists():
+        confirm = click.confirm(
+            click.style(f"Database file '{db_path}' already exists. Do you want to re-initialize it (this will delete all data)?", fg="yellow", bold=True),
+            default=False
+        )
+        if not confirm:
+            click.echo(click.style("Initialization cancelled.", fg="red"))
+            exit(0)
+        try:
+            db_path.unlink()
+            click.echo(click.style(f"Deleted existing database: {db_path}", fg="yellow"))
+        except Exception as e:
+            click.echo(click.style("Error deleting database: ", fg="red", bold=True) + str(e))
+            exit(1)
+
+    try:
+        click.echo(f"Initializing database: {db_path}")
+        init_db(db_path)
+        click.echo(click.style("Database initialization completed.", fg="green"))
+    except Exception as e:
+        # cleanup file if created
+        if db_path.exists():
+            db_path.unlink()
+        click.echo(click.style("Error during initialization: ", fg="red", bold=True) + str(e))
+        exit(1)
@@ -0,0 +1,46 @@
+import click
+
+from services import reconcile_library, ReconcileError, DEFAULT_WORKERS, DEFAULT_HASH_WORKERS
+from . import check_roots
+
+# moved/added/removed albums listed one per line, up to this count
+MAX_LISTED = 50
+
+@click.command()
+@click.option("--dry-run", is_flag=True, help="Show what would change without writing the database.")
+@click.option("--workers", "-w", type=click.IntRange(min=1), default=DEFAULT_WORKERS, show_default=True, help="Threads listing the library.")
+@click.option("--hash-workers", type=click.IntRange(min=1), default=DEFAULT_HASH_WORKERS, show_default=True, help="Threads hashing files to match them by content.")
+@click.option("--headers/--no-headers", default=True, show_default=True, help="Read duration, track and disc numbers of the new tracks from the audio file headers.")
+@click.option("--force", is_flag=True, help="Apply even if a library directory holds no album (removes its albums).")
+@click.pass_context
+def reconcile(ctx: click.Context, dry_run: bool, workers: int, hash_workers: int, headers: bool, force: bool):
+    """Apply renamed, moved, added and removed albums and tracks, keeping the fetched metadata"""
+    roots = ctx.obj["music_directories"]
+    db_path = ctx.obj["db_path"]
+    check_roots(roots)
+
+    try:
+        report = reconcile_library(roots, db_path, workers=workers, hash_workers=hash_workers,
+                                   read_headers=headers, dry_run=dry_run, force=force)
+    except ReconcileError as e:
+        click.echo(click.style("Error:", fg="red", bold=True) + f" {e}")
+        exit(1)
+
+    listed = [("~ ", "yellow", f"{old} -> {new}") for old, new in report.albums_moved]
+    listed += [("+ ", "green", path) for path in report.albums_added]
+    listed += [("- ", "red", path) for path in report.albums_removed]
+    for mark, color, line in listed[:MAX_LISTED]:
+        click.echo(click.style("  " + mark, fg=color, bold=True) + line)
+    if len(listed) > MAX_LISTED:
+        click.echo(f"  ... and {len(listed) - MAX_LISTED} more")
+    if report.conflicts:
+        click.echo(click.style("Warning:", fg="yellow", bold=True) + f" {len(report.conflicts)} new album folders not added, "
+                   "their title is taken by another album (e.g. " + report.conflicts[0] + ")")
+
+    matched = ", ".join(f"{count} by {rule}" for rule, count in report.matched_by.items())
+    click.echo(
+        f"{'Dry run' if dry_run else 'Reconcile complete'}: "
+        f"{len(report.albums_moved)} albums renamed or moved, {len(report.albums_added)} added, {len(report.albums_removed)} removed; "
+        f"{report.tracks_moved} tracks moved{f' ({matched})' if matched else ''}, {report.tracks_added} added, "
+        f"{report.tracks_removed} removed, {report.tracks_unchanged} unchanged ({report.files_hashed} files hashed)."
+    )
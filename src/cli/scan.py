@@ -0,0 +1,83 @@
+import click
+
+from pathlib import Path
+
+from core import IngestStats
+from db import DEFAULT_BATCH_SIZE
+from services import stream_scan, sharded_scan, incremental_scan, DEFAULT_WORKERS
+from . import check_roots
+
+@click.command()
+@click.option("--incremental", "-i", is_flag=True, help="Only descend into artist/album folders changed since the last incremental scan.")
+@click.option("--check-files", is_flag=True, help="Incremental scan: also stat the audio files of unchanged album folders (finds files edited in place).")
+@click.option("--workers", "-w", type=click.IntRange(min=1), default=DEFAULT_WORKERS, show_default=True, help="Threads listing artist folders in parallel.")
+@click.option("--batch-size", type=click.IntRange(min=1), default=DEFAULT_BATCH_SIZE, show_default=True, help="Albums written per database transaction.")
+@click.option("--headers/--no-headers", default=True, show_default=True, help="Read duration, track and disc numbers from the audio file headers.")
+@click.option("--processes", "-p", type=click.IntRange(min=0), default=None, help="Processes reading the audio headers, per directory (default: CPU count / directories, 0: no pool).")
+@click.pass_context
+#@click.argument("path", type=click.Path(exists=True))
+def scan(ctx: click.Context, incremental: bool, check_files: bool, workers: int, batch_size: int, headers: bool, processes: int):
+    """Scan the music library to initialize new album on the database"""
+    roots = ctx.obj["music_directories"]
+    db_path = ctx.obj["db_path"]
+    check_roots(roots)
+
+    if incremental:
+        for music_dir in roots:
+            click.echo(f"Incremental scan of directory: {music_dir}")
+            report = incremental_scan(music_dir, db_path, read_headers=headers, processes=processes, check_files=check_files)
+            for label, color, paths in (("+", "green", report.added), ("~", "yellow", report.changed), ("-", "red", report.removed),
+                                        ("!", "magenta", report.conflicts)):
+                for path in paths:
+                    click.echo(click.style(f"  {label} ", fg=color, bold=True) + str(path))
+            click.echo(
+                f"Scan completed: {len(report.added)} added, {len(report.changed)} changed, "
+                f"{len(report.removed)} removed, "
+                + (f"{len(report.conflicts)} title conflicts, " if report.conflicts else "")
+                + f"{report.unchanged} unchanged"
+                + (f", {report.in_database} already in the database (now in the manifest)" if report.in_database else "")
+                + f" ({report.dirs_listed} folders listed, {report.dirs_checked} checked)."
+            )
+            _warn_conflicts(report.conflicts)
+        return
+
+    if len(roots) > 1:
+        click.echo(f"Scanning {len(roots)} directories in parallel: {', '.join(map(str, roots))}")
+        stats = sharded_scan(roots, db_path, workers=workers, batch_size=batch_size, read_headers=headers,
+                             processes=processes, on_root=_root_done)
+    else:
+        click.echo(f"Scanning directory: {roots[0]}")
+        stats = stream_scan(roots[0], db_path, workers=workers, batch_size=batch_size, progress=_scan_progress,
+                            read_headers=headers, processes=processes)
+        click.echo()
+    click.echo(
+        f"Scan completed: {stats.albums} new albums ({stats.tracks} tracks) initialized, "
+        f"{stats.skipped} already in the database, "
+        + (f"{len(stats.conflicts)} title conflicts, " if stats.conflicts else "")
+        + f"{stats.elapsed:.1f}s."
+    )
+    _warn_conflicts(stats.conflicts)
+
+def _warn_conflicts(conflicts: list):
+    """Warning for the albums left out because their title is taken by another album"""
+    if conflicts:
+        click.echo(click.style("Warning:", fg="yellow", bold=True) + f" {len(conflicts)} albums not initialized, "
+                   f"their title is taken by another album (e.g. {conflicts[0]})")
+
+def _root_done(root: Path, stats: IngestStats):
+    """One line per merged root of a parallel scan"""
+    click.echo(
+        click.style("  + ", fg="green", bold=True) + f"{root}: {stats.scanned} albums found, {stats.albums} initialized "
+        f"({stats.tracks} tracks), {stats.skipped} already in the database, "
+        + (f"{len(stats.conflicts)} title conflicts, " if stats.conflicts else "")
+        + f"scanned in {stats.elapsed:.1f}s"
+    )
+
+def _scan_progress(stats: IngestStats):
+    """Single-line scan progress with rates"""
+    rate = stats.scanned / stats.elapsed if stats.elapsed else 0
+    click.echo(
+        f"\r  {stats.scanned} albums found ({rate:.0f}/s), "
+        f"{stats.albums} initialized, {stats.tracks} tracks written",
+        nl=False
+    )
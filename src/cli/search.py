@@ -0,0 +1,34 @@
+import time
+import click
+
+from db import SearchRepository, SEARCH_KINDS, DEFAULT_SEARCH_LIMIT
+
+KIND_COLORS = {'artist': 'magenta', 'album': 'cyan', 'track': 'green'}
+
+@click.command()
+@click.argument("text", nargs=-1, required=True)
+@click.option("--kind", "-k", "kinds", type=click.Choice(SEARCH_KINDS), multiple=True, help="Search only artists, albums or tracks (repeatable).")
+@click.option("--limit", "-n", type=click.IntRange(min=1), default=DEFAULT_SEARCH_LIMIT, show_default=True, help="Max number of results.")
+@click.option("--paths", is_flag=True, help="Show the path of every album and track found.")
+@click.option("--rebuild", is_flag=True, help="Rebuild the search indexes before searching.")
+@click.pass_context
+def search(ctx: click.Context, text: tuple, kinds: tuple, limit: int, paths: bool, rebuild: bool):
+    """Search artists, albums and tracks by name and by the metadata text of the sources (prefix, accents ignored)"""
+    search_repo = SearchRepository(ctx.obj["db_path"])
+    if rebuild:
+        search_repo.rebuild()
+
+    start = time.perf_counter()
+    results = search_repo.search(' '.join(text), kinds=kinds or None, limit=limit)
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        line = click.style(f"{result['kind']:<7}", fg=KIND_COLORS[result['kind']], bold=True) + f"{result['name']}"
+        if result['context']:
+            line += click.style(f" - {result['context']}", dim=True)
+        if result['matched'] == 'metadata':
+            line += click.style(" (metadata)", fg="yellow")
+        click.echo(line)
+        if paths and result['path']:
+            click.echo(f"       {result['path']}")
+    click.echo(f"{len(results)} results in {elapsed * 1000:.1f} ms.")
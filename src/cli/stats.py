@@ -0,0 +1,70 @@
+import time
+import click
+
+from db import StatsRepository, ARTIST_ORDERS
+
+def format_duration(duration_ms: int) -> str:
+    minutes, seconds = divmod((duration_ms or 0) // 1000, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+@click.command()
+@click.option("--artists", "list_artists", is_flag=True, help="List the album artists with their totals.")
+@click.option("--artist", "album_artist", help="List the albums of an album artist (folder name).")
+@click.option("--album", "album_id", type=int, help="List the tracks of an album (ID).")
+@click.option("--sort", type=click.Choice(list(ARTIST_ORDERS)), default='name', show_default=True, help="Order of the artist list.")
+@click.option("--limit", "-n", type=click.IntRange(min=1), default=None, help="Max number of artists listed.")
+@click.option("--offset", type=click.IntRange(min=0), default=0, help="Artists skipped, for paging.")
+@click.option("--rebuild", is_flag=True, help="Recompute the statistics from the library first.")
+@click.pass_context
+def stats(ctx: click.Context, list_artists: bool, album_artist: str, album_id: int, sort: str, limit: int, offset: int, rebuild: bool):
+    """Show library statistics and browse artists, albums and tracks"""
+    stats_repo = StatsRepository(ctx.obj["db_path"])
+    if rebuild:
+        stats_repo.rebuild()
+
+    start = time.perf_counter()
+    if album_id is not None:
+        tracks = stats_repo.album_tracks(album_id)
+        if not tracks:
+            click.echo(click.style("Error:", fg="red", bold=True) + f" no album with ID {album_id} (or no tracks).")
+            return
+        for track in tracks:
+            click.echo(f"{track['disc_number'] or 1}-{track['track_number']:02d}  {track['title']}  "
+                       + click.style(f"{format_duration(track['duration_ms'])} {track['format']}", dim=True))
+        click.echo(f"{len(tracks)} tracks.")
+
+    elif album_artist is not None:
+        albums = stats_repo.artist_albums(album_artist)
+        if not albums:
+            click.echo(click.style("Error:", fg="red", bold=True) + f" no album of '{album_artist}'.")
+            return
+        for album in albums:
+            line = click.style(f"{album['id']:>6}  ", dim=True) + f"{album['release_year']} - {album['title']}"
+            line += click.style(f"  {album['tracks']} tracks, {format_duration(album['duration_ms'])}, {album['metadata_status']}", dim=True)
+            if album['genres']:
+                line += click.style(f"  {album['genres']}", fg="cyan")
+            click.echo(line)
+        click.echo(f"{len(albums)} albums.")
+
+    elif list_artists:
+        artists = stats_repo.artists(order=sort, limit=limit, offset=offset)
+        for artist in artists:
+            click.echo(f"{artist['album_artist']}" + click.style(
+                f"  {artist['albums']} albums, {artist['tracks']} tracks, {format_duration(artist['duration_ms'])}", dim=True))
+        click.echo(f"{len(artists)} artists.")
+
+    else:
+        summary = stats_repo.summary()
+        click.echo(click.style("Library", bold=True))
+        click.echo(f"  Artists:   {summary.artists}")
+        click.echo(f"  Albums:    {summary.albums}")
+        click.echo(f"  Tracks:    {summary.tracks}")
+        click.echo(f"  Duration:  {format_duration(summary.duration_ms)}")
+        click.echo(f"  Genres:    {summary.albums_with_genres} albums with genres, {summary.albums_without_genres} without")
+        if summary.albums_by_status:
+            click.echo("  Status:    " + ", ".join(f"{status} {n}" for status, n in sorted(summary.albums_by_status.items())))
+        if summary.tracks_by_format:
+            click.echo("  Formats:   " + ", ".join(f"{fmt} {n}" for fmt, n in sorted(summary.tracks_by_format.items(), key=lambda item: -item[1])))
+
+    click.echo(click.style(f"Read in {(time.perf_counter() - start) * 1000:.1f} ms.", dim=True))
@@ -0,0 +1,39 @@
+import click
+
+from core import AlbumData
+from services import Watcher, DEFAULT_QUIET, DEFAULT_POLL_INTERVAL
+from . import check_roots
+
+@click.command()
+@click.option("--quiet", "-q", type=click.FloatRange(min=0), default=DEFAULT_QUIET, show_default=True, help="Seconds without file changes before an album folder is ingested.")
+@click.option("--polling", is_flag=True, help="Poll the folders instead of using inotify (e.g. network mounts).")
+@click.option("--interval", type=click.FloatRange(min=0.1), default=DEFAULT_POLL_INTERVAL, show_default=True, help="Seconds between two polls (polling only).")
+@click.option("--headers/--no-headers", default=True, show_default=True, help="Read duration, track and disc numbers from the audio file headers.")
+@click.pass_context
+def watch(ctx: click.Context, quiet: float, polling: bool, interval: float, headers: bool):
+    """Watch the music library and ingest new albums as soon as they are complete"""
+    roots = ctx.obj["music_directories"]
+    db_path = ctx.obj["db_path"]
+    check_roots(roots)
+
+    watcher = Watcher(roots, db_path, quiet=quiet, polling=polling, poll_interval=interval, read_headers=headers,
+                      on_album=_album_done, on_warning=click.echo)
+    click.echo(f"Watching {', '.join(map(str, roots))} ({watcher.stats.backend}), Ctrl+C to stop.")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        click.echo()
+    stats = watcher.stats
+    click.echo(
+        f"Watch stopped: {stats.albums} new albums initialized, {stats.completed} completed with late tracks "
+        f"({stats.tracks} tracks written), {stats.skipped} already in the database, "
+        f"{stats.rejected} invalid folder names"
+        + (f", {stats.conflicts} title conflicts." if stats.conflicts else ".")
+    )
+
+def _album_done(album: AlbumData, ingested: bool):
+    """One line per quiescent album folder"""
+    if ingested:
+        click.echo(click.style("  + ", fg="green", bold=True) + f"{album.path} ({len(album.tracklist)} tracks)")
+    else:
+        click.echo(click.style("  = ", fg="yellow", bold=True) + f"{album.path} (already in the database)")
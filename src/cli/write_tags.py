@@ -0,0 +1,34 @@
+import click
+
+from core import WritebackReport
+from services import write_back, DEFAULT_WRITE_WORKERS, DEFAULT_PADDING
+from . import format_bytes
+
+@click.command("write_tags")
+@click.option("--workers", "-w", type=click.IntRange(min=1), default=DEFAULT_WRITE_WORKERS, show_default=True, help="Albums written at the same time.")
+@click.option("--padding", type=click.IntRange(min=0), default=DEFAULT_PADDING, show_default=True, help="Padding bytes reserved in the files that must be rewritten.")
+@click.option("--dry-run", is_flag=True, help="Only show what would be written.")
+@click.pass_context
+def write_tags(ctx: click.Context, workers: int, padding: int, dry_run: bool):
+    """Write the aggregated metadata into the audio files"""
+    db_path = ctx.obj["db_path"]
+
+    report = write_back(db_path, workers=workers, padding=padding, dry_run=dry_run, progress=_write_progress)
+    click.echo()
+    changed = report.in_place + report.rewritten
+    click.echo(
+        f"{'Would write' if dry_run else 'Wrote'} {changed} of {report.files} files "
+        f"({report.in_place} in place, {report.rewritten} rewritten, {report.unchanged} already up to date, "
+        f"{report.unsupported} unsupported), {report.elapsed:.1f}s."
+    )
+    if changed:
+        click.echo(f"{format_bytes(report.bytes_written)} written instead of {format_bytes(report.bytes_rewrite)} of full rewrites.")
+    if report.missing:
+        click.echo(click.style("Warning:", fg="yellow", bold=True) + f" {report.missing} track files not found.")
+    for error in report.errors:
+        click.echo(click.style("Error:", fg="red", bold=True) + f" {error}")
+
+def _write_progress(report: WritebackReport):
+    """Single-line tag writing progress"""
+    done = report.unchanged + report.in_place + report.rewritten + report.unsupported + report.missing + len(report.errors)
+    click.echo(f"\r  {done}/{report.files} files", nl=False)
@@ -1,7 +1,23 @@
-from .models import AlbumData, TrackData
-from .config import MUSIC_LIBRARY_PATH, DB_PATH
+from importlib import import_module
 
-__all__ = [
-    'AlbumData', 'TrackData', 
-    'MUSIC_LIBRARY_PATH', 'DB_PATH'
-           ]
\ No newline at end of file
+# exported name -> submodule defining it, imported on first access (keeps the CLI startup light)
+_EXPORTS = {
+    'AlbumData': '.models', 'TrackData': '.models', 'TrackBatch': '.models', 'ScanReport': '.models', 'IngestStats': '.models', 'DupesReport': '.models',
+    'FetchStats': '.models', 'CacheStats': '.models', 'AggregateReport': '.models', 'WritebackReport': '.models', 'WatchStats': '.models',
+    'ReconcileReport': '.models', 'AlbumMatch': '.models', 'LibraryStats': '.models', 'ExportReport': '.models',
+    'MUSIC_LIBRARY_PATH': '.config', 'MUSIC_LIBRARY_PATHS': '.config', 'DB_PATH': '.config',
+    'profiler': '.profiling',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted({*globals(), *_EXPORTS})
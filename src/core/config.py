@@ -1,5 +1,5 @@
 import os
-from dotenv import load_dotenv
+from functools import cache
 from pathlib import Path
 
 # global variables
@@ -7,10 +7,35 @@ DEFAULT_MUSIC_DIR = Path.home() / "music"
 DEFAULT_DB_PATH = Path.home() / ".local" / "share" / "taggivm" / "music.db" # linux
 DEFAULT_DB_PATH = Path.home() / "Library" / "Application Support" / "taggivm" / "music.db" # mac
 
-# load .env file
-load_dotenv()
+# settings resolved on first access (after loading the .env file)
+_SETTINGS = {
+    'MUSIC_LIBRARY_PATH': ("MUSIC_LIBRARY_PATH", DEFAULT_MUSIC_DIR),
+    'DB_PATH': ("DATABASE_PATH", DEFAULT_DB_PATH),
+}
 
-# access environment variables (forced absolute)
-MUSIC_LIBRARY_PATH = Path(os.getenv("MUSIC_LIBRARY_PATH", DEFAULT_MUSIC_DIR)).expanduser().resolve()
-DB_PATH = Path(os.getenv("DATABASE_PATH", DEFAULT_DB_PATH)).expanduser().resolve()
+@cache
+def load_env() -> None:
+    """Load the .env file once (environment variables already set win)"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+def __getattr__(name: str):
+    if name == 'MUSIC_LIBRARY_PATHS':
+        # several library roots (e.g. lossless, lossy, archive mounts) separated by os.pathsep
+        load_env()
+        variable, default = _SETTINGS['MUSIC_LIBRARY_PATH']
+        value = [Path(path).expanduser().resolve() for path in os.getenv(variable, str(default)).split(os.pathsep) if path]
+        value = list(dict.fromkeys(value)) or [Path(default).expanduser().resolve()]
+    elif name == 'MUSIC_LIBRARY_PATH':
+        # the first root
+        value = __getattr__('MUSIC_LIBRARY_PATHS')[0]
+    elif name in _SETTINGS:
+        load_env()
+        variable, default = _SETTINGS[name]
+        # access environment variables (forced absolute)
+        value = Path(os.getenv(variable, default)).expanduser().resolve()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
 # DEBUG = os.getenv("DEBUG", "false").lower() == "true"
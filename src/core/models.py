@@ -1,10 +1,14 @@
-from dataclasses import dataclass
+import sys
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence
 
 # Data Models / Schemas
 
 # TODO(OPTIONAL): add dictionary conversion
 # no flags, only data
-@dataclass
+@dataclass(slots=True)
 class TrackData:
     title: str = ''
     path: str = ''
@@ -14,7 +18,7 @@ class TrackData:
     disc_number: int = 0
     format: str = ''
 
-@dataclass
+@dataclass(slots=True)
 class AlbumData:
     title: str = ''
     release_year: str = ''
@@ -23,12 +27,212 @@ class AlbumData:
     path: str = ''
     tracklist: list[TrackData] = None
 
+class TrackBatch:
+    """
+    Tracks of many albums stored by column: one array or list per field, the album of
+    every track as its index in the batch, repeated strings (format, fingerprint) interned.
+    A million tracks take a fraction of the memory of as many TrackData, and the rows are
+    built as tuples and bound to multi-row INSERTs (see TrackRepository.insert_batch).
+    """
+    __slots__ = ('album_index', 'title', 'path', 'duration_ms', 'fingerprint', 'track_number', 'disc_number', 'format')
+
+    def __init__(self):
+        self.album_index = array('l') # position of the track's album in the batch
+        self.title: list[str] = []
+        self.path: list[str] = []
+        self.duration_ms = array('q')
+        self.fingerprint: list[str] = []
+        self.track_number = array('l')
+        self.disc_number = array('l')
+        self.format: list[str] = []
+
+    @classmethod
+    def from_albums(cls, albums: Iterable[AlbumData]) -> 'TrackBatch':
+        """Batch of the tracklists of the albums (album index = position in albums)"""
+        batch = cls()
+        for index, album in enumerate(albums):
+            batch.add_album(index, album.tracklist or ())
+        return batch
+
+    def add_album(self, album_index: int, tracklist: Iterable[TrackData]) -> None:
+        """Append the tracks of an album, column by column"""
+        tracks = list(tracklist)
+        self.album_index.extend([album_index] * len(tracks))
+        self.title.extend([track.title for track in tracks])
+        self.path.extend([track.path for track in tracks])
+        self.duration_ms.extend([int(track.duration_ms or 0) for track in tracks])
+        self.fingerprint.extend([sys.intern(track.fingerprint) for track in tracks])
+        self.track_number.extend([track.track_number or 0 for track in tracks])
+        self.disc_number.extend([track.disc_number or 0 for track in tracks])
+        self.format.extend([sys.intern(track.format) for track in tracks])
+
+    def append(self, album_index: int, title: str, path: str, format: str, duration_ms: int = 0,
+               fingerprint: str = '', track_number: int = 0, disc_number: int = 0) -> None:
+        self.album_index.append(album_index)
+        self.title.append(title)
+        self.path.append(path)
+        self.duration_ms.append(int(duration_ms or 0))
+        self.fingerprint.append(sys.intern(fingerprint))
+        self.track_number.append(track_number or 0)
+        self.disc_number.append(disc_number or 0)
+        self.format.append(sys.intern(format))
+
+    def __len__(self) -> int:
+        return len(self.path)
+
+    def __iter__(self) -> Iterator[TrackData]:
+        """Tracks as TrackData (built on the fly)"""
+        for i in range(len(self)):
+            yield TrackData(self.title[i], self.path[i], self.duration_ms[i], self.fingerprint[i],
+                            self.track_number[i], self.disc_number[i], self.format[i])
+
+    def rows(self, album_ids: Sequence[Optional[int]], *extra) -> Iterator[tuple]:
+        """
+        Row tuples (album_id, title, path, duration_ms, fingerprint, track_number, disc_number, format, *extra),
+        album_id from album_ids[album index]; tracks of albums with a None ID are skipped.
+        """
+        for index, title, path, duration_ms, fingerprint, track_number, disc_number, format in zip(
+                self.album_index, self.title, self.path, self.duration_ms, self.fingerprint,
+                self.track_number, self.disc_number, self.format):
+            album_id = album_ids[index]
+            if album_id is not None:
+                yield (album_id, title, path, duration_ms, fingerprint, track_number, disc_number, format, *extra)
+
+@dataclass
+class ScanReport:
+    added: list[Path] = field(default_factory=list)
+    changed: list[Path] = field(default_factory=list)
+    removed: list[Path] = field(default_factory=list)
+    conflicts: list[Path] = field(default_factory=list) # new albums not written: title taken by another album
+    unchanged: int = 0
+    in_database: int = 0 # albums new to the manifest but already in the database (e.g. from a full scan)
+    dirs_listed: int = 0 # readdir calls
+    dirs_checked: int = 0 # stat-only checks
+
+@dataclass
+class DupesReport:
+    groups: list[list[str]] = field(default_factory=list) # paths of identical tracks
+    files: int = 0 # tracks checked
+    missing: int = 0 # tracks whose file is gone
+    size_candidates: int = 0 # tracks sharing the audio size with another one
+    sample_candidates: int = 0 # tracks sharing also the head/tail sample
+    hashed: int = 0 # full hashes computed in this run
+    bytes_total: int = 0 # audio bytes of the library
+    bytes_read: int = 0 # audio bytes read in this run
+
+@dataclass
+class IngestStats:
+    scanned: int = 0 # albums found on disk
+    albums: int = 0 # albums written to the database
+    tracks: int = 0 # tracks written to the database
+    skipped: int = 0 # albums already in the database
+    conflicts: list[str] = field(default_factory=list) # albums not written: title taken by another album (UNIQUE title, artist_id)
+    elapsed: float = 0 # seconds
+
+@dataclass
+class FetchStats:
+    queries: int = 0 # api_queries claimed
+    done: int = 0
+    errors: int = 0 # permanent failures
+    requeued: int = 0 # transient failures, claimable again later (or dead-lettered)
+    lost: int = 0 # results dropped: lease expired and query claimed by another worker
+    requests: int = 0 # HTTP requests sent (retries included)
+    coalesced: int = 0 # requests served by an identical in-flight or recent one
+    retries: int = 0
+    connections: int = 0 # TCP/TLS connections opened
+    elapsed: float = 0 # seconds
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0 # fresh responses served by the in-process tier
+    disk_hits: int = 0 # fresh responses served by the database tier
+    revalidated: int = 0 # stale responses confirmed by a 304
+    misses: int = 0 # requests sent without a usable cached response
+    stored: int = 0 # responses written to the cache
+    bytes_saved: int = 0 # response bytes not downloaded thanks to the cache
+    bytes_raw: int = 0 # uncompressed bytes of the stored responses
+    bytes_stored: int = 0 # compressed bytes of the stored responses
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits + self.revalidated
+
+@dataclass
+class AggregateReport:
+    changed: dict[str, int] = field(default_factory=dict) # entities in the change log, by type
+    updated: dict[str, int] = field(default_factory=dict) # final rows written, by type
+    removed: dict[str, int] = field(default_factory=dict) # final rows deleted (no source metadata left), by type
+    elapsed: float = 0 # seconds
+
+@dataclass
+class WritebackReport:
+    files: int = 0 # tracks with aggregated metadata
+    unchanged: int = 0 # tags already matching: not written
+    in_place: int = 0 # tags written over the old ones (padding reused)
+    rewritten: int = 0 # files rewritten through a temporary file
+    unsupported: int = 0 # formats or layouts not written (e.g. WAV, ID3v2.2)
+    missing: int = 0 # track files not found
+    errors: list[str] = field(default_factory=list) # 'path: error' of the failed writes
+    bytes_written: int = 0 # bytes actually written
+    bytes_rewrite: int = 0 # bytes a full rewrite of the changed files would have written
+    elapsed: float = 0 # seconds
+
+@dataclass
+class WatchStats:
+    backend: str = '' # 'inotify' or 'polling'
+    events: int = 0 # album folders touched (before debouncing)
+    albums: int = 0 # albums written to the database
+    tracks: int = 0 # tracks written to the database
+    skipped: int = 0 # quiescent albums already in the database
+    rejected: int = 0 # quiescent folders not matching 'YYYY - Album'
+    completed: int = 0 # albums of the database that got late tracks (landed after their ingest)
+    conflicts: int = 0 # quiescent albums not written: title taken by another album
+
+@dataclass(slots=True)
+class AlbumMatch:
+    index: int # position of the matched candidate in the album's candidate list (in the pool for match_pool)
+    confidence: float # weighted similarity in [0, 1]
+
+@dataclass
+class LibraryStats:
+    albums: int = 0
+    tracks: int = 0
+    artists: int = 0 # album artists (folder names)
+    duration_ms: int = 0 # total of the known track durations
+    albums_with_genres: int = 0 # albums whose aggregated metadata has genres
+    albums_by_status: dict[str, int] = field(default_factory=dict) # metadata_status -> albums
+    tracks_by_format: dict[str, int] = field(default_factory=dict) # format -> tracks
+    version: int = 0 # library change counter the numbers were read at
+
+    @property
+    def albums_without_genres(self) -> int:
+        return self.albums - self.albums_with_genres
+
+@dataclass
+class ExportReport:
+    rows: dict[str, int] = field(default_factory=dict) # rows written, by exported table
+    files: list[str] = field(default_factory=list) # paths of the written files
+    bytes_written: int = 0 # size of the files on disk (compressed)
+    elapsed: float = 0 # seconds
+
+@dataclass
+class ReconcileReport:
+    albums_moved: list[tuple[str, str]] = field(default_factory=list) # (old path, new path) of renamed/moved albums
+    albums_added: list[str] = field(default_factory=list)
+    albums_removed: list[str] = field(default_factory=list)
+    conflicts: list[str] = field(default_factory=list) # new album folders not added: title taken by another album (e.g. of another root)
+    tracks_moved: int = 0 # tracks kept (same ID) at a new path
+    tracks_added: int = 0
+    tracks_removed: int = 0
+    tracks_unchanged: int = 0
+    matched_by: dict[str, int] = field(default_factory=dict) # moved tracks by matching rule (inode, content, name)
+    files_hashed: int = 0 # payload hashes computed to match by content
+    applied: bool = False # False on dry run
+
 
 
 # ###  Business Logic / Domain Services
-# def is_subgenre(child: str, parent: str) -> bool:
-#     """Check if child is a subgenre of parent"""
-#     pass
+# is_subgenre(child, parent): see db.GenreRepository.is_subgenre (genre_closure table)
 
 
 # ###  Value Objects / Enums
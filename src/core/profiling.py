@@ -0,0 +1,322 @@
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Any, Iterable, Iterator, Optional, TypeVar
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+T = TypeVar('T')
+
+# statement text shown in the summary table
+SQL_WIDTH = 72
+# rows shown per section of the summary table
+TOP_STATEMENTS = 15
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    wall: float = 0.0 # seconds
+    cpu: float = 0.0 # process CPU seconds (every thread)
+
+@dataclass
+class SqlStats:
+    calls: int = 0
+    time: float = 0.0 # seconds in execute and fetch
+    rows: int = 0 # rows changed or fetched
+
+@dataclass
+class CounterStats:
+    calls: int = 0
+    rows: int = 0 # items processed
+    bytes: int = 0
+
+class Profiler:
+    """
+    Process-wide collector of stage timers, SQL statement counters and item/byte counters.
+
+    Disabled by default: stage() and count() then return right away and the database
+    connections are opened without instrumentation, so the hot paths pay nothing.
+    Every update takes a lock, the stages and counters can be hit from any thread.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self.stages: Dict[str, StageStats] = {}
+        self.sql: Dict[str, SqlStats] = {}
+        self.counters: Dict[str, CounterStats] = {}
+        self._normalized: Dict[str, str] = {}
+
+    def enable(self) -> None:
+        """Start collecting (the counters start from zero)"""
+        self.reset()
+        self.enabled = True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._started = time.perf_counter()
+            self._cpu_started = time.process_time()
+            self.stages.clear()
+            self.sql.clear()
+            self.counters.clear()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a block: wall time and process CPU time, summed over the calls of the same stage"""
+        if not self.enabled:
+            yield
+            return
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            with self._lock:
+                stats = self.stages.get(name)
+                if stats is None:
+                    stats = self.stages[name] = StageStats()
+                stats.calls += 1
+                stats.wall += wall
+                stats.cpu += cpu
+
+    def timed_iter(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """
+        Iterate items timing only the time spent producing them (a stage call per item),
+        e.g. the discovery side of a producer/consumer pipeline.
+        """
+        if not self.enabled:
+            yield from items
+            return
+        iterator = iter(items)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, rows: int = 0, bytes: int = 0) -> None:
+        """Add processed items and bytes to a counter"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.counters.get(name)
+            if stats is None:
+                stats = self.counters[name] = CounterStats()
+            stats.calls += 1
+            stats.rows += rows
+            stats.bytes += bytes
+
+    def record_sql(self, statement: str, elapsed: float, rows: int = 0, calls: int = 1) -> None:
+        """Add the time and rows of a statement (grouped by normalized text)"""
+        key = self._normalized.get(statement)
+        if key is None:
+            key = self._normalized.setdefault(statement, normalize_sql(statement))
+        with self._lock:
+            stats = self.sql.get(key)
+            if stats is None:
+                stats = self.sql[key] = SqlStats()
+            stats.calls += calls
+            stats.time += elapsed
+            stats.rows += rows
+
+    def peak_rss(self) -> Dict[str, Optional[int]]:
+        """Peak resident set size in bytes of this process and of its (waited) children"""
+        if resource is None:
+            return {'self': None, 'children': None}
+        # ru_maxrss is in KiB on Linux, in bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return {
+            'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+        }
+
+    #------------ EXPORT -----------#
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Snapshot of everything collected, JSON serializable"""
+        with self._lock:
+            stages = {name: vars(stats).copy() for name, stats in self.stages.items()}
+            sql = [{'statement': statement, **vars(stats)} for statement, stats in self.sql.items()]
+            counters = {name: vars(stats).copy() for name, stats in self.counters.items()}
+        sql.sort(key=lambda entry: -entry['time'])
+        return {
+            'wall': time.perf_counter() - self._started,
+            'cpu': time.process_time() - self._cpu_started,
+            'peak_rss': self.peak_rss(),
+            'stages': stages,
+            'sql': sql,
+            'sql_totals': {
+                'calls': sum(entry['calls'] for entry in sql),
+                'time': sum(entry['time'] for entry in sql),
+                'rows': sum(entry['rows'] for entry in sql),
+            },
+            'counters': counters,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self, prefix: str = 'taggivm') -> str:
+        """Prometheus text exposition format (e.g. for the node_exporter textfile collector)"""
+        data = self.to_dict()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: Iterable[tuple]):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape_label(str(val))}"' for key, val in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+        metric('run_wall_seconds', 'gauge', 'Wall time of the profiled run.', [({}, round(data['wall'], 6))])
+        metric('run_cpu_seconds', 'gauge', 'Process CPU time of the profiled run.', [({}, round(data['cpu'], 6))])
+        rss = data['peak_rss']
+        metric('peak_rss_bytes', 'gauge', 'Peak resident set size.',
+               [({'process': process}, value) for process, value in rss.items() if value is not None])
+        stages = data['stages'].items()
+        metric('stage_calls_total', 'counter', 'Calls of a timed stage.', [({'stage': name}, s['calls']) for name, s in stages])
+        metric('stage_wall_seconds_total', 'counter', 'Wall time of a stage.', [({'stage': name}, round(s['wall'], 6)) for name, s in stages])
+        metric('stage_cpu_seconds_total', 'counter', 'Process CPU time during a stage.', [({'stage': name}, round(s['cpu'], 6)) for name, s in stages])
+        metric('sql_calls_total', 'counter', 'Executions of a SQL statement.', [({'statement': s['statement']}, s['calls']) for s in data['sql']])
+        metric('sql_seconds_total', 'counter', 'Time in a SQL statement (execute and fetch).', [({'statement': s['statement']}, round(s['time'], 6)) for s in data['sql']])
+        metric('sql_rows_total', 'counter', 'Rows changed or fetched by a SQL statement.', [({'statement': s['statement']}, s['rows']) for s in data['sql']])
+        counters = data['counters'].items()
+        metric('items_total', 'counter', 'Items processed.', [({'counter': name}, c['rows']) for name, c in counters])
+        metric('bytes_total', 'counter', 'Bytes processed.', [({'counter': name}, c['bytes']) for name, c in counters])
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, top: int = TOP_STATEMENTS) -> str:
+        """Human readable tables: stages, counters, the slowest SQL statements"""
+        data = self.to_dict()
+        lines = [f"Profile: {data['wall']:.3f}s wall, {data['cpu']:.3f}s CPU, peak RSS {_format_rss(data['peak_rss'])}"]
+
+        if data['stages']:
+            lines.append("")
+            lines.append(f"{'stage':<32} {'calls':>8} {'wall s':>10} {'cpu s':>10}")
+            for name, s in sorted(data['stages'].items(), key=lambda item: -item[1]['wall']):
+                lines.append(f"{name:<32} {s['calls']:>8} {s['wall']:>10.3f} {s['cpu']:>10.3f}")
+
+        if data['counters']:
+            lines.append("")
+            lines.append(f"{'counter':<32} {'items':>12} {'bytes':>14}")
+            for name, c in sorted(data['counters'].items()):
+                lines.append(f"{name:<32} {c['rows']:>12} {c['bytes']:>14}")
+
+        totals = data['sql_totals']
+        if totals['calls']:
+            lines.append("")
+            lines.append(f"SQL: {totals['calls']} statements, {totals['time']:.3f}s, {totals['rows']} rows "
+                         f"({len(data['sql'])} distinct, slowest {min(top, len(data['sql']))} below)")
+            lines.append(f"{'calls':>8} {'total ms':>10} {'avg us':>9} {'rows':>10}  statement")
+            for s in data['sql'][:top]:
+                statement = s['statement'] if len(s['statement']) <= SQL_WIDTH else s['statement'][:SQL_WIDTH - 3] + '...'
+                lines.append(f"{s['calls']:>8} {s['time'] * 1000:>10.1f} {s['time'] / s['calls'] * 1e6:>9.0f} {s['rows']:>10}  {statement}")
+        return '\n'.join(lines)
+
+
+profiler = Profiler()
+
+#------------ SQL INSTRUMENTATION -----------#
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor timing execute and fetch calls into the profiler, under the statement it ran"""
+    _statement = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._statement = sql
+            profiler.record_sql(sql, time.perf_counter() - start, max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._statement = sql
+            profiler.record_sql(sql, time.perf_counter() - start, max(self.rowcount, 0))
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0)
+            raise
+        self._fetched(start, 1)
+        return row
+
+    def _fetched(self, start: float, rows: int) -> None:
+        if self._statement is not None:
+            profiler.record_sql(self._statement, time.perf_counter() - start, rows, calls=0)
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose statements (and their fetches) are recorded by the profiler"""
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connection_factory() -> type:
+    """sqlite3.connect factory: instrumented connections while the profiler is enabled"""
+    return ProfiledConnection if profiler.enabled else sqlite3.Connection
+
+#------------ HELPERS -----------#
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDERS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROW_LISTS = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+")
+_SAVEPOINTS = re.compile(r"\b(SAVEPOINT|RELEASE|ROLLBACK TO) sp_\d+")
+
+def normalize_sql(statement: str) -> str:
+    """One line per statement shape: IN lists and multi-row VALUES of any length become '(?...)'"""
+    text = _WHITESPACE.sub(' ', statement).strip()
+    text = _PLACEHOLDERS.sub('(?...)', text)
+    text = _ROW_LISTS.sub('(?...), ...', text)
+    return _SAVEPOINTS.sub(r'\1 sp_N', text)
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_rss(rss: Dict[str, Optional[int]]) -> str:
+    if rss['self'] is None:
+        return 'n/a'
+    text = f"{rss['self'] / 2**20:.1f} MiB"
+    if rss['children']:
+        text += f" (children {rss['children'] / 2**20:.1f} MiB)"
+    return text
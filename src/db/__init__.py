@@ -1,9 +1,30 @@
-from .db_init import init_db
+from .db_init import init_db, migrate_db, update_genre_tree, SCHEMA_VERSION
+from .connection import ConnectionManager, PragmaProfile, DEFAULT_PRAGMAS, BULK_PRAGMAS, get_manager, close_all
 from .track_rep import AlbumRepository, TrackRepository
-from .music_rep import MusicRepository
+from .music_rep import MusicRepository, DEFAULT_BATCH_SIZE
+from .scan_rep import ScanStateRepository
+from .genre_rep import GenreRepository
+from .query_rep import QueryRepository, make_worker_id, DEFAULT_MAX_ATTEMPTS
+from .cache_rep import CacheRepository
+from .aggregate_rep import AggregationRepository
+from .reconcile_rep import ReconcileRepository
+from .search_rep import SearchRepository, SEARCH_KINDS, DEFAULT_SEARCH_LIMIT
+from .shard_rep import ShardRepository
+from .stats_rep import StatsRepository, STATS_CACHE_SIZE, ARTIST_ORDERS
+from .export_rep import ExportRepository, EXPORT_TABLES
+from .base_rep import DEFAULT_ARRAYSIZE, ROW_TYPES
 
 __all__ = [
-    'init_db',
+    'init_db', 'migrate_db', 'update_genre_tree', 'SCHEMA_VERSION',
+    'ConnectionManager', 'PragmaProfile', 'DEFAULT_PRAGMAS', 'BULK_PRAGMAS', 'get_manager', 'close_all',
     'AlbumRepository', 'TrackRepository',
-    'MusicRepository'
+    'MusicRepository', 'DEFAULT_BATCH_SIZE',
+    'ScanStateRepository',
+    'GenreRepository',
+    'QueryRepository', 'make_worker_id', 'DEFAULT_MAX_ATTEMPTS', 'CacheRepository',
+    'AggregationRepository', 'ReconcileRepository',
+    'SearchRepository', 'SEARCH_KINDS', 'DEFAULT_SEARCH_LIMIT',
+    'ShardRepository',
+    'StatsRepository', 'STATS_CACHE_SIZE', 'ARTIST_ORDERS',
+    'ExportRepository', 'EXPORT_TABLES', 'DEFAULT_ARRAYSIZE', 'ROW_TYPES'
            ]
\ No newline at end of file
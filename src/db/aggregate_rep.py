@@ -0,0 +1,194 @@
+from typing import Dict
+from core import profiler
+from .base_rep import BaseRepository
+
+# weight of a genre tag by role (times the source reliability + 1)
+ROLE_WEIGHTS = {'main': 1.0, 'secondary': 0.5, 'style': 1.0, 'influence': 0.25}
+# genres (and styles) kept per album, by score
+MAX_GENRES = 5
+
+# entities of each type whose source metadata changed: snapshot of the change log
+_SNAPSHOT = (
+    """
+    CREATE TEMP TABLE IF NOT EXISTS agg_dirty (
+        entity_type TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        PRIMARY KEY (entity_type, entity_id)
+    ) WITHOUT ROWID
+    """,
+    "DELETE FROM temp.agg_dirty",
+    "INSERT INTO temp.agg_dirty SELECT entity_type, entity_id FROM metadata_changes",
+    "DELETE FROM metadata_changes",
+)
+
+# source rows of the dirty entities ranked by source reliability (rank 1 = most reliable, then newest)
+_RANKED = (
+    "DROP TABLE IF EXISTS temp.agg_{entity}_src",
+    """
+    CREATE TEMP TABLE agg_{entity}_src AS
+    SELECT m.*, s.reliability_score AS reliability,
+        ROW_NUMBER() OVER (PARTITION BY m.{entity}_id ORDER BY s.reliability_score DESC, m.updated_at DESC, m.id DESC) AS source_rank
+    FROM {entity}_metadata m
+    JOIN api_queries q ON q.id = m.query_id
+    JOIN sources s ON s.id = q.source_id
+    WHERE m.{entity}_id IN (SELECT entity_id FROM temp.agg_dirty WHERE entity_type = '{entity}')
+    """,
+    "CREATE INDEX temp.idx_agg_{entity}_src ON agg_{entity}_src ({entity}_id, source_rank)",
+)
+
+def _best(entity: str, expression: str) -> str:
+    """Value of the most reliable source giving a non-null value for a field"""
+    return f"""(
+        SELECT {expression} FROM temp.agg_{entity}_src r
+        WHERE r.{entity}_id = e.id AND {expression} IS NOT NULL
+        ORDER BY r.source_rank LIMIT 1
+    )"""
+
+_ROLE_WEIGHT = "CASE g.role " + " ".join(f"WHEN '{role}' THEN {weight}" for role, weight in ROLE_WEIGHTS.items()) + " ELSE 0 END"
+
+# genre scores of the dirty albums: sum over sources of (reliability + 1) * role weight, by genre name
+_ALBUM_GENRES = (
+    "DROP TABLE IF EXISTS temp.agg_album_genres",
+    f"""
+    CREATE TEMP TABLE agg_album_genres AS
+    SELECT r.album_id, gn.name, g.role = 'style' AS is_style, SUM((r.reliability + 1) * {_ROLE_WEIGHT}) AS score
+    FROM album_genres_metadata g
+    JOIN temp.agg_album_src r ON r.id = g.metadata_id
+    JOIN genres gn ON gn.id = g.genre_id
+    GROUP BY r.album_id, gn.name, is_style
+    """,
+    "CREATE INDEX temp.idx_agg_album_genres ON agg_album_genres (album_id, is_style, score)",
+)
+
+def _ranked_genres(is_style: int) -> str:
+    return f"""(
+        SELECT group_concat(name, '; ') FROM (
+            SELECT name FROM temp.agg_album_genres
+            WHERE album_id = e.id AND is_style = {is_style}
+            ORDER BY score DESC, name LIMIT {MAX_GENRES}
+        )
+    )"""
+
+_YEAR = "CASE WHEN r.release_date GLOB '[0-9][0-9][0-9][0-9]*' THEN CAST(substr(r.release_date, 1, 4) AS INTEGER) END"
+_TRACK_NUMBER = "CASE WHEN r.track_number GLOB '[0-9]*' THEN CAST(r.track_number AS INTEGER) END"
+
+def _artist_name(artist_id: str) -> str:
+    """Name of a resolved artist: the 'Unknown Artist' placeholder (id 0) is not a name"""
+    return f"""(
+        SELECT COALESCE(fr.name, ar.name) FROM artists ar
+        LEFT JOIN final_artists_metadata fr ON fr.artist_id = ar.id
+        WHERE ar.id = {artist_id} AND ar.id <> 0
+    )"""
+
+_UPSERT = {
+    'artist': f"""
+        INSERT INTO final_artists_metadata (name, country, metadata_status, artist_id)
+        SELECT
+            COALESCE({_best('artist', 'r.artist_name')}, e.name),
+            COALESCE({_best('artist', 'r.residence_place')}, {_best('artist', 'r.birth_place')}),
+            'aggregated', e.id
+        FROM artists e
+        WHERE e.id IN (SELECT artist_id FROM temp.agg_artist_src)
+        ON CONFLICT (artist_id) DO UPDATE SET
+            name = excluded.name, country = excluded.country, metadata_status = excluded.metadata_status
+    """,
+    'album': f"""
+        INSERT INTO final_albums_metadata (title, year, genres, styles, metadata_status, album_artist, album_artist_id, album_id)
+        SELECT
+            COALESCE({_best('album', 'COALESCE(r.album_title, r.title)')}, e.title),
+            COALESCE({_best('album', _YEAR)}, e.release_year),
+            {_ranked_genres(0)},
+            {_ranked_genres(1)},
+            'aggregated',
+            COALESCE({_best('album', "NULLIF(r.album_artist, '')")}, {_artist_name('e.artist_id')}, e.album_artist),
+            NULLIF(e.artist_id, 0), e.id
+        FROM albums e
+        WHERE e.id IN (SELECT album_id FROM temp.agg_album_src)
+        ON CONFLICT (album_id) DO UPDATE SET
+            title = excluded.title, year = excluded.year, genres = excluded.genres, styles = excluded.styles,
+            metadata_status = excluded.metadata_status, album_artist = excluded.album_artist, album_artist_id = excluded.album_artist_id
+    """,
+    'track': f"""
+        INSERT INTO final_tracks_metadata (title, track_number, metadata_status, album_id, artist, track_artist_id, track_id)
+        SELECT
+            COALESCE({_best('track', 'r.title')}, e.title),
+            COALESCE({_best('track', _TRACK_NUMBER)}, e.track_number),
+            'aggregated', e.album_id,
+            COALESCE({_best('track', "NULLIF(r.artist, '')")}, fa.album_artist, {_artist_name('a.artist_id')}, a.album_artist),
+            NULLIF(a.artist_id, 0), e.id
+        FROM tracks e JOIN albums a ON a.id = e.album_id
+        LEFT JOIN final_albums_metadata fa ON fa.album_id = e.album_id
+        WHERE e.id IN (SELECT track_id FROM temp.agg_track_src)
+        ON CONFLICT (track_id) DO UPDATE SET
+            title = excluded.title, track_number = excluded.track_number, metadata_status = excluded.metadata_status,
+            album_id = excluded.album_id, artist = excluded.artist, track_artist_id = excluded.track_artist_id
+    """,
+}
+
+# entity -> (final table, key column, entity table with a metadata_status column or None)
+_FINAL_TABLES = {
+    'artist': ('final_artists_metadata', 'artist_id', 'artists'),
+    'album': ('final_albums_metadata', 'album_id', 'albums'),
+    'track': ('final_tracks_metadata', 'track_id', None),
+}
+
+class AggregationRepository(BaseRepository):
+    """Merge of the per-source metadata into the final_*_metadata tables"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+
+
+    def mark_all_changed(self) -> int:
+        """Put every entity with source metadata in the change log (full re-aggregation)"""
+        total = 0
+        with self.transaction() as conn:
+            for entity in _FINAL_TABLES:
+                cursor = conn.execute(f"INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) SELECT DISTINCT '{entity}', {entity}_id FROM {entity}_metadata")
+                total += cursor.rowcount
+        return total
+
+    def pending_changes(self) -> Dict[str, int]:
+        """Entities waiting in the change log, by type"""
+        rows = self._fetch_all("SELECT entity_type, COUNT(*) AS n FROM metadata_changes GROUP BY entity_type")
+        return {row['entity_type']: row['n'] for row in rows}
+
+    def aggregate(self) -> Dict[str, Dict[str, int]]:
+        """
+        Aggregate the entities in the change log, in one transaction with a fixed number of
+        set-based statements (whatever the number of entities):
+            - every field takes the value of the most reliable source that has it
+            - album genres and styles are ranked by summed (reliability + 1) * role weight
+            - artist names come from the sources, else from the resolved artist, else from the
+              album directory (artist IDs are only kept once resolved, never the placeholder 0)
+            - entities left with no source metadata lose their final row
+
+        Returns:
+            dict: entity type -> {'updated': rows upserted, 'removed': final rows deleted}
+        """
+        counts = {}
+        with self.transaction(immediate=True) as conn:
+            for statement in _SNAPSHOT:
+                conn.execute(statement)
+            for entity, (final_table, key, table) in _FINAL_TABLES.items():
+                with profiler.stage(f'aggregate.{entity}'):
+                    for statement in _RANKED:
+                        conn.execute(statement.format(entity=entity))
+                    if entity == 'album':
+                        for statement in _ALBUM_GENRES:
+                            conn.execute(statement)
+                    updated = conn.execute(_UPSERT[entity]).rowcount
+                    if table:
+                        conn.execute(f"""
+                            UPDATE {table} SET metadata_status = 'aggregated', updated_at = CURRENT_TIMESTAMP
+                            WHERE id IN (SELECT {key} FROM temp.agg_{entity}_src)
+                        """)
+                    # dirty entities whose source metadata is all gone
+                    orphans = f"""
+                        SELECT entity_id FROM temp.agg_dirty WHERE entity_type = '{entity}'
+                        EXCEPT SELECT {key} FROM temp.agg_{entity}_src
+                    """
+                    removed = conn.execute(f"DELETE FROM {final_table} WHERE {key} IN ({orphans})").rowcount
+                    if table:
+                        conn.execute(f"UPDATE {table} SET metadata_status = 'pending' WHERE metadata_status = 'aggregated' AND id IN ({orphans})")
+                    counts[entity] = {'updated': updated, 'removed': removed}
+        return counts
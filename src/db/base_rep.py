@@ -2,11 +2,20 @@ import sqlite3
 from contextlib import contextmanager
 from typing import Iterator, Dict, Any, List, Optional
 from datetime import datetime
+from .connection import get_manager
+
+# rows fetched from SQLite per fetchmany() of the streaming reads (see _iter_batches)
+DEFAULT_ARRAYSIZE = 1000
+
+# row types of the streaming reads: plain tuples (fastest), sqlite3.Row (by index or column name), dicts
+ROW_TYPES = ('tuple', 'row', 'dict')
 
 class BaseRepository:
     #_initialized = False 
     def __init__(self, db_path: str):
         self.db_path = db_path
+        # shared by every repository of the same database: one connection per thread
+        self._manager = get_manager(db_path)
         # decidi se gestire inizializzazione tramite creazione repo o separatamente
         # if not BaseRepository._initialized:
         #     self._initialize_database()
@@ -18,17 +27,17 @@ class BaseRepository:
     
     @contextmanager
     def _get_connection(self) -> Iterator[sqlite3.Connection]:
-        """Get a new database connection"""
-        conn = sqlite3.connect(self.db_path)
-        # pragmas ? 
-        conn.row_factory = sqlite3.Row  # allow dictionary-like access
-        try:
+        """Get the long-lived connection of the current thread (pragmas already applied)"""
+        yield self._manager.connection()
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        Open a transaction spanning several repository calls (of any repository on the same database).
+        Commits on success, rolls back on error, nested scopes are savepoints.
+        """
+        with self._manager.transaction(immediate=immediate) as conn:
             yield conn
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
 
     # @contextmanager
     # def _cursor(self, conn: Optional[sqlite3.Connection] = None) -> Iterator[sqlite3.Cursor]:
@@ -40,21 +49,21 @@ class BaseRepository:
     #             with conn:
     #                 yield conn.cursor()
 
-    def _execute(self, query: str, params: tuple = (), commit: bool = False) -> sqlite3.Cursor:
-        """Execute a query and return the cursor"""
-        with self._get_connection() as conn:
-            cursor = conn.execute(query, params)
-            if commit:
-                conn.commit()
-            return cursor
-
-    def _execute_many(self, query: str, params_list: List[tuple], commit: bool = False) -> sqlite3.Cursor:
-        """Execute many queries (multiple rows) and return the cursor"""
-        with self._get_connection() as conn:
-            cursor = conn.executemany(query, params_list)
-            if commit:
-                conn.commit()
-            return cursor
+    def _execute(self, query: str, params: tuple = (), commit: bool = False, conn: Optional[sqlite3.Connection] = None) -> sqlite3.Cursor:
+        """
+        Execute a query and return the cursor.
+        Outside a transaction scope every statement is committed on its own (autocommit),
+        so `commit` is kept only for compatibility.
+        """
+        if conn is None:
+            conn = self._manager.connection()
+        return conn.execute(query, params)
+
+    def _execute_many(self, query: str, params_list: List[tuple], commit: bool = False, conn: Optional[sqlite3.Connection] = None) -> sqlite3.Cursor:
+        """Execute many queries (multiple rows) in one statement transaction and return the cursor"""
+        if conn is None:
+            conn = self._manager.connection()
+        return conn.executemany(query, params_list)
 
     def _fetch_one(self, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
         """Execute a query and fetch a single row"""
@@ -68,23 +77,83 @@ class BaseRepository:
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
             
-    def _insert(self, table: str, data: Dict[str, Any]) -> int:
+    def _iter_batches(self, query: str, params: tuple = (), arraysize: int = DEFAULT_ARRAYSIZE, row_type: str = 'row',
+                      conn: Optional[sqlite3.Connection] = None) -> Iterator[List[Any]]:
+        """
+        Stream the rows of a query in lists of at most `arraysize` rows (fetchmany), without
+        materializing the result: memory stays flat whatever the number of rows.
+        The statement keeps its read snapshot until the iterator is exhausted or closed;
+        wrap several reads in transaction() for a snapshot shared by all of them.
+
+        Args:
+            row_type: 'tuple', 'row' (sqlite3.Row) or 'dict'
+            conn: connection of the running transaction (optional)
+        """
+        if row_type not in ROW_TYPES:
+            raise ValueError(f"unknown row type '{row_type}', expected one of {', '.join(ROW_TYPES)}")
+        if conn is None:
+            conn = self._manager.connection()
+        cursor = conn.cursor()
+        if row_type == 'tuple':
+            cursor.row_factory = None
+        cursor.arraysize = arraysize
+        try:
+            cursor.execute(query, params)
+            while rows := cursor.fetchmany():
+                yield [dict(row) for row in rows] if row_type == 'dict' else rows
+        finally:
+            cursor.close()
+
+    def _iter_rows(self, query: str, params: tuple = (), arraysize: int = DEFAULT_ARRAYSIZE, row_type: str = 'row',
+                   conn: Optional[sqlite3.Connection] = None) -> Iterator[Any]:
+        """Stream the rows of a query one by one (fetched `arraysize` at a time, see _iter_batches)"""
+        for rows in self._iter_batches(query, params, arraysize=arraysize, row_type=row_type, conn=conn):
+            yield from rows
+
+    def _insert(self, table: str, data: Dict[str, Any], conn: Optional[sqlite3.Connection] = None) -> int:
         """Insert a new record"""
         columns = ', '.join(data.keys())
         placeholders = ', '.join(['?'] * len(data))
         query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
         params = tuple(data.values())
-        cursor = self._execute(query, params, commit=True)
+        cursor = self._execute(query, params, commit=True, conn=conn)
         return cursor.lastrowid # return the new record's ID
     
-    def _insert_many(self, table: str, data_list: List[Dict[str, Any]]) -> List[int]:
-        """Insert multiple records (same columns, same table)"""
+    def _insert_many(self, table: str, data_list: List[Dict[str, Any]], conn: Optional[sqlite3.Connection] = None, id_field: str = 'id', on_conflict: Optional[str] = None, key_field: Optional[str] = None) -> List[Optional[int]]:
+        """
+        Insert multiple records (same columns, same table) and return their IDs in input order.
+
+        Args:
+            on_conflict: optional upsert clause, e.g. "(path) DO NOTHING"
+            key_field: unique column used to map the returned IDs back to the input rows
+                (needed with on_conflict: skipped rows get None)
+        """
+        if not data_list:
+            return []
         columns = ', '.join(data_list[0].keys())
-        placeholders = ', '.join(['?'] * len(data_list[0]))
-        query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-        params_list = [tuple(data.values()) for data in data_list]
-        cursor = self._execute_many(query, params_list, commit=True)
-        return cursor.lastrowid # seems to return None
+        row_placeholder = '(' + ', '.join(['?'] * len(data_list[0])) + ')'
+        conflict_clause = f" ON CONFLICT {on_conflict}" if on_conflict else ''
+        returning = id_field if key_field is None else f"{id_field}, {key_field}"
+
+        if conn is None:
+            with self.transaction() as conn:
+                return self._insert_many(table, data_list, conn=conn, id_field=id_field, on_conflict=on_conflict, key_field=key_field)
+
+        # multi-row INSERT ... RETURNING (executemany cannot return rows), as many rows as the bound variables allow
+        rows_per_query = max(1, conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER) // len(data_list[0]))
+        ids = []
+        for start in range(0, len(data_list), rows_per_query):
+            chunk = data_list[start:start + rows_per_query]
+            query = f"INSERT INTO {table} ({columns}) VALUES {', '.join([row_placeholder] * len(chunk))}{conflict_clause} RETURNING {returning}"
+            params = tuple(value for data in chunk for value in data.values())
+            rows = conn.execute(query, params).fetchall()
+            if key_field is None:
+                # RETURNING order is arbitrary, but new rowids grow in insertion order
+                ids.extend(sorted(row[0] for row in rows))
+            else:
+                by_key = {row[1]: row[0] for row in rows}
+                ids.extend(by_key.get(data[key_field]) for data in chunk)
+        return ids
         
     def _update(self, table: str, id_value: Any, id_field: str, data: Dict[str, Any]) -> bool:
         """Update an existing record by ID"""
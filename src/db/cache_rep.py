@@ -0,0 +1,43 @@
+from typing import List, Dict, Any, Optional, Tuple
+from .base_rep import BaseRepository
+
+class CacheRepository(BaseRepository):
+    """Persistent tier of the HTTP response cache (api_cache)"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached response row, None if missing"""
+        query = """
+            SELECT key, source_id, url, status, content_type, etag, last_modified, codec, body, raw_size, fetched_at, expires_at
+            FROM api_cache WHERE key = ?
+        """
+        return self._fetch_one(query, (key,))
+
+    def save_entries(self, entries: List[Dict[str, Any]]) -> None:
+        """Insert or replace cached responses in one transaction (same keys for every row)"""
+        if not entries:
+            return
+        query = """
+            INSERT OR REPLACE INTO api_cache (key, source_id, url, status, content_type, etag, last_modified, codec, body, raw_size, fetched_at, expires_at)
+            VALUES (:key, :source_id, :url, :status, :content_type, :etag, :last_modified, :codec, :body, :raw_size, :fetched_at, :expires_at)
+        """
+        with self.transaction() as conn:
+            self._execute_many(query, entries, conn=conn)
+
+    def refresh_entries(self, refreshed: List[Tuple[float, float, str]]) -> None:
+        """Extend revalidated entries: (fetched_at, expires_at, key) rows"""
+        if not refreshed:
+            return
+        with self.transaction() as conn:
+            self._execute_many("UPDATE api_cache SET fetched_at = ?, expires_at = ? WHERE key = ?", refreshed, conn=conn)
+
+    def purge(self, expired_before: float) -> int:
+        """Delete the entries expired before a unix time, returning how many"""
+        cursor = self._execute("DELETE FROM api_cache WHERE expires_at < ?", (expired_before,))
+        return cursor.rowcount
+
+    def get_size(self) -> Dict[str, int]:
+        """Entries, stored bytes and uncompressed bytes of the cache"""
+        return self._fetch_one("SELECT COUNT(*) AS entries, COALESCE(SUM(LENGTH(body)), 0) AS stored, COALESCE(SUM(raw_size), 0) AS raw FROM api_cache")
@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, astuple, fields
+from pathlib import Path
+from typing import Iterator, Dict, List, Optional
+from core.profiling import connection_factory
+
+# prepared statements kept per connection (sqlite3 default is 128)
+STATEMENT_CACHE_SIZE = 1024
+
+#------------ PRAGMA PROFILES -----------#
+
+@dataclass(frozen=True)
+class PragmaProfile:
+    """Pragmas applied to every connection when it is opened"""
+    foreign_keys: bool = True
+    synchronous: str = 'NORMAL'     # OFF | NORMAL | FULL (NORMAL is safe with WAL)
+    cache_size: int = -65536        # negative: KiB -> 64 MiB page cache
+    mmap_size: int = 268435456      # 256 MiB memory-mapped I/O
+    temp_store: str = 'MEMORY'      # temp tables and indexes in RAM
+    busy_timeout: int = 5000        # ms waiting for a lock before SQLITE_BUSY
+
+    def statements(self) -> List[str]:
+        """PRAGMA statements of the profile"""
+        return [
+            f"PRAGMA {field.name} = {int(value) if isinstance(value, bool) else value}"
+            for field, value in zip(fields(self), astuple(self))
+        ]
+
+DEFAULT_PRAGMAS = PragmaProfile()
+# bulk loads: bigger cache, no fsync at commit (a crash may lose the last transactions, not corrupt the DB)
+BULK_PRAGMAS = PragmaProfile(synchronous='OFF', cache_size=-262144)
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: PragmaProfile = DEFAULT_PRAGMAS) -> None:
+    """Apply a pragma profile to an open connection"""
+    for statement in pragmas.statements():
+        conn.execute(statement)
+
+#------------ CONNECTION MANAGER -----------#
+
+class ConnectionManager:
+    """
+    One long-lived connection per thread for a database file.
+
+    Connections run in autocommit mode (each statement commits on its own)
+    unless a transaction() scope is open on the thread: every repository call
+    made inside the scope shares its connection and its transaction.
+    """
+    def __init__(self, db_path: Path, pragmas: PragmaProfile = DEFAULT_PRAGMAS, cached_statements: int = STATEMENT_CACHE_SIZE):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._pid = os.getpid()
+
+    def connection(self) -> sqlite3.Connection:
+        """Get (opening it on first use) the connection of the calling thread"""
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                isolation_level=None,  # transactions are managed explicitly
+                cached_statements=self.cached_statements,
+                check_same_thread=False,  # only used by its thread, closed by close()
+                factory=connection_factory(),  # instrumented only while profiling
+            )
+            conn.row_factory = sqlite3.Row  # allow dictionary-like access
+            apply_pragmas(conn, self.pragmas)
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @property
+    def in_transaction(self) -> bool:
+        """True if a transaction scope is open on the calling thread"""
+        return getattr(self._local, 'depth', 0) > 0
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        Transaction scope on the thread connection: commit on success, rollback on error.
+        Nested scopes become savepoints.
+
+        Args:
+            immediate: take the write lock at BEGIN (BEGIN IMMEDIATE)
+        """
+        conn = self.connection()
+        depth = self._local.depth
+        if depth == 0:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        else:
+            conn.execute(f"SAVEPOINT sp_{depth}")
+        self._local.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:  # some errors already rolled back the whole transaction
+                if depth == 0:
+                    conn.execute("ROLLBACK")
+                else:
+                    conn.execute(f"ROLLBACK TO sp_{depth}")
+                    conn.execute(f"RELEASE sp_{depth}")
+            raise
+        else:
+            conn.execute("COMMIT" if depth == 0 else f"RELEASE sp_{depth}")
+        finally:
+            self._local.depth = depth
+
+    def close(self) -> None:
+        """Close the connections of every thread"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def _reset_after_fork(self) -> None:
+        """Forked children must not reuse the parent connections"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._pid = os.getpid()
+
+
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+def get_manager(db_path: Path, pragmas: Optional[PragmaProfile] = None) -> ConnectionManager:
+    """
+    Shared connection manager of a database file.
+
+    Args:
+        db_path: database path
+        pragmas: profile for the connections opened from now on (keeps the current one if None)
+    """
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(db_path, pragmas or DEFAULT_PRAGMAS)
+        elif pragmas is not None:
+            manager.pragmas = pragmas
+    return manager
+
+def close_all() -> None:
+    """Close every managed connection (e.g. before deleting the database file)"""
+    with _managers_lock:
+        managers = list(_managers.values())
+    for manager in managers:
+        manager.close()
@@ -2,13 +2,29 @@ import sqlite3
 from pathlib import Path
 import json
 from contextlib import contextmanager
+from typing import Dict, List, Tuple, Iterator, Optional, Callable
 from .domain.path import SCHEMA_PATH, GENRE_TREE_PATH, SOURCES_PATH
+from .connection import PragmaProfile, DEFAULT_PRAGMAS, apply_pragmas
+from .search_rep import SearchRepository
+from .stats_rep import StatsRepository
+from .aggregate_rep import AggregationRepository
+
+# version of schema.sql, stored in the database as PRAGMA user_version.
+# Databases created before the versioning are at 0 whatever their tables: every
+# migration checks the schema before altering it, so it runs on any of them.
+#   1: scan state, genre closure, API cache, change log, search and summary tables
+#   2: tracks: 'm4a' format, file state of the fingerprint
+#   3: api_queries: leases, attempts and 'dead' status
+#   4: final metadata: artist names, artist IDs nullable, one final row per track
+#   5: tracks: file identity (device, inode)
+SCHEMA_VERSION = 5
 
 #------------ CONNENCTION CONTEXT MANAGER -----------#
 
 @contextmanager
-def get_connection(db_path: Path) :
+def get_connection(db_path: Path, pragmas: PragmaProfile = DEFAULT_PRAGMAS) :
     conn = sqlite3.connect(db_path)
+    apply_pragmas(conn, pragmas)  # same profile of the repository connections
     try:
         yield conn  # "restituisce" la connessione al blocco `with`
         conn.commit()  # se tutto è andato bene, salva i cambiamenti
@@ -21,11 +37,45 @@ def get_connection(db_path: Path) :
 #------------ DATABASE INITIALIZATION -----------#
 
 def init_db(db_path: Path):
-    """Initialize the database with the schema and static data"""
+    """Initialize a new database with the schema and static data"""
     with get_connection(db_path) as conn:
         _init_schema(conn)
         _insert_genre_tree(conn)
         _insert_sources(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def migrate_db(db_path: Path) -> Optional[int]:
+    """
+    Upgrade a database created by an older version to the current schema, keeping its data:
+    the migrations newer than its version alter the existing tables, the schema script adds
+    the new tables, triggers and indexes, then the tables derived from the library are filled.
+    The version is written last: an interrupted upgrade is run again from the start.
+
+    Returns:
+        Optional[int]: schema version the database was upgraded from, None if already current
+
+    Raises:
+        ValueError: if the database was created by a newer version
+    """
+    with get_connection(db_path) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return None
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"schema version {version} is newer than the supported one ({SCHEMA_VERSION})")
+        _apply_migrations(conn, version)
+        _init_schema(conn)
+        _sync_genre_tree(conn)
+        _insert_sources(conn)
+
+    # created empty by the schema script
+    SearchRepository(db_path).rebuild()
+    StatsRepository(db_path).rebuild()
+    AggregationRepository(db_path).mark_all_changed()  # final metadata gains the names
+
+    with get_connection(db_path) as conn:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return version
 
 
 def _init_schema(conn: sqlite3.Connection):
@@ -36,17 +86,171 @@ def _init_schema(conn: sqlite3.Connection):
     conn.execute("PRAGMA synchronous = NORMAL") # Balance between performance and safety
     #conn.row_factory = sqlite3.Row  # Permette l'accesso alle colonne come chiavi
     
-    # execute schema
+    # execute schema (idempotent: also completes the schema of migrated databases)
     with open(SCHEMA_PATH) as f:
         conn.executescript(f.read())
-    
-    # apply migrations
-    _apply_migrations(conn)
 
-def _apply_migrations(conn: sqlite3.Connection):
-    """Migration handler"""
-    # sfrutta PRAGMA user_version;
-    pass
+#------------ SCHEMA MIGRATIONS -----------#
+
+def _columns(conn: sqlite3.Connection, table: str) -> Dict[str, bool]:
+    """Column name -> NOT NULL of a table"""
+    return {row[1]: bool(row[3]) for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _table_sql(conn: sqlite3.Connection, table: str) -> str:
+    """CREATE TABLE statement of a table"""
+    return conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+
+def _add_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]):
+    """Add the columns (name -> definition) missing from a table"""
+    existing = _columns(conn, table)
+    for name, definition in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+def _rebuild_table(conn: sqlite3.Connection, table: str, ddl: str):
+    """
+    Recreate a table from a new definition, for the changes ALTER TABLE cannot make
+    (CHECK and NOT NULL constraints). Rows keep their ids; indexes and triggers are
+    dropped with the old table and created again by the schema script.
+
+    Args:
+        ddl: CREATE TABLE statement with a {table} placeholder for the name
+    """
+    old = _columns(conn, table)
+    conn.execute(ddl.format(table=f"{table}_new"))
+    common = ', '.join(name for name in _columns(conn, f"{table}_new") if name in old)
+    conn.execute(f"INSERT INTO {table}_new ({common}) SELECT {common} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+# definitions of the rebuilt tables as of their migration (later migrations only add columns)
+_TRACKS_V2 = """
+CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY,
+    album_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    duration_ms INTEGER,
+    fingerprint TEXT NOT NULL,
+    file_size INTEGER,
+    file_mtime_ns INTEGER,
+    audio_size INTEGER,
+    track_number INTEGER NOT NULL,
+    disc_number INTEGER DEFAULT 1,
+    format TEXT DEFAULT 'unknown' CHECK (format IN ('mp3', 'flac', 'ogg', 'wav', 'aac', 'm4a', 'unknown')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (album_id) REFERENCES albums(id) ON DELETE CASCADE
+)"""
+
+_API_QUERIES_V3 = """
+CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY,
+    entity_type TEXT NOT NULL CHECK (entity_type IN ('artist', 'album', 'track')),
+    entity_id INTEGER NOT NULL,
+    source_id INTEGER NOT NULL,
+    status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'in_progress', 'done', 'error', 'dead')),
+    endpoint TEXT NOT NULL,
+    parameters TEXT,
+    response_data TEXT,
+    worker_id TEXT,
+    lease_expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (source_id) REFERENCES sources(id),
+    UNIQUE (entity_type, entity_id, source_id)
+)"""
+
+_FINAL_ALBUMS_METADATA_V4 = """
+CREATE TABLE {table} (
+    title TEXT NOT NULL,
+    year INTEGER,
+    genres TEXT,
+    styles TEXT,
+    metadata_status TEXT,
+    album_artist TEXT,
+    album_artist_id INTEGER,
+    album_id INTEGER PRIMARY KEY,
+    FOREIGN KEY (album_artist_id) REFERENCES artists(id),
+    FOREIGN KEY (album_id) REFERENCES albums(id) ON DELETE CASCADE
+)"""
+
+_FINAL_TRACKS_METADATA_V4 = """
+CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    track_number INTEGER,
+    metadata_status TEXT,
+    album_id INTEGER NOT NULL,
+    artist TEXT,
+    track_artist_id INTEGER,
+    track_id INTEGER NOT NULL,
+    FOREIGN KEY (album_id) REFERENCES albums(id),
+    FOREIGN KEY (track_artist_id) REFERENCES artists(id),
+    FOREIGN KEY (track_id) REFERENCES tracks(id) ON DELETE CASCADE
+)"""
+
+def _migrate_tracks_file_state(conn: sqlite3.Connection):
+    """'m4a' format and file state of the fingerprint"""
+    if "'m4a'" not in _table_sql(conn, 'tracks'):
+        _rebuild_table(conn, 'tracks', _TRACKS_V2)
+    _add_columns(conn, 'tracks', {'file_size': 'INTEGER', 'file_mtime_ns': 'INTEGER', 'audio_size': 'INTEGER'})
+
+def _migrate_api_queries_leases(conn: sqlite3.Connection):
+    """Leases of the in-progress queries, attempts and 'dead' status"""
+    if "'dead'" not in _table_sql(conn, 'api_queries'):
+        _rebuild_table(conn, 'api_queries', _API_QUERIES_V3)
+    _add_columns(conn, 'api_queries', {'worker_id': 'TEXT', 'lease_expires_at': 'REAL', 'attempts': 'INTEGER NOT NULL DEFAULT 0', 'last_error': 'TEXT'})
+
+def _migrate_final_metadata_artists(conn: sqlite3.Connection):
+    """Artist names, artist IDs NULL until resolved, one final row per track"""
+    if _columns(conn, 'final_albums_metadata')['album_artist_id']:
+        _rebuild_table(conn, 'final_albums_metadata', _FINAL_ALBUMS_METADATA_V4)
+    if _columns(conn, 'final_tracks_metadata')['track_artist_id']:
+        _rebuild_table(conn, 'final_tracks_metadata', _FINAL_TRACKS_METADATA_V4)
+    _add_columns(conn, 'final_albums_metadata', {'album_artist': 'TEXT'})
+    _add_columns(conn, 'final_tracks_metadata', {'artist': 'TEXT'})
+    # the unique index on track_id is created by the schema script: keep the latest row of each track
+    conn.execute("DELETE FROM final_tracks_metadata WHERE id NOT IN (SELECT MAX(id) FROM final_tracks_metadata GROUP BY track_id)")
+
+def _migrate_tracks_file_identity(conn: sqlite3.Connection):
+    """File identity followed by reconcile across renames and moves"""
+    _add_columns(conn, 'tracks', {'file_inode': 'INTEGER', 'file_device': 'INTEGER'})
+
+# version -> migration of the tables that existed before it (new tables come from schema.sql)
+_MIGRATIONS: Dict[int, Callable[[sqlite3.Connection], None]] = {
+    2: _migrate_tracks_file_state,
+    3: _migrate_api_queries_leases,
+    4: _migrate_final_metadata_artists,
+    5: _migrate_tracks_file_identity,
+}
+
+def _apply_migrations(conn: sqlite3.Connection, version: int):
+    """
+    Run the migrations newer than version, each in its own transaction.
+
+    Foreign keys are off while they run (PRAGMA foreign_keys is ignored inside a
+    transaction): a table rebuild drops a table referenced by the others. Rebuilt
+    tables keep their rows and ids, so no reference is broken.
+    """
+    conn.commit()
+    conn.isolation_level = None  # explicit transactions
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("PRAGMA legacy_alter_table = ON")  # renames do not rewrite the triggers of the dropped table
+    try:
+        for number in sorted(n for n in _MIGRATIONS if n > version):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _MIGRATIONS[number](conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.isolation_level = ''
 
 #------------ STATIC DATA INSERTION -----------#
 def _load_json(path: Path) -> dict:
@@ -54,24 +258,63 @@ def _load_json(path: Path) -> dict:
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def _insert_tree(cursor: sqlite3.Cursor, tree: dict, parent_id: int = None):
-    """Recursively insert genres into the database"""
-    for name, children in tree.items():
-        # insert the genre, avoiding (name, parent_id) duplicates
-        # 0 necessary to avoid NULL parent_id issues
-        cursor.execute("INSERT OR IGNORE INTO genres (name, parent_id) VALUES (?, ?)", (name, parent_id if parent_id is not None else 0))
-        # get the genre id (whether inserted now or already existed)
-        cursor.execute("SELECT id FROM genres WHERE name = ? AND parent_id IS ?", (name, parent_id if parent_id is not None else 0))
-        genre_id = cursor.fetchone()[0]
+def _flatten_tree(tree: dict, known: Dict[Tuple[str, int], int], next_id: int) -> Tuple[List[Tuple[int, str, int]], List[Tuple[int, str, int]]]:
+    """
+    Assign the genre ids of the whole tree in memory (iterative preorder, no DB round trips).
 
-        # insert children recursively
-        _insert_tree(cursor, children, genre_id)
+    Args:
+        tree: nested {name: children} dictionary
+        known: (name, parent_id) -> id of the genres already in the database
+        next_id: first id for the new genres
+
+    Returns:
+        tuple: (every node of the tree, only the new ones) as (id, name, parent_id) rows
+    """
+    nodes = []
+    new = []
+    # 0 necessary to avoid NULL parent_id issues
+    stack = [(name, children, 0) for name, children in reversed(tree.items())]
+    while stack:
+        name, children, parent_id = stack.pop()
+        genre_id = known.get((name, parent_id))
+        if genre_id is None:
+            genre_id = known[(name, parent_id)] = next_id
+            next_id += 1
+            new.append((genre_id, name, parent_id))
+        nodes.append((genre_id, name, parent_id))
+        stack.extend((child, grandchildren, genre_id) for child, grandchildren in reversed(children.items()))
+    return nodes, new
+
+def _closure_rows(parents: Dict[int, int]) -> Iterator[Tuple[int, int, int]]:
+    """(ancestor, descendant, depth) rows of the tree given as id -> parent_id (dummy root 0 excluded)"""
+    for genre_id in parents:
+        ancestor_id, depth = genre_id, 0
+        while ancestor_id:  # stops at the dummy root
+            yield ancestor_id, genre_id, depth
+            ancestor_id, depth = parents.get(ancestor_id, 0), depth + 1
+
+def _rebuild_genre_closure(conn: sqlite3.Connection):
+    """Recompute the genre_closure table from genres.parent_id"""
+    parents = dict(conn.execute("SELECT id, parent_id FROM genres WHERE id != 0").fetchall())
+    conn.execute("DELETE FROM genre_closure")
+    conn.executemany("INSERT INTO genre_closure (ancestor_id, descendant_id, depth) VALUES (?, ?, ?)", _closure_rows(parents))
+
+def _sync_genre_tree(conn: sqlite3.Connection) -> int:
+    """Insert the genres of the JSON tree missing from the database, then rebuild the closure table"""
+    genre_tree = _load_json(GENRE_TREE_PATH)
+    rows = conn.execute("SELECT id, name, parent_id FROM genres WHERE id != 0").fetchall()
+    known = {(name, parent_id): genre_id for genre_id, name, parent_id in rows}
+    next_id = max((genre_id for genre_id, _, _ in rows), default=0) + 1
+
+    _, new = _flatten_tree(genre_tree, known, next_id)
+    # parents always precede their children: the foreign keys hold row by row
+    conn.executemany("INSERT INTO genres (id, name, parent_id) VALUES (?, ?, ?)", new)
+    _rebuild_genre_closure(conn)
+    return len(new)
 
 def _insert_genre_tree(conn: sqlite3.Connection):
     """Insert genre tree from JSON file into the database"""
-    cursor = conn.cursor()
-    genre_tree = _load_json(GENRE_TREE_PATH)
-    _insert_tree(cursor, genre_tree)
+    _sync_genre_tree(conn)
 
 def _insert_sources(conn: sqlite3.Connection):
     """Insert sources from JSON file into the database"""
@@ -80,9 +323,15 @@ def _insert_sources(conn: sqlite3.Connection):
     for source in sources:
         cursor.execute("INSERT OR IGNORE INTO sources (name, base_url) VALUES (?, ?)", (source['name'], source['base_url']))
 
-def update_genre_tree(conn: sqlite3.Connection):
-    """Update the genre tree from the JSON file"""
-    pass
+def update_genre_tree(conn: sqlite3.Connection) -> int:
+    """
+    Update the genre tree from the JSON file: new genres are added and the closure table is rebuilt.
+    Genres no longer in the file are kept, since metadata rows may still reference them.
+
+    Returns:
+        int: number of genres added
+    """
+    return _sync_genre_tree(conn)
 
 def update_sources(conn: sqlite3.Connection):
     """Update the sources from the JSON file"""
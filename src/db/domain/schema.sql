@@ -6,7 +6,7 @@ CREATE TABLE IF NOT EXISTS artists (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
-INSERT INTO artists (id, name) VALUES (0, 'Unknown Artist');  -- dummy artist for albums initialization
+INSERT OR IGNORE INTO artists (id, name) VALUES (0, 'Unknown Artist');  -- dummy artist for albums initialization
 -- Album data from directories
 -- foreign key one(artist) to many(albums)
 CREATE TABLE IF NOT EXISTS albums (
@@ -31,15 +31,34 @@ CREATE TABLE IF NOT EXISTS tracks (
     title TEXT NOT NULL,
     path TEXT NOT NULL UNIQUE,
     duration_ms INTEGER,
-    fingerprint TEXT NOT NULL,-- UNIQUE,
+    fingerprint TEXT NOT NULL,-- UNIQUE, hash of the audio payload (tags excluded), '' until computed
+    file_size INTEGER, -- file state when the fingerprint was computed
+    file_mtime_ns INTEGER,
+    audio_size INTEGER, -- bytes of audio payload (tags excluded)
+    file_inode INTEGER, -- file identity (st_dev, st_ino) seen by the last reconcile: follows renames and moves
+    file_device INTEGER,
     track_number INTEGER NOT NULL,
     disc_number INTEGER DEFAULT 1,
-    format TEXT DEFAULT 'unknown' CHECK (format IN ('mp3', 'flac', 'ogg', 'wav', 'aac', 'unknown')),
+    format TEXT DEFAULT 'unknown' CHECK (format IN ('mp3', 'flac', 'ogg', 'wav', 'aac', 'm4a', 'unknown')),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (album_id) REFERENCES albums(id) ON DELETE CASCADE
 );
 
+-- Directory state manifest for incremental scans (artist and album folders)
+-- one row per directory, never written into the music tree
+CREATE TABLE IF NOT EXISTS scan_state (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL CHECK (kind IN ('artist', 'album')),
+    parent TEXT, -- artist folder path for albums, NULL for artists
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    entry_count INTEGER NOT NULL DEFAULT 0,
+    audio_digest TEXT, -- hash of (name, size, mtime) of the audio files, NULL for artists
+    is_album INTEGER NOT NULL DEFAULT 0, -- 1 if the folder is a valid album (naming + audio files)
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Genres in tree structure
 -- self-referencing foreign key for parent genre
 CREATE TABLE IF NOT EXISTS genres (
@@ -49,7 +68,17 @@ CREATE TABLE IF NOT EXISTS genres (
     FOREIGN KEY (parent_id) REFERENCES genres(id),
     UNIQUE(name, parent_id) -- genres can appartain to different parents (Post-Punk)
 );
-INSERT INTO genres (id, name) VALUES (0, 'Genre');  -- dummy genre for main genres with no parent
+INSERT OR IGNORE INTO genres (id, name) VALUES (0, 'Genre');  -- dummy genre for main genres with no parent
+-- Transitive closure of the genre tree: one row per (ancestor, descendant) pair, self included (depth 0)
+-- the dummy root is left out: main genres are the ancestors with parent_id = 0
+CREATE TABLE IF NOT EXISTS genre_closure (
+    ancestor_id INTEGER NOT NULL,
+    descendant_id INTEGER NOT NULL,
+    depth INTEGER NOT NULL, -- edges between ancestor and descendant
+    PRIMARY KEY (ancestor_id, descendant_id),
+    FOREIGN KEY (ancestor_id) REFERENCES genres(id) ON DELETE CASCADE,
+    FOREIGN KEY (descendant_id) REFERENCES genres(id) ON DELETE CASCADE
+) WITHOUT ROWID;
 -- Sources of metadata
 CREATE TABLE IF NOT EXISTS sources (
     id INTEGER PRIMARY KEY,
@@ -87,14 +116,35 @@ CREATE TABLE IF NOT EXISTS api_queries (
     entity_type TEXT NOT NULL CHECK (entity_type IN ('artist', 'album', 'track')),
     entity_id INTEGER NOT NULL,
     source_id INTEGER NOT NULL,
-    status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'in_progress', 'done', 'error')),
+    status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'in_progress', 'done', 'error', 'dead')),
     endpoint TEXT NOT NULL,
     parameters TEXT, -- JSON
     response_data TEXT, -- JSON response
+    worker_id TEXT, -- fetch process holding the query while in progress
+    lease_expires_at REAL, -- unix time after which an in-progress query can be claimed again
+    attempts INTEGER NOT NULL DEFAULT 0, -- claims so far ('dead' after too many)
+    last_error TEXT,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (source_id) REFERENCES sources(id),
     UNIQUE (entity_type, entity_id, source_id)
 );
+-- HTTP response cache of the metadata sources (compressed bodies)
+-- keyed by hash of (source, url, normalized parameters)
+CREATE TABLE IF NOT EXISTS api_cache (
+    key TEXT PRIMARY KEY,
+    source_id INTEGER NOT NULL,
+    url TEXT NOT NULL, -- without the query string
+    status INTEGER NOT NULL, -- HTTP status (2xx and 404 are cached)
+    content_type TEXT,
+    etag TEXT, -- validators for conditional revalidation
+    last_modified TEXT,
+    codec TEXT NOT NULL CHECK (codec IN ('raw', 'zlib', 'zstd')),
+    body BLOB NOT NULL,
+    raw_size INTEGER NOT NULL, -- bytes before compression
+    fetched_at REAL NOT NULL, -- unix time of the last fetch or revalidation
+    expires_at REAL NOT NULL, -- unix time after which the entry must be revalidated
+    FOREIGN KEY (source_id) REFERENCES sources(id)
+);
 -- Metadata api cache for albums7artist
 -- CREATE TABLE api_cache_albums (
 --     id INTEGER PRIMARY KEY,
@@ -228,7 +278,8 @@ CREATE TABLE IF NOT EXISTS final_albums_metadata(
     genres TEXT,
     styles TEXT,
     metadata_status TEXT,
-    album_artist_id INTEGER NOT NULL,
+    album_artist TEXT, -- name from the most reliable source, else the album directory
+    album_artist_id INTEGER, -- NULL until the artist is resolved (never the 'Unknown Artist' placeholder)
     album_id INTEGER PRIMARY KEY,
     FOREIGN KEY (album_artist_id) REFERENCES artists(id),
     FOREIGN KEY (album_id) REFERENCES albums(id) ON DELETE CASCADE
@@ -239,13 +290,413 @@ CREATE TABLE IF NOT EXISTS final_tracks_metadata(
     track_number INTEGER,
     metadata_status TEXT,
     album_id INTEGER NOT NULL,
-    track_artist_id INTEGER NOT NULL,
+    artist TEXT, -- name from the most reliable source, else the album artist
+    track_artist_id INTEGER, -- NULL until the artist is resolved (never the 'Unknown Artist' placeholder)
     track_id INTEGER NOT NULL,
     FOREIGN KEY (album_id) REFERENCES albums(id),
     FOREIGN KEY (track_artist_id) REFERENCES artists(id),
     FOREIGN KEY (track_id) REFERENCES tracks(id) ON DELETE CASCADE
 );
 
+-- Change log of the aggregation: entities whose source metadata changed since the last run
+-- filled by the triggers below, emptied by the aggregation
+CREATE TABLE IF NOT EXISTS metadata_changes (
+    entity_type TEXT NOT NULL CHECK (entity_type IN ('artist', 'album', 'track')),
+    entity_id INTEGER NOT NULL,
+    PRIMARY KEY (entity_type, entity_id)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trg_artist_metadata_insert AFTER INSERT ON artist_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) VALUES ('artist', NEW.artist_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_artist_metadata_update AFTER UPDATE ON artist_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) VALUES ('artist', NEW.artist_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_artist_metadata_delete AFTER DELETE ON artist_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) VALUES ('artist', OLD.artist_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_artist_genres_metadata_insert AFTER INSERT ON artist_genres_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'artist', artist_id FROM artist_metadata WHERE id = NEW.metadata_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_artist_genres_metadata_update AFTER UPDATE ON artist_genres_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'artist', artist_id FROM artist_metadata WHERE id = NEW.metadata_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_artist_genres_metadata_delete AFTER DELETE ON artist_genres_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'artist', artist_id FROM artist_metadata WHERE id = OLD.metadata_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_album_metadata_insert AFTER INSERT ON album_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) VALUES ('album', NEW.album_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_album_metadata_update AFTER UPDATE ON album_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) VALUES ('album', NEW.album_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_album_metadata_delete AFTER DELETE ON album_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) VALUES ('album', OLD.album_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_album_genres_metadata_insert AFTER INSERT ON album_genres_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'album', album_id FROM album_metadata WHERE id = NEW.metadata_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_album_genres_metadata_update AFTER UPDATE ON album_genres_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'album', album_id FROM album_metadata WHERE id = NEW.metadata_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_album_genres_metadata_delete AFTER DELETE ON album_genres_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'album', album_id FROM album_metadata WHERE id = OLD.metadata_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_track_metadata_insert AFTER INSERT ON track_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) VALUES ('track', NEW.track_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_track_metadata_update AFTER UPDATE ON track_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) VALUES ('track', NEW.track_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_track_metadata_delete AFTER DELETE ON track_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) VALUES ('track', OLD.track_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_track_genres_metadata_insert AFTER INSERT ON track_genres_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'track', track_id FROM track_metadata WHERE id = NEW.metadata_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_track_genres_metadata_update AFTER UPDATE ON track_genres_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'track', track_id FROM track_metadata WHERE id = NEW.metadata_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_track_genres_metadata_delete AFTER DELETE ON track_genres_metadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'track', track_id FROM track_metadata WHERE id = OLD.metadata_id;
+END;
+-- a new source reliability changes the aggregate of everything that source described
+CREATE TRIGGER IF NOT EXISTS trg_sources_reliability_update AFTER UPDATE OF reliability_score ON sources
+BEGIN
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'artist', m.artist_id FROM artist_metadata m JOIN api_queries q ON q.id = m.query_id WHERE q.source_id = NEW.id;
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'album', m.album_id FROM album_metadata m JOIN api_queries q ON q.id = m.query_id WHERE q.source_id = NEW.id;
+    INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id)
+        SELECT 'track', m.track_id FROM track_metadata m JOIN api_queries q ON q.id = m.query_id WHERE q.source_id = NEW.id;
+END;
+
+-------- FULL-TEXT SEARCH ---------------------
+
+-- FTS5 indexes over the names and the metadata text, external content (the text stays in the tables):
+-- prefix, token and diacritic-insensitive queries, see db.SearchRepository
+-- the triggers keep them in sync, except while search_state.deferred is set (bulk initial scan):
+-- the indexes are then rebuilt in one pass
+CREATE TABLE IF NOT EXISTS search_state (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    deferred INTEGER NOT NULL DEFAULT 0 -- 1: triggers off, the indexes need a rebuild
+);
+INSERT OR IGNORE INTO search_state (id, deferred) VALUES (0, 0);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS artists_fts USING fts5(
+    name, content='artists', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS trg_artists_fts_insert AFTER INSERT ON artists
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO artists_fts (rowid, name) VALUES (NEW.id, NEW.name);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_artists_fts_update AFTER UPDATE OF name ON artists
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO artists_fts (artists_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+    INSERT INTO artists_fts (rowid, name) VALUES (NEW.id, NEW.name);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_artists_fts_delete AFTER DELETE ON artists
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO artists_fts (artists_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS albums_fts USING fts5(
+    title, album_artist, content='albums', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS trg_albums_fts_insert AFTER INSERT ON albums
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO albums_fts (rowid, title, album_artist) VALUES (NEW.id, NEW.title, NEW.album_artist);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_albums_fts_update AFTER UPDATE OF title, album_artist ON albums
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO albums_fts (albums_fts, rowid, title, album_artist) VALUES ('delete', OLD.id, OLD.title, OLD.album_artist);
+    INSERT INTO albums_fts (rowid, title, album_artist) VALUES (NEW.id, NEW.title, NEW.album_artist);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_albums_fts_delete AFTER DELETE ON albums
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO albums_fts (albums_fts, rowid, title, album_artist) VALUES ('delete', OLD.id, OLD.title, OLD.album_artist);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    title, content='tracks', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS trg_tracks_fts_insert AFTER INSERT ON tracks
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO tracks_fts (rowid, title) VALUES (NEW.id, NEW.title);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tracks_fts_update AFTER UPDATE OF title ON tracks
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO tracks_fts (tracks_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+    INSERT INTO tracks_fts (rowid, title) VALUES (NEW.id, NEW.title);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tracks_fts_delete AFTER DELETE ON tracks
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO tracks_fts (tracks_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS artist_metadata_fts USING fts5(
+    artist_name, real_name, aliases, members_roles, content='artist_metadata', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS trg_artist_metadata_fts_insert AFTER INSERT ON artist_metadata
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO artist_metadata_fts (rowid, artist_name, real_name, aliases, members_roles) VALUES (NEW.id, NEW.artist_name, NEW.real_name, NEW.aliases, NEW.members_roles);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_artist_metadata_fts_update AFTER UPDATE OF artist_name, real_name, aliases, members_roles ON artist_metadata
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO artist_metadata_fts (artist_metadata_fts, rowid, artist_name, real_name, aliases, members_roles) VALUES ('delete', OLD.id, OLD.artist_name, OLD.real_name, OLD.aliases, OLD.members_roles);
+    INSERT INTO artist_metadata_fts (rowid, artist_name, real_name, aliases, members_roles) VALUES (NEW.id, NEW.artist_name, NEW.real_name, NEW.aliases, NEW.members_roles);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_artist_metadata_fts_delete AFTER DELETE ON artist_metadata
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO artist_metadata_fts (artist_metadata_fts, rowid, artist_name, real_name, aliases, members_roles) VALUES ('delete', OLD.id, OLD.artist_name, OLD.real_name, OLD.aliases, OLD.members_roles);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS album_metadata_fts USING fts5(
+    title, album_artist, descriptors, content='album_metadata', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS trg_album_metadata_fts_insert AFTER INSERT ON album_metadata
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO album_metadata_fts (rowid, title, album_artist, descriptors) VALUES (NEW.id, NEW.title, NEW.album_artist, NEW.descriptors);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_album_metadata_fts_update AFTER UPDATE OF title, album_artist, descriptors ON album_metadata
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO album_metadata_fts (album_metadata_fts, rowid, title, album_artist, descriptors) VALUES ('delete', OLD.id, OLD.title, OLD.album_artist, OLD.descriptors);
+    INSERT INTO album_metadata_fts (rowid, title, album_artist, descriptors) VALUES (NEW.id, NEW.title, NEW.album_artist, NEW.descriptors);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_album_metadata_fts_delete AFTER DELETE ON album_metadata
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO album_metadata_fts (album_metadata_fts, rowid, title, album_artist, descriptors) VALUES ('delete', OLD.id, OLD.title, OLD.album_artist, OLD.descriptors);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS track_metadata_fts USING fts5(
+    title, artist, feat, credits, content='track_metadata', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS trg_track_metadata_fts_insert AFTER INSERT ON track_metadata
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO track_metadata_fts (rowid, title, artist, feat, credits) VALUES (NEW.id, NEW.title, NEW.artist, NEW.feat, NEW.credits);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_track_metadata_fts_update AFTER UPDATE OF title, artist, feat, credits ON track_metadata
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO track_metadata_fts (track_metadata_fts, rowid, title, artist, feat, credits) VALUES ('delete', OLD.id, OLD.title, OLD.artist, OLD.feat, OLD.credits);
+    INSERT INTO track_metadata_fts (rowid, title, artist, feat, credits) VALUES (NEW.id, NEW.title, NEW.artist, NEW.feat, NEW.credits);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_track_metadata_fts_delete AFTER DELETE ON track_metadata
+WHEN (SELECT deferred FROM search_state) = 0
+BEGIN
+    INSERT INTO track_metadata_fts (track_metadata_fts, rowid, title, artist, feat, credits) VALUES ('delete', OLD.id, OLD.title, OLD.artist, OLD.feat, OLD.credits);
+END;
+
+-------- LIBRARY STATISTICS ---------------------
+
+-- Summary tables of the library for constant-time dashboards and browsing (see db.StatsRepository),
+-- kept up to date by the triggers below on ingest, reconcile and aggregation, except while
+-- stats_state.deferred is set (bulk initial scan): they are then recomputed in one pass
+CREATE TABLE IF NOT EXISTS stats_state (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    deferred INTEGER NOT NULL DEFAULT 0, -- 1: triggers off, the summaries need a rebuild
+    version INTEGER NOT NULL DEFAULT 0 -- change counter of the library, bumped by the triggers: invalidates the cached reads
+);
+INSERT OR IGNORE INTO stats_state (id, deferred, version) VALUES (0, 0, 0);
+
+-- counters: ('albums', ''), ('tracks', ''), ('duration_ms', ''), ('artists', ''), ('albums_with_genres', ''),
+-- ('albums_status', metadata_status), ('tracks_format', format)
+CREATE TABLE IF NOT EXISTS library_stats (
+    stat TEXT NOT NULL,
+    key TEXT NOT NULL DEFAULT '',
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (stat, key)
+) WITHOUT ROWID;
+-- totals by album artist (folder name)
+CREATE TABLE IF NOT EXISTS artist_stats (
+    album_artist TEXT PRIMARY KEY,
+    albums INTEGER NOT NULL DEFAULT 0,
+    tracks INTEGER NOT NULL DEFAULT 0,
+    duration_ms INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+-- totals by album, no foreign key: the tracks deleted by the cascade of an album find
+-- their album artist here (the album row is already gone when their triggers run)
+CREATE TABLE IF NOT EXISTS album_stats (
+    album_id INTEGER PRIMARY KEY,
+    album_artist TEXT NOT NULL,
+    tracks INTEGER NOT NULL DEFAULT 0,
+    duration_ms INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_albums_stats_insert AFTER INSERT ON albums
+WHEN (SELECT deferred FROM stats_state) = 0
+BEGIN
+    INSERT INTO library_stats (stat, key, value)
+    SELECT 'artists', '', 1 WHERE NOT EXISTS (SELECT 1 FROM artist_stats WHERE album_artist = COALESCE(NEW.album_artist, ''))
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO library_stats (stat, key, value) VALUES ('albums', '', 1), ('albums_status', COALESCE(NEW.metadata_status, ''), 1)
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO artist_stats (album_artist, albums) VALUES (COALESCE(NEW.album_artist, ''), 1)
+    ON CONFLICT (album_artist) DO UPDATE SET albums = albums + 1;
+    INSERT OR REPLACE INTO album_stats (album_id, album_artist) VALUES (NEW.id, COALESCE(NEW.album_artist, ''));
+    UPDATE stats_state SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_albums_stats_delete AFTER DELETE ON albums
+WHEN (SELECT deferred FROM stats_state) = 0
+BEGIN
+    INSERT INTO library_stats (stat, key, value) VALUES ('albums', '', -1), ('albums_status', COALESCE(OLD.metadata_status, ''), -1)
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    -- its tracks are gone already (cascade), unless foreign keys are off: left to the tracks total only
+    UPDATE artist_stats SET albums = albums - 1,
+        tracks = tracks - COALESCE((SELECT tracks FROM album_stats WHERE album_id = OLD.id), 0),
+        duration_ms = duration_ms - COALESCE((SELECT duration_ms FROM album_stats WHERE album_id = OLD.id), 0)
+    WHERE album_artist = COALESCE(OLD.album_artist, '');
+    INSERT INTO library_stats (stat, key, value)
+    SELECT 'artists', '', -1 WHERE EXISTS (SELECT 1 FROM artist_stats WHERE album_artist = COALESCE(OLD.album_artist, '') AND albums <= 0)
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    DELETE FROM artist_stats WHERE album_artist = COALESCE(OLD.album_artist, '') AND albums <= 0;
+    DELETE FROM album_stats WHERE album_id = OLD.id;
+    UPDATE stats_state SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_albums_stats_status AFTER UPDATE OF metadata_status ON albums
+WHEN (SELECT deferred FROM stats_state) = 0 AND OLD.metadata_status IS NOT NEW.metadata_status
+BEGIN
+    INSERT INTO library_stats (stat, key, value)
+    VALUES ('albums_status', COALESCE(OLD.metadata_status, ''), -1), ('albums_status', COALESCE(NEW.metadata_status, ''), 1)
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_albums_stats_artist AFTER UPDATE OF album_artist ON albums
+WHEN (SELECT deferred FROM stats_state) = 0 AND OLD.album_artist IS NOT NEW.album_artist
+BEGIN
+    -- the album and its tracks move from the old artist to the new one
+    INSERT INTO library_stats (stat, key, value)
+    SELECT 'artists', '', 1 WHERE NOT EXISTS (SELECT 1 FROM artist_stats WHERE album_artist = COALESCE(NEW.album_artist, ''))
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO artist_stats (album_artist, albums, tracks, duration_ms)
+    SELECT COALESCE(NEW.album_artist, ''), 1, tracks, duration_ms FROM album_stats WHERE album_id = NEW.id
+    ON CONFLICT (album_artist) DO UPDATE SET albums = albums + 1, tracks = tracks + excluded.tracks, duration_ms = duration_ms + excluded.duration_ms;
+    UPDATE artist_stats SET albums = albums - 1,
+        tracks = tracks - (SELECT tracks FROM album_stats WHERE album_id = OLD.id),
+        duration_ms = duration_ms - (SELECT duration_ms FROM album_stats WHERE album_id = OLD.id)
+    WHERE album_artist = COALESCE(OLD.album_artist, '');
+    INSERT INTO library_stats (stat, key, value)
+    SELECT 'artists', '', -1 WHERE EXISTS (SELECT 1 FROM artist_stats WHERE album_artist = COALESCE(OLD.album_artist, '') AND albums <= 0)
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    DELETE FROM artist_stats WHERE album_artist = COALESCE(OLD.album_artist, '') AND albums <= 0;
+    UPDATE album_stats SET album_artist = COALESCE(NEW.album_artist, '') WHERE album_id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_albums_stats_version AFTER UPDATE OF title, release_year, album_artist, path, total_tracks, metadata_status ON albums
+WHEN (SELECT deferred FROM stats_state) = 0
+BEGIN
+    UPDATE stats_state SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tracks_stats_insert AFTER INSERT ON tracks
+WHEN (SELECT deferred FROM stats_state) = 0
+BEGIN
+    INSERT INTO library_stats (stat, key, value)
+    VALUES ('tracks', '', 1), ('tracks_format', COALESCE(NEW.format, ''), 1), ('duration_ms', '', COALESCE(NEW.duration_ms, 0))
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    UPDATE album_stats SET tracks = tracks + 1, duration_ms = duration_ms + COALESCE(NEW.duration_ms, 0) WHERE album_id = NEW.album_id;
+    UPDATE artist_stats SET tracks = tracks + 1, duration_ms = duration_ms + COALESCE(NEW.duration_ms, 0)
+    WHERE album_artist = (SELECT album_artist FROM album_stats WHERE album_id = NEW.album_id);
+    UPDATE stats_state SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tracks_stats_delete AFTER DELETE ON tracks
+WHEN (SELECT deferred FROM stats_state) = 0
+BEGIN
+    INSERT INTO library_stats (stat, key, value)
+    VALUES ('tracks', '', -1), ('tracks_format', COALESCE(OLD.format, ''), -1), ('duration_ms', '', -COALESCE(OLD.duration_ms, 0))
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    UPDATE album_stats SET tracks = tracks - 1, duration_ms = duration_ms - COALESCE(OLD.duration_ms, 0) WHERE album_id = OLD.album_id;
+    UPDATE artist_stats SET tracks = tracks - 1, duration_ms = duration_ms - COALESCE(OLD.duration_ms, 0)
+    WHERE album_artist = (SELECT album_artist FROM album_stats WHERE album_id = OLD.album_id);
+    UPDATE stats_state SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tracks_stats_format AFTER UPDATE OF format ON tracks
+WHEN (SELECT deferred FROM stats_state) = 0 AND OLD.format IS NOT NEW.format
+BEGIN
+    INSERT INTO library_stats (stat, key, value) VALUES ('tracks_format', COALESCE(OLD.format, ''), -1), ('tracks_format', COALESCE(NEW.format, ''), 1)
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tracks_stats_album AFTER UPDATE OF album_id, duration_ms ON tracks
+WHEN (SELECT deferred FROM stats_state) = 0 AND (OLD.album_id IS NOT NEW.album_id OR OLD.duration_ms IS NOT NEW.duration_ms)
+BEGIN
+    -- out of the old album (and artist), into the new one
+    INSERT INTO library_stats (stat, key, value) VALUES ('duration_ms', '', COALESCE(NEW.duration_ms, 0) - COALESCE(OLD.duration_ms, 0))
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    UPDATE album_stats SET tracks = tracks - 1, duration_ms = duration_ms - COALESCE(OLD.duration_ms, 0) WHERE album_id = OLD.album_id;
+    UPDATE artist_stats SET tracks = tracks - 1, duration_ms = duration_ms - COALESCE(OLD.duration_ms, 0)
+    WHERE album_artist = (SELECT album_artist FROM album_stats WHERE album_id = OLD.album_id);
+    UPDATE album_stats SET tracks = tracks + 1, duration_ms = duration_ms + COALESCE(NEW.duration_ms, 0) WHERE album_id = NEW.album_id;
+    UPDATE artist_stats SET tracks = tracks + 1, duration_ms = duration_ms + COALESCE(NEW.duration_ms, 0)
+    WHERE album_artist = (SELECT album_artist FROM album_stats WHERE album_id = NEW.album_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tracks_stats_version AFTER UPDATE OF title, path, track_number, disc_number, duration_ms, format, album_id ON tracks
+WHEN (SELECT deferred FROM stats_state) = 0
+BEGIN
+    UPDATE stats_state SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_final_albums_stats_insert AFTER INSERT ON final_albums_metadata
+WHEN (SELECT deferred FROM stats_state) = 0
+BEGIN
+    INSERT INTO library_stats (stat, key, value) VALUES ('albums_with_genres', '', COALESCE(NEW.genres, '') <> '')
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    UPDATE stats_state SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_final_albums_stats_update AFTER UPDATE ON final_albums_metadata
+WHEN (SELECT deferred FROM stats_state) = 0
+BEGIN
+    INSERT INTO library_stats (stat, key, value) VALUES ('albums_with_genres', '', (COALESCE(NEW.genres, '') <> '') - (COALESCE(OLD.genres, '') <> ''))
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    UPDATE stats_state SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_final_albums_stats_delete AFTER DELETE ON final_albums_metadata
+WHEN (SELECT deferred FROM stats_state) = 0
+BEGIN
+    INSERT INTO library_stats (stat, key, value) VALUES ('albums_with_genres', '', -(COALESCE(OLD.genres, '') <> ''))
+    ON CONFLICT (stat, key) DO UPDATE SET value = value + excluded.value;
+    UPDATE stats_state SET version = version + 1;
+END;
+
 -------- FIXED DATA ---------------------
 
 -- sources
@@ -283,25 +734,41 @@ CREATE TABLE IF NOT EXISTS final_tracks_metadata(
 
 
 -- Per ricerche frequenti su nome
-CREATE INDEX idx_artists_name ON artists(name);
-CREATE INDEX idx_albums_title ON albums(title);
-CREATE INDEX idx_tracks_title ON tracks(title);
+CREATE INDEX IF NOT EXISTS idx_artists_name ON artists(name);
+CREATE INDEX IF NOT EXISTS idx_albums_title ON albums(title);
+CREATE INDEX IF NOT EXISTS idx_tracks_title ON tracks(title);
 
 -- Per query su stato dei metadati
-CREATE INDEX idx_artists_metadata_status ON artists(metadata_status);
-CREATE INDEX idx_albums_metadata_status ON albums(metadata_status);
+CREATE INDEX IF NOT EXISTS idx_artists_metadata_status ON artists(metadata_status);
+CREATE INDEX IF NOT EXISTS idx_albums_metadata_status ON albums(metadata_status);
 
 -- Per join frequenti
-CREATE INDEX idx_albums_artist_id ON albums(artist_id);
-CREATE INDEX idx_tracks_album_id ON tracks(album_id);
+CREATE INDEX IF NOT EXISTS idx_albums_artist_id ON albums(artist_id);
+CREATE INDEX IF NOT EXISTS idx_albums_album_artist ON albums(album_artist, release_year);
+CREATE INDEX IF NOT EXISTS idx_tracks_album_id ON tracks(album_id);
+
+-- Per la ricerca dei duplicati
+CREATE INDEX IF NOT EXISTS idx_tracks_fingerprint ON tracks(fingerprint);
 
 -- Per le query API
-CREATE INDEX idx_api_queries_status ON api_queries(status);
+CREATE INDEX IF NOT EXISTS idx_api_queries_status ON api_queries(status);
+CREATE INDEX IF NOT EXISTS idx_api_queries_claim ON api_queries(source_id, status, lease_expires_at);
+CREATE INDEX IF NOT EXISTS idx_api_cache_expires_at ON api_cache(expires_at);
 
 -- Per le ricerche nei metadati
-CREATE INDEX idx_artist_metadata_artist_id ON artist_metadata(artist_id);
-CREATE INDEX idx_album_metadata_album_id ON album_metadata(album_id);
-CREATE INDEX idx_track_metadata_track_id ON track_metadata(track_id);
+CREATE INDEX IF NOT EXISTS idx_artist_metadata_artist_id ON artist_metadata(artist_id);
+CREATE INDEX IF NOT EXISTS idx_album_metadata_album_id ON album_metadata(album_id);
+CREATE INDEX IF NOT EXISTS idx_track_metadata_track_id ON track_metadata(track_id);
+CREATE INDEX IF NOT EXISTS idx_artist_metadata_query_id ON artist_metadata(query_id);
+CREATE INDEX IF NOT EXISTS idx_album_metadata_query_id ON album_metadata(query_id);
+CREATE INDEX IF NOT EXISTS idx_track_metadata_query_id ON track_metadata(query_id);
+
+-- Per l'aggregazione (una riga finale per traccia)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_final_tracks_metadata_track_id ON final_tracks_metadata(track_id);
 
 -- Per la gerarchia dei generi
-CREATE INDEX idx_genres_parent_id ON genres(parent_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_genres_parent_id ON genres(parent_id);
+CREATE INDEX IF NOT EXISTS idx_genre_closure_descendant ON genre_closure(descendant_id, depth);
+
+-- Per la scansione incrementale
+CREATE INDEX IF NOT EXISTS idx_scan_state_parent ON scan_state(parent);
\ No newline at end of file
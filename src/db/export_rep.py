@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from typing import List, Iterator, Tuple
+from .base_rep import BaseRepository, DEFAULT_ARRAYSIZE
+
+# page cache of the connection while streaming (KiB): a full scan reads every page once,
+# the default cache and memory map would only grow the process
+STREAM_CACHE_KIB = 8192
+
+# export name -> query (column aliases are the exported field names), every one in ID order;
+# artists as in TrackRepository.get_final_tags (names, never the 'Unknown Artist' placeholder)
+EXPORT_QUERIES = {
+    'albums': """
+        SELECT id, artist_id, title, release_year, album_artist, total_tracks, path, metadata_status, created_at, updated_at
+        FROM albums ORDER BY id
+    """,
+    'tracks': """
+        SELECT id, album_id, title, path, duration_ms, fingerprint, file_size, audio_size,
+            track_number, disc_number, format, created_at, updated_at
+        FROM tracks ORDER BY id
+    """,
+    'final_artists': """
+        SELECT artist_id, name, country, metadata_status FROM final_artists_metadata ORDER BY artist_id
+    """,
+    'final_albums': """
+        SELECT fa.album_id, fa.title, fa.year, fa.genres, fa.styles, fa.metadata_status, fa.album_artist_id,
+            NULLIF(COALESCE(fa.album_artist, a.album_artist), placeholder.name) AS album_artist
+        FROM final_albums_metadata fa
+        JOIN albums a ON a.id = fa.album_id
+        LEFT JOIN artists placeholder ON placeholder.id = 0
+        ORDER BY fa.album_id
+    """,
+    'final_tracks': """
+        SELECT ft.track_id, ft.album_id, ft.title, ft.track_number, ft.metadata_status, ft.track_artist_id,
+            NULLIF(COALESCE(ft.artist, fa.album_artist, a.album_artist), placeholder.name) AS artist
+        FROM final_tracks_metadata ft
+        JOIN albums a ON a.id = ft.album_id
+        LEFT JOIN final_albums_metadata fa ON fa.album_id = ft.album_id
+        LEFT JOIN artists placeholder ON placeholder.id = 0
+        ORDER BY ft.id
+    """,
+}
+EXPORT_TABLES = tuple(EXPORT_QUERIES)
+
+class ExportRepository(BaseRepository):
+    """Streaming reads of the library for bulk exports (constant memory, see BaseRepository._iter_batches)"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+
+
+    @contextmanager
+    def low_memory(self) -> Iterator[None]:
+        """Small page cache and no memory map on the connection of the thread, restored on exit"""
+        cache_size = self._fetch_one("PRAGMA cache_size")['cache_size']
+        mmap_size = self._fetch_one("PRAGMA mmap_size")['mmap_size']
+        self._execute(f"PRAGMA cache_size = -{STREAM_CACHE_KIB}")
+        self._execute("PRAGMA mmap_size = 0")
+        try:
+            yield
+        finally:
+            self._execute(f"PRAGMA cache_size = {cache_size}")
+            self._execute(f"PRAGMA mmap_size = {mmap_size}")
+
+    def columns(self, table: str) -> List[str]:
+        """Field names of an export, in row order (the query is prepared, not run)"""
+        cursor = self._execute(f"SELECT * FROM ({EXPORT_QUERIES[table]}) LIMIT 0")
+        return [column[0] for column in cursor.description]
+
+    def batches(self, table: str, arraysize: int = DEFAULT_ARRAYSIZE) -> Iterator[List[Tuple]]:
+        """Rows of an export as tuples, in lists of at most `arraysize` rows"""
+        return self._iter_batches(EXPORT_QUERIES[table], arraysize=arraysize, row_type='tuple')
+
+    def json_batches(self, table: str, arraysize: int = DEFAULT_ARRAYSIZE) -> Iterator[List[Tuple[str]]]:
+        """
+        Rows of an export as JSON objects encoded by SQLite (json_object: no Python
+        dict or encoder per row), 1-tuples in lists of at most `arraysize` rows.
+        """
+        fields = ', '.join(f"'{name}', \"{name}\"" for name in self.columns(table))
+        query = f"SELECT json_object({fields}) FROM ({EXPORT_QUERIES[table]})"
+        return self._iter_batches(query, arraysize=arraysize, row_type='tuple')
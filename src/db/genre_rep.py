@@ -0,0 +1,106 @@
+from typing import List, Dict, Any, Iterable
+from .base_rep import BaseRepository
+
+class GenreRepository(BaseRepository):
+    """Genre tree lookups backed by the genre_closure table (no recursive queries)"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+
+
+    def get_genres(self) -> List[Dict[str, Any]]:
+        """Every genre of the tree (dummy root excluded)"""
+        return self._fetch_all("SELECT id, name, parent_id FROM genres WHERE id != 0")
+
+    def get_genre_ids(self, name: str) -> List[int]:
+        """IDs of the genres with a name (the same name may sit under different parents)"""
+        rows = self._fetch_all("SELECT id FROM genres WHERE name = ? AND id != 0 ORDER BY id", (name,))
+        return [row['id'] for row in rows]
+
+    def subtree(self, genre_id: int, max_depth: int = None, include_self: bool = True) -> List[Dict[str, Any]]:
+        """
+        Descendants of a genre.
+
+        Args:
+            genre_id: root of the subtree
+            max_depth: only descendants up to this many levels below (all if None)
+            include_self: include the genre itself (depth 0)
+
+        Returns:
+            list: {'id', 'name', 'parent_id', 'depth'} rows, shallowest first
+        """
+        query = """
+            SELECT g.id, g.name, g.parent_id, c.depth
+            FROM genre_closure c JOIN genres g ON g.id = c.descendant_id
+            WHERE c.ancestor_id = ? AND c.depth BETWEEN ? AND ?
+            ORDER BY c.depth, g.name
+        """
+        max_depth = max_depth if max_depth is not None else 2**31
+        return self._fetch_all(query, (genre_id, 0 if include_self else 1, max_depth))
+
+    def ancestors(self, genre_id: int, include_self: bool = False) -> List[Dict[str, Any]]:
+        """
+        Path from the main genre down to a genre.
+
+        Returns:
+            list: {'id', 'name', 'parent_id', 'depth'} rows, main genre first
+        """
+        query = """
+            SELECT g.id, g.name, g.parent_id, c.depth
+            FROM genre_closure c JOIN genres g ON g.id = c.ancestor_id
+            WHERE c.descendant_id = ? AND c.depth >= ?
+            ORDER BY c.depth DESC
+        """
+        return self._fetch_all(query, (genre_id, 0 if include_self else 1))
+
+    def is_subgenre(self, child: str, parent: str) -> bool:
+        """Check if (any genre named) child is a subgenre, at any depth, of (any genre named) parent"""
+        query = """
+            SELECT 1
+            FROM genres p
+            JOIN genre_closure c ON c.ancestor_id = p.id AND c.depth > 0
+            JOIN genres d ON d.id = c.descendant_id
+            WHERE p.name = ? AND d.name = ?
+            LIMIT 1
+        """
+        return self._fetch_one(query, (parent, child)) is not None
+
+    def main_genres(self, genre_ids: Iterable[int]) -> Dict[int, List[int]]:
+        """
+        Roll genres up to their main (top-level) genres.
+
+        Returns:
+            dict: genre id -> main genre ids (several if the genre name sits under different trees)
+        """
+        ids = list(dict.fromkeys(genre_ids))
+        if not ids:
+            return {}
+        query = f"""
+            SELECT c.descendant_id, c.ancestor_id
+            FROM genre_closure c JOIN genres g ON g.id = c.ancestor_id
+            WHERE g.parent_id = 0 AND c.descendant_id IN ({', '.join(['?'] * len(ids))})
+        """
+        rollup = {genre_id: [] for genre_id in ids}
+        for row in self._execute(query, tuple(ids)).fetchall():
+            rollup[row[0]].append(row[1])
+        return rollup
+
+    def album_main_genres(self) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Main genres of every album with genre metadata, in a single join.
+
+        Returns:
+            dict: album id -> {'id', 'name', 'hits'} rows, most cited main genre first
+        """
+        query = """
+            SELECT am.album_id, g.id, g.name, COUNT(*) AS hits
+            FROM album_genres_metadata agm
+            JOIN album_metadata am ON am.id = agm.metadata_id
+            JOIN genre_closure c ON c.descendant_id = agm.genre_id
+            JOIN genres g ON g.id = c.ancestor_id AND g.parent_id = 0
+            GROUP BY am.album_id, g.id
+            ORDER BY am.album_id, hits DESC, g.name
+        """
+        albums = {}
+        for row in self._fetch_all(query):
+            albums.setdefault(row['album_id'], []).append({'id': row['id'], 'name': row['name'], 'hits': row['hits']})
+        return albums
@@ -1,6 +1,11 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterable, Callable, Tuple
+from itertools import batched
+from core import AlbumData, TrackBatch, profiler
 from .track_rep import ArtistRepository, AlbumRepository, TrackRepository
 
+# albums written per transaction by the bulk ingest
+DEFAULT_BATCH_SIZE = 1000
+
 class MusicRepository:
     def __init__(self, db_path: str):
         self.artist_repo = ArtistRepository(db_path)
@@ -19,3 +24,69 @@ class MusicRepository:
         self.track_repo.new_tracklist(album_data.tracklist, album_id)
         print(f"Tracks initialized")
         return album_id
+
+    def transaction(self, immediate: bool = False):
+        """Transaction scope shared by the artist, album and track repositories"""
+        return self.album_repo.transaction(immediate=immediate)
+
+    def bulk_ingest(self, albums: Iterable[AlbumData], batch_size: int = DEFAULT_BATCH_SIZE, skip_existing: bool = False,
+                    progress: Optional[Callable[[int, int, int, List[str]], None]] = None) -> Tuple[List[int], List[str]]:
+        """
+        Insert many albums with their tracklists on a single connection,
+        one transaction (and one commit) every `batch_size` albums.
+
+        Args:
+            albums: iterable of Album dataclass instances (consumed lazily)
+            batch_size: albums per transaction
+            skip_existing: ignore albums whose path is already in the database, and leave out
+                the albums whose title is taken by another album (title conflicts)
+            progress: called after every commit with (albums read, albums written, tracks written,
+                title conflicts) of the batch
+
+        Returns:
+            tuple: IDs of the new albums in input order, paths of the title conflicts
+        """
+        album_ids = []
+        conflicts = []
+        for batch in batched(albums, batch_size):
+            with profiler.stage('ingest.batch'), self.transaction() as conn:
+                batch_conflicts = self.album_repo.title_conflicts(batch, conn=conn) if skip_existing else []
+                if batch_conflicts:
+                    excluded = set(batch_conflicts)
+                    to_insert = [album for album in batch if album.path not in excluded]
+                else:
+                    to_insert = batch
+                ids = self.album_repo.new_albums(to_insert, conn=conn, skip_existing=skip_existing)
+                tracks = self.track_repo.insert_batch(TrackBatch.from_albums(to_insert), ids, conn=conn)
+            new = [album_id for album_id in ids if album_id is not None]
+            album_ids.extend(new)
+            conflicts.extend(batch_conflicts)
+            profiler.count('ingest.albums', rows=len(new))
+            profiler.count('ingest.tracks', rows=tracks)
+            if progress:
+                progress(len(batch), len(new), tracks, batch_conflicts)
+        return album_ids, conflicts
+
+    def add_tracks(self, album: AlbumData) -> int:
+        """
+        Insert the tracks of an album already in the database whose path is not known yet
+        (e.g. files that landed after the album was ingested), and update its total_tracks.
+
+        Args:
+            album: Album dataclass instance (path of the album folder, tracklist on disk)
+
+        Returns:
+            int: number of tracks inserted (0 if the album is not in the database)
+        """
+        with self.transaction() as conn:
+            row = conn.execute("SELECT id FROM albums WHERE path = ?", (album.path,)).fetchone()
+            if row is None:
+                return 0
+            known = {path for (path,) in conn.execute("SELECT path FROM tracks WHERE album_id = ?", (row[0],))}
+            batch = TrackBatch()
+            batch.add_album(0, [track for track in album.tracklist or () if track.path not in known])
+            tracks = self.track_repo.insert_batch(batch, [row[0]], conn=conn)
+            if tracks:
+                conn.execute("UPDATE albums SET total_tracks = (SELECT COUNT(*) FROM tracks WHERE album_id = ?) WHERE id = ?",
+                             (row[0], row[0]))
+        return tracks
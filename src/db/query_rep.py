@@ -0,0 +1,192 @@
+import json
+import os
+import socket
+import time
+import uuid
+from itertools import batched
+from typing import List, Dict, Any, Iterable, Optional
+from .base_rep import BaseRepository
+
+# claims of a query before it is dead-lettered
+DEFAULT_MAX_ATTEMPTS = 5
+# seconds before a query failed for a transient error can be claimed again
+DEFAULT_RETRY_DELAY = 300
+# ids per statement in the lease updates
+CHUNK_SIZE = 500
+
+def make_worker_id() -> str:
+    """Unique id of a fetch process: host, pid and a random suffix"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class QueryRepository(BaseRepository):
+    """Metadata search tasks (api_queries) and their sources"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+
+
+    def get_sources(self) -> List[Dict[str, Any]]:
+        """Every metadata source (id, name, base_url)"""
+        return self._fetch_all("SELECT id, name, base_url FROM sources ORDER BY id")
+
+    def enqueue(self, queries: List[Dict[str, Any]]) -> int:
+        """
+        Add pending queries, ignoring the ones already queued for the same entity and source.
+
+        Args:
+            queries: {'entity_type', 'entity_id', 'source_id', 'endpoint', 'parameters'} rows
+                (parameters as a dictionary, stored as JSON)
+
+        Returns:
+            int: number of new queries
+        """
+        rows = [
+            {**query, 'parameters': json.dumps(query.get('parameters') or {}, sort_keys=True)}
+            for query in queries
+        ]
+        if not rows:
+            return 0
+        ids = self._insert_many('api_queries', rows, on_conflict="(entity_type, entity_id, source_id) DO NOTHING")
+        return len(ids)
+
+    def claim(self, worker_id: str, source_ids: Iterable[int], limit: int, lease_seconds: float, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> List[Dict[str, Any]]:
+        """
+        Atomically claim a batch of queries for a worker (safe with concurrent processes).
+
+        Pending queries and in-progress queries whose lease expired (crashed worker) are
+        claimed with a single UPDATE ... RETURNING under the write lock: no query is handed
+        to two workers. Expired queries already claimed max_attempts times are dead-lettered.
+
+        Args:
+            worker_id: id of the claiming process (see make_worker_id)
+            source_ids: sources to drain
+            limit: max queries claimed
+            lease_seconds: time the worker has to complete (or renew) the queries
+            max_attempts: claims allowed before a query is dead-lettered
+
+        Returns:
+            list: claimed rows (parameters decoded), by id
+        """
+        source_ids = list(source_ids)
+        if not source_ids or limit <= 0:
+            return []
+        in_sources = ', '.join(['?'] * len(source_ids))
+        now = time.time()
+        dead_letter = f"""
+            UPDATE api_queries SET status = 'dead', worker_id = NULL, lease_expires_at = NULL,
+                last_error = COALESCE(last_error, 'lease expired'), updated_at = CURRENT_TIMESTAMP
+            WHERE source_id IN ({in_sources}) AND status = 'in_progress' AND lease_expires_at < ? AND attempts >= ?
+        """
+        claim = f"""
+            UPDATE api_queries SET status = 'in_progress', worker_id = ?, lease_expires_at = ?,
+                attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM api_queries
+                WHERE source_id IN ({in_sources})
+                    AND (status = 'pending' OR (status = 'in_progress' AND lease_expires_at < ?))
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, entity_type, entity_id, source_id, endpoint, parameters, attempts
+        """
+        with self.transaction(immediate=True) as conn:
+            conn.execute(dead_letter, (*source_ids, now, max_attempts))
+            rows = conn.execute(claim, (worker_id, now + lease_seconds, *source_ids, now, limit)).fetchall()
+        claimed = [dict(row, parameters=json.loads(row['parameters'] or '{}')) for row in rows]
+        claimed.sort(key=lambda row: row['id'])
+        return claimed
+
+    def extend_leases(self, worker_id: str, ids: Iterable[int], lease_seconds: float) -> int:
+        """Renew the leases of queries still held by a worker, returning how many it still holds"""
+        ids = list(ids)
+        if not ids:
+            return 0
+        renewed = 0
+        for chunk in batched(ids, CHUNK_SIZE):
+            query = f"""
+                UPDATE api_queries SET lease_expires_at = ?
+                WHERE worker_id = ? AND status = 'in_progress' AND id IN ({', '.join(['?'] * len(chunk))})
+            """
+            renewed += self._execute(query, (time.time() + lease_seconds, worker_id, *chunk)).rowcount
+        return renewed
+
+    def complete(self, worker_id: str, results: List[Dict[str, Any]], max_attempts: int = DEFAULT_MAX_ATTEMPTS, retry_delay: float = DEFAULT_RETRY_DELAY) -> int:
+        """
+        Store the outcome of finished queries in one transaction. Queries no longer
+        held by the worker (lease expired and claimed by another one) are left alone.
+
+        Args:
+            worker_id: id of the worker that claimed the queries
+            results: {'id', 'status', 'response_data'} rows, status:
+                'done' | 'error' (permanent failure) | 'retry' (transient failure: claimable
+                again after retry_delay, or dead-lettered after max_attempts claims)
+            max_attempts: claims allowed before a query is dead-lettered
+            retry_delay: seconds before a transient failure can be claimed again
+
+        Returns:
+            int: number of results stored
+        """
+        if not results:
+            return 0
+        query = """
+            UPDATE api_queries SET
+                -- a transient failure stays in progress with nobody holding it: claimable once the lease expires
+                status = CASE WHEN :status != 'retry' THEN :status WHEN attempts >= :max_attempts THEN 'dead' ELSE 'in_progress' END,
+                response_data = CASE WHEN :status = 'done' THEN :response_data ELSE response_data END,
+                last_error = CASE WHEN :status = 'done' THEN NULL ELSE :error END,
+                lease_expires_at = CASE WHEN :status = 'retry' AND attempts < :max_attempts THEN :retry_at END,
+                worker_id = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id AND worker_id = :worker_id AND status = 'in_progress'
+        """
+        params = [
+            {
+                'id': result['id'],
+                'status': result['status'],
+                'response_data': json.dumps(result['response_data']) if result['status'] == 'done' else None,
+                'error': result.get('error'),
+                'worker_id': worker_id,
+                'max_attempts': max_attempts,
+                'retry_at': time.time() + retry_delay,
+            }
+            for result in results
+        ]
+        stored = 0
+        with self.transaction() as conn:
+            for param in params:
+                stored += conn.execute(query, param).rowcount
+        return stored
+
+    def release(self, worker_id: str, ids: Iterable[int]) -> int:
+        """Give back claimed queries not processed (e.g. interrupted run): pending again, attempt not counted"""
+        ids = list(ids)
+        released = 0
+        for chunk in batched(ids, CHUNK_SIZE):
+            query = f"""
+                UPDATE api_queries SET status = 'pending', worker_id = NULL, lease_expires_at = NULL,
+                    attempts = MAX(attempts - 1, 0), updated_at = CURRENT_TIMESTAMP
+                WHERE worker_id = ? AND status = 'in_progress' AND id IN ({', '.join(['?'] * len(chunk))})
+            """
+            released += self._execute(query, (worker_id, *chunk)).rowcount
+        return released
+
+    def requeue(self, source_ids: Iterable[int], statuses: Iterable[str] = ('done', 'error'), reset_attempts: bool = True) -> int:
+        """Put finished queries of some sources back to pending (to fetch them again)"""
+        source_ids, statuses = list(source_ids), list(statuses)
+        if not source_ids or not statuses:
+            return 0
+        query = f"""
+            UPDATE api_queries SET status = 'pending', updated_at = CURRENT_TIMESTAMP{', attempts = 0, last_error = NULL' if reset_attempts else ''}
+            WHERE source_id IN ({', '.join(['?'] * len(source_ids))}) AND status IN ({', '.join(['?'] * len(statuses))})
+        """
+        cursor = self._execute(query, (*source_ids, *statuses))
+        return cursor.rowcount
+
+    def count_by_status(self, source_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """Number of queries per status (of some sources, all if None)"""
+        if source_ids is None:
+            rows = self._fetch_all("SELECT status, COUNT(*) AS n FROM api_queries GROUP BY status")
+        else:
+            source_ids = list(source_ids)
+            if not source_ids:
+                return {}
+            query = f"SELECT status, COUNT(*) AS n FROM api_queries WHERE source_id IN ({', '.join(['?'] * len(source_ids))}) GROUP BY status"
+            rows = self._fetch_all(query, tuple(source_ids))
+        return {row['status']: row['n'] for row in rows}
@@ -0,0 +1,143 @@
+import sqlite3
+from typing import List, Dict, Any, Iterable, Tuple
+from core import AlbumData, TrackData, TrackBatch
+from .base_rep import BaseRepository
+from .track_rep import AlbumRepository, TrackRepository
+
+# rows of the metadata tables (and their genres) to delete with an entity, in delete order
+_ENTITY_METADATA = {
+    'track': ('track_genres_metadata', 'track_metadata'),
+    'album': ('album_genres_metadata', 'album_metadata'),
+}
+
+class ReconcileRepository(BaseRepository):
+    """Renames, moves, deletions and additions of albums and tracks, applied in place (IDs kept)"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+        self.album_repo = AlbumRepository(db_path)
+        self.track_repo = TrackRepository(db_path)
+
+
+    def get_albums(self) -> List[Dict[str, Any]]:
+        return self._fetch_all("SELECT id, path, title, artist_id FROM albums")
+
+    def get_tracks(self) -> List[Dict[str, Any]]:
+        """Path, album and stored file identity of every track"""
+        return self._fetch_all("SELECT id, album_id, path, fingerprint, file_size, file_inode, file_device FROM tracks")
+
+    def apply(self, album_moves: List[Dict[str, Any]], track_moves: List[Dict[str, Any]],
+              track_deletes: Iterable[int], album_deletes: Iterable[int],
+              new_albums: List[AlbumData], new_tracks: List[Tuple[str, TrackData]],
+              identities: List[Tuple[int, int, int]]) -> Dict[str, int]:
+        """
+        Apply a reconciliation in one transaction, with set-based statements. Moved rows keep
+        their ID, so the fetched metadata, the queries and the final metadata stay attached.
+
+        Args:
+            album_moves: dicts with id, path, title, release_year, album_artist
+            track_moves: dicts with id, album_path (new or existing album), path, title, format
+            track_deletes: IDs of the tracks whose file is gone (their metadata goes too)
+            album_deletes: IDs of the albums whose folder is gone (tracks already moved or deleted)
+            new_albums: albums to insert (tracks come from new_tracks)
+            new_tracks: (album path, track) of the new files
+            identities: (inode, device, track id) of the tracks whose file identity changed
+
+        Returns:
+            dict: rows changed by kind
+        """
+        counts = {}
+        album_deletes = list(album_deletes)
+        with self.transaction(immediate=True) as conn:
+            # free the old paths and album titles first: renames may swap them, new albums may reuse them
+            self._execute_many("UPDATE albums SET title = char(0) || id WHERE id = ?", [(album_id,) for album_id in album_deletes], conn=conn)
+            self._load(conn, 'rc_album_moves', ('id', 'path', 'title', 'release_year', 'album_artist'), album_moves)
+            self._load(conn, 'rc_track_moves', ('id', 'album_path', 'path', 'title', 'format'), track_moves)
+            conn.execute("UPDATE albums SET path = char(0) || id, title = char(0) || id WHERE id IN (SELECT id FROM temp.rc_album_moves)")
+            conn.execute("UPDATE tracks SET path = char(0) || id WHERE id IN (SELECT id FROM temp.rc_track_moves)")
+
+            counts['tracks_removed'] = self._delete_entities(conn, 'track', 'tracks', track_deletes)
+
+            counts['albums_moved'] = conn.execute("""
+                UPDATE albums SET path = m.path, title = m.title, release_year = m.release_year,
+                    album_artist = m.album_artist, updated_at = CURRENT_TIMESTAMP
+                FROM temp.rc_album_moves m WHERE m.id = albums.id
+            """).rowcount
+            # renamed albums: the final metadata falls back on the folder title
+            conn.execute("INSERT OR IGNORE INTO metadata_changes (entity_type, entity_id) SELECT 'album', id FROM temp.rc_album_moves")
+
+            ids = self.album_repo.new_albums(new_albums, conn=conn, skip_existing=True)
+            counts['albums_added'] = sum(album_id is not None for album_id in ids)
+
+            counts['tracks_moved'] = conn.execute("""
+                UPDATE tracks SET album_id = a.id, path = m.path, title = m.title, format = m.format, updated_at = CURRENT_TIMESTAMP
+                FROM temp.rc_track_moves m JOIN albums a ON a.path = m.album_path
+                WHERE m.id = tracks.id
+            """).rowcount
+            conn.execute("""
+                UPDATE final_tracks_metadata SET album_id = t.album_id
+                FROM tracks t WHERE t.id = final_tracks_metadata.track_id
+                    AND t.id IN (SELECT id FROM temp.rc_track_moves) AND final_tracks_metadata.album_id <> t.album_id
+            """)
+
+            album_ids = {row['path']: row['id'] for row in self._album_ids(conn, {path for path, _ in new_tracks})}
+            batch = TrackBatch()
+            album_index: Dict[str, int] = {}
+            for album_path, track in new_tracks:
+                batch.add_album(album_index.setdefault(album_path, len(album_index)), [track])
+            counts['tracks_added'] = self.track_repo.insert_batch(batch, [album_ids.get(path) for path in album_index], conn=conn)
+
+            counts['albums_removed'] = self._delete_entities(conn, 'album', 'albums', album_deletes)
+
+            self._execute_many("UPDATE tracks SET file_inode = ?, file_device = ? WHERE id = ?", identities, conn=conn)
+            conn.execute("""
+                UPDATE albums SET total_tracks = c.n
+                FROM (SELECT album_id, COUNT(*) AS n FROM tracks GROUP BY album_id) c
+                WHERE c.album_id = albums.id AND albums.total_tracks IS NOT c.n
+            """)
+            if any(counts.values()):
+                # folder states are stale: the next incremental scan lists the library again
+                conn.execute("DELETE FROM scan_state")
+
+            conn.execute("DROP TABLE temp.rc_album_moves")
+            conn.execute("DROP TABLE temp.rc_track_moves")
+        return counts
+
+    @staticmethod
+    def _load(conn: sqlite3.Connection, table: str, columns: Tuple[str, ...], rows: List[Dict[str, Any]]) -> None:
+        """Fill a temporary table with the rows (dicts with the columns)"""
+        conn.execute(f"DROP TABLE IF EXISTS temp.{table}")
+        conn.execute(f"CREATE TEMP TABLE {table} ({', '.join(columns)}, PRIMARY KEY ({columns[0]}))")
+        placeholders = ', '.join(f':{column}' for column in columns)
+        conn.executemany(f"INSERT INTO temp.{table} VALUES ({placeholders})", rows)
+
+    @staticmethod
+    def _delete_entities(conn: sqlite3.Connection, entity: str, table: str, ids: Iterable[int]) -> int:
+        """Delete entities with their fetched metadata and queries"""
+        conn.execute("DROP TABLE IF EXISTS temp.rc_deleted")
+        conn.execute("CREATE TEMP TABLE rc_deleted (id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO temp.rc_deleted VALUES (?)", ((entity_id,) for entity_id in ids))
+        genres_table, metadata_table = _ENTITY_METADATA[entity]
+        conn.execute(f"""
+            DELETE FROM {genres_table} WHERE metadata_id IN (
+                SELECT id FROM {metadata_table} WHERE {entity}_id IN (SELECT id FROM temp.rc_deleted)
+            )
+        """)
+        conn.execute(f"DELETE FROM {metadata_table} WHERE {entity}_id IN (SELECT id FROM temp.rc_deleted)")
+        conn.execute(f"DELETE FROM api_queries WHERE entity_type = '{entity}' AND entity_id IN (SELECT id FROM temp.rc_deleted)")
+        if entity == 'album':
+            # tracks left in a deleted album (none when the plan moved or deleted them all)
+            conn.execute("DELETE FROM final_tracks_metadata WHERE album_id IN (SELECT id FROM temp.rc_deleted)")
+        deleted = conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM temp.rc_deleted)").rowcount
+        conn.execute("DROP TABLE temp.rc_deleted")
+        return deleted
+
+    @staticmethod
+    def _album_ids(conn: sqlite3.Connection, paths: set) -> List[sqlite3.Row]:
+        if not paths:
+            return []
+        conn.execute("DROP TABLE IF EXISTS temp.rc_paths")
+        conn.execute("CREATE TEMP TABLE rc_paths (path TEXT PRIMARY KEY)")
+        conn.executemany("INSERT INTO temp.rc_paths VALUES (?)", ((path,) for path in paths))
+        rows = conn.execute("SELECT a.id, a.path FROM albums a JOIN temp.rc_paths p ON p.path = a.path").fetchall()
+        conn.execute("DROP TABLE temp.rc_paths")
+        return rows
@@ -0,0 +1,44 @@
+from typing import List, Dict, Any, Iterable
+from .base_rep import BaseRepository
+
+class ScanStateRepository(BaseRepository):
+    """Directory state manifest used by the incremental scan"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+
+
+    def get_states(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Load the whole manifest.
+
+        Returns:
+            dict: directory path -> stored state row
+        """
+        rows = self._fetch_all("SELECT path, kind, parent, mtime_ns, inode, entry_count, audio_digest, is_album FROM scan_state")
+        return {row['path']: row for row in rows}
+
+    def save_states(self, states: List[Dict[str, Any]]) -> None:
+        """Insert or replace directory states (same keys for every row)"""
+        if not states:
+            return
+        query = """
+            INSERT INTO scan_state (path, kind, parent, mtime_ns, inode, entry_count, audio_digest, is_album, updated_at)
+            VALUES (:path, :kind, :parent, :mtime_ns, :inode, :entry_count, :audio_digest, :is_album, CURRENT_TIMESTAMP)
+            ON CONFLICT(path) DO UPDATE SET
+                kind = excluded.kind,
+                parent = excluded.parent,
+                mtime_ns = excluded.mtime_ns,
+                inode = excluded.inode,
+                entry_count = excluded.entry_count,
+                audio_digest = excluded.audio_digest,
+                is_album = excluded.is_album,
+                updated_at = excluded.updated_at
+        """
+        self._execute_many(query, states, commit=True)
+
+    def delete_states(self, paths: Iterable[str]) -> None:
+        """Remove directories (and their children for artists) from the manifest"""
+        params = [(path, path) for path in paths]
+        if not params:
+            return
+        self._execute_many("DELETE FROM scan_state WHERE path = ? OR parent = ?", params, commit=True)
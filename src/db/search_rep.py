@@ -0,0 +1,140 @@
+import re
+import sqlite3
+from typing import List, Dict, Any, Optional, Iterable
+from .base_rep import BaseRepository
+
+# kind -> (index on the names, index on the metadata text, metadata table, its column holding the entity id)
+SEARCH_INDEXES = {
+    'artist': ('artists_fts', 'artist_metadata_fts', 'artist_metadata', 'artist_id'),
+    'album': ('albums_fts', 'album_metadata_fts', 'album_metadata', 'album_id'),
+    'track': ('tracks_fts', 'track_metadata_fts', 'track_metadata', 'track_id'),
+}
+SEARCH_KINDS = tuple(SEARCH_INDEXES)
+
+# bm25 weight of a hit in the metadata text of a source, against a hit in the name
+METADATA_WEIGHT = 0.5
+
+DEFAULT_SEARCH_LIMIT = 20
+
+# matches of an index ranked at most (ranking is linear in the matches)
+RANK_CAP = 2000
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+class SearchRepository(BaseRepository):
+    """FTS5 search over artists, albums, tracks and the text of their per-source metadata"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+
+
+    def search(self, text: str, kinds: Optional[Iterable[str]] = None, limit: int = DEFAULT_SEARCH_LIMIT) -> List[Dict[str, Any]]:
+        """
+        Ranked search: every word of the text must match (as a prefix, case and diacritics
+        ignored) the name of the entity or the metadata text of one of its sources.
+
+        Args:
+            text: free text, e.g. 'beatl abbey'
+            kinds: restrict to 'artist', 'album' and/or 'track' (default: all)
+            limit: max number of results
+
+        Returns:
+            list: dicts with kind, id, name, context (album artist / album), path, rank and
+                matched ('name' or 'metadata'), best first
+        """
+        query = fts_query(text)
+        kinds = [kind for kind in SEARCH_KINDS if kinds is None or kind in kinds]
+        if not query or not kinds:
+            return []
+        if self.is_deferred():
+            self.rebuild()
+
+        hits = []
+        for kind in kinds:
+            names_fts, metadata_fts, metadata_table, entity_column = SEARCH_INDEXES[kind]
+            # every index returns its own best `limit` hits (ORDER BY rank LIMIT: FTS5 keeps only those in memory)
+            order = self._order(names_fts, query)
+            hits.append(f"SELECT * FROM (SELECT '{kind}' AS kind, rowid AS id, rank, 'name' AS matched "
+                        f"FROM {names_fts} WHERE {names_fts} MATCH :query ORDER BY {order} LIMIT :limit)")
+            order = self._order(metadata_fts, query)
+            hits.append(f"SELECT * FROM (SELECT '{kind}', m.{entity_column}, f.rank * {METADATA_WEIGHT}, 'metadata' "
+                        f"FROM {metadata_fts} f JOIN {metadata_table} m ON m.id = f.rowid "
+                        f"WHERE {metadata_fts} MATCH :query ORDER BY f.{order} LIMIT :limit)")
+        # rank is bm25: negative, lower is better; the best hit of every entity
+        rows = self._fetch_all(f"""
+            WITH hits AS ({' UNION ALL '.join(hits)})
+            SELECT kind, id, MIN(rank) AS rank, matched FROM hits
+            WHERE NOT (kind = 'artist' AND id = 0)
+            GROUP BY kind, id ORDER BY rank LIMIT :limit
+        """, {'query': query, 'limit': limit})
+
+        details = {}
+        for kind in kinds:
+            ids = [row['id'] for row in rows if row['kind'] == kind]
+            if ids:
+                details.update(((kind, row['id']), row) for row in self._details(kind, ids))
+        results = []
+        for row in rows:
+            detail = details.get((row['kind'], row['id']))
+            if detail is not None:
+                results.append({**row, 'name': detail['name'], 'context': detail['context'], 'path': detail['path']})
+        return results
+
+    def _order(self, fts: str, query: str) -> str:
+        """
+        Ranked order, unless the query matches more than RANK_CAP rows of the index: bm25 is computed
+        for every match, so very broad queries ('the', 'a') take the first matches in index order.
+        """
+        row = self._fetch_one(f"SELECT COUNT(*) AS n FROM (SELECT 1 FROM {fts} WHERE {fts} MATCH ? LIMIT {RANK_CAP})", (query,))
+        return 'rank' if row['n'] < RANK_CAP else 'rowid'
+
+    def _details(self, kind: str, ids: List[int]) -> List[Dict[str, Any]]:
+        """Display fields of the entities found"""
+        placeholders = ', '.join('?' * len(ids))
+        if kind == 'artist':
+            query = f"SELECT id, name, NULL AS context, NULL AS path FROM artists WHERE id IN ({placeholders})"
+        elif kind == 'album':
+            query = f"""
+                SELECT id, release_year || ' - ' || title AS name, album_artist AS context, path
+                FROM albums WHERE id IN ({placeholders})
+            """
+        else:
+            query = f"""
+                SELECT t.id, t.title AS name, a.album_artist || ' - ' || a.title AS context, t.path
+                FROM tracks t JOIN albums a ON a.id = t.album_id WHERE t.id IN ({placeholders})
+            """
+        return self._fetch_all(query, tuple(ids))
+
+    #------------ INDEX MAINTENANCE -----------#
+
+    def is_deferred(self) -> bool:
+        """True while the sync triggers are off (the indexes are stale until rebuilt)"""
+        row = self._fetch_one("SELECT deferred FROM search_state")
+        return bool(row and row['deferred'])
+
+    def defer_if_empty(self) -> bool:
+        """
+        Turn the sync triggers off if the library is empty: an initial scan inserts
+        without indexing and rebuilds the indexes once at the end (see rebuild).
+
+        Returns:
+            bool: True if indexing was deferred by this call (the caller rebuilds)
+        """
+        with self.transaction(immediate=True) as conn:
+            return conn.execute("UPDATE search_state SET deferred = 1 WHERE deferred = 0 AND NOT EXISTS (SELECT 1 FROM albums)").rowcount > 0
+
+    def rebuild(self, conn: Optional[sqlite3.Connection] = None) -> None:
+        """Rebuild every search index from its table in bulk, then turn the sync triggers back on"""
+        if conn is None:
+            with self.transaction(immediate=True) as conn:
+                return self.rebuild(conn=conn)
+        for names_fts, metadata_fts, _, _ in SEARCH_INDEXES.values():
+            for fts in (names_fts, metadata_fts):
+                conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        conn.execute("UPDATE search_state SET deferred = 0")
+
+def fts_query(text: str) -> str:
+    """
+    FTS5 query of free text: every word quoted (no FTS syntax from the user) and
+    matched as a prefix, all words required. Empty if the text has no word.
+    """
+    return ' '.join(f'"{token}"*' for token in _TOKEN.findall(text))
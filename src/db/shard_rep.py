@@ -0,0 +1,67 @@
+import sqlite3
+from pathlib import Path
+from typing import List, Dict, Any
+from .base_rep import BaseRepository
+
+# columns copied from a shard (ids are renumbered, tracks follow their album by path)
+ALBUM_COLUMNS = ('artist_id', 'title', 'release_year', 'album_artist', 'total_tracks', 'path', 'metadata_status', 'created_at', 'updated_at')
+TRACK_COLUMNS = ('title', 'path', 'duration_ms', 'fingerprint', 'file_size', 'file_mtime_ns', 'audio_size', 'file_inode', 'file_device',
+                 'track_number', 'disc_number', 'format', 'created_at', 'updated_at')
+
+class ShardRepository(BaseRepository):
+    """Merge of staging databases (one per library root, same schema) into the main database"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+
+
+    def merge(self, shard_path: Path) -> Dict[str, Any]:
+        """
+        Copy the albums and tracks of a shard with set-based INSERT ... SELECT, in one transaction.
+        Albums whose path is already in the database are skipped, and so are the albums whose
+        (title, artist_id) is taken by an album of another root: their paths are returned.
+
+        Args:
+            shard_path: staging database written by a scan of one root
+
+        Returns:
+            dict: albums, tracks (written), skipped (path already known), conflicts (list of album paths)
+        """
+        conn = self._manager.connection()
+        # ATTACH is not allowed inside a transaction
+        conn.execute("ATTACH DATABASE ? AS shard", (str(shard_path),))
+        try:
+            with self.transaction(immediate=True) as conn:
+                return self._merge(conn)
+        finally:
+            conn.execute("DETACH DATABASE shard")
+
+    @staticmethod
+    def _merge(conn: sqlite3.Connection) -> Dict[str, Any]:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.albums").fetchone()[0]
+        skipped = conn.execute("""
+            SELECT COUNT(*) FROM shard.albums s WHERE EXISTS (SELECT 1 FROM main.albums a WHERE a.path = s.path)
+        """).fetchone()[0]
+
+        album_columns = ', '.join(ALBUM_COLUMNS)
+        # no conflict target: the UNIQUE path and the UNIQUE (title, artist_id) both skip the row
+        albums = conn.execute(f"""
+            INSERT INTO main.albums ({album_columns})
+            SELECT {album_columns} FROM shard.albums WHERE true ORDER BY id
+            ON CONFLICT DO NOTHING
+        """).rowcount
+        conflicts = [row[0] for row in conn.execute("""
+            SELECT s.path FROM shard.albums s WHERE NOT EXISTS (SELECT 1 FROM main.albums a WHERE a.path = s.path)
+        """)]
+
+        # tracks of the albums inserted above only (new ids are above last_id)
+        track_columns = ', '.join(TRACK_COLUMNS)
+        tracks = conn.execute(f"""
+            INSERT INTO main.tracks (album_id, {track_columns})
+            SELECT a.id, {', '.join(f't.{column}' for column in TRACK_COLUMNS)}
+            FROM shard.tracks t
+            JOIN shard.albums s ON s.id = t.album_id
+            JOIN main.albums a ON a.path = s.path AND a.id > ?
+            WHERE true ORDER BY t.id
+            ON CONFLICT (path) DO NOTHING
+        """, (last_id,)).rowcount
+        return {'albums': albums, 'tracks': tracks, 'skipped': skipped, 'conflicts': conflicts}
@@ -0,0 +1,193 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from core import LibraryStats
+from .base_rep import BaseRepository
+
+# cached reads kept by all the repositories of the process (every database, every query)
+STATS_CACHE_SIZE = 256
+
+# sort keys of the artist listing -> ORDER BY
+ARTIST_ORDERS = {
+    'name': "album_artist",
+    'albums': "albums DESC, album_artist",
+    'tracks': "tracks DESC, album_artist",
+    'duration': "duration_ms DESC, album_artist",
+}
+
+class StatsRepository(BaseRepository):
+    """
+    Library statistics and browsing (artist -> albums -> tracks) read from the summary
+    tables kept by the schema triggers, through a read-through cache: a cached result is
+    served while stats_state.version (bumped by every change of the library) is unchanged.
+    """
+    # (db_path, query name, args) -> (version, result), least recently used first
+    _cache: "OrderedDict[Tuple, Tuple[int, Any]]" = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+
+
+    def summary(self) -> LibraryStats:
+        """Library totals: albums, tracks, artists, duration, albums by status, tracks by format, genre coverage"""
+        return self._cached('summary', (), self._summary)
+
+    def artists(self, order: str = 'name', limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Album artists with their totals.
+
+        Args:
+            order: 'name', 'albums', 'tracks' or 'duration' (most first)
+            limit: max number of artists (all if None)
+            offset: artists skipped, for paging
+
+        Returns:
+            list: dicts with album_artist, albums, tracks, duration_ms
+        """
+        if order not in ARTIST_ORDERS:
+            raise ValueError(f"unknown order '{order}', expected one of {', '.join(ARTIST_ORDERS)}")
+        return self._cached('artists', (order, limit, offset), self._artists)
+
+    def artist_albums(self, album_artist: str) -> List[Dict[str, Any]]:
+        """
+        Albums of an album artist, by release year.
+
+        Returns:
+            list: dicts with id, title, release_year, path, metadata_status, tracks, duration_ms, genres
+        """
+        return self._cached('artist_albums', (album_artist,), self._artist_albums)
+
+    def album_tracks(self, album_id: int) -> List[Dict[str, Any]]:
+        """
+        Tracks of an album, by disc and track number.
+
+        Returns:
+            list: dicts with id, disc_number, track_number, title, duration_ms, format, path
+        """
+        return self._cached('album_tracks', (album_id,), self._album_tracks)
+
+    #------------ READ-THROUGH CACHE -----------#
+
+    def version(self) -> int:
+        """Change counter of the library (see stats_state)"""
+        row = self._fetch_one("SELECT version FROM stats_state")
+        return row['version'] if row else 0
+
+    def _cached(self, name: str, args: tuple, load: Callable) -> Any:
+        """
+        Result of load(*args), from the cache if the library has not changed since it was read.
+        Cached results are shared between callers: do not modify them.
+        """
+        state = self._fetch_one("SELECT deferred, version FROM stats_state")
+        if state['deferred']:
+            self.rebuild()
+            state = self._fetch_one("SELECT deferred, version FROM stats_state")
+        # the version is read before the data: a change committed in between makes the entry stale, never wrong
+        key = (str(self.db_path), name, args)
+        cls = type(self)
+        with cls._cache_lock:
+            entry = cls._cache.get(key)
+            if entry is not None and entry[0] == state['version']:
+                cls._cache.move_to_end(key)
+                return entry[1]
+        result = load(*args)
+        with cls._cache_lock:
+            cls._cache[key] = (state['version'], result)
+            cls._cache.move_to_end(key)
+            while len(cls._cache) > STATS_CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        return result
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        with cls._cache_lock:
+            cls._cache.clear()
+
+    #------------ QUERIES -----------#
+
+    def _summary(self) -> LibraryStats:
+        stats = LibraryStats(version=self.version())
+        for row in self._fetch_all("SELECT stat, key, value FROM library_stats"):
+            if row['stat'] == 'albums_status':
+                if row['value']:
+                    stats.albums_by_status[row['key']] = row['value']
+            elif row['stat'] == 'tracks_format':
+                if row['value']:
+                    stats.tracks_by_format[row['key']] = row['value']
+            elif hasattr(stats, row['stat']):
+                setattr(stats, row['stat'], row['value'])
+        return stats
+
+    def _artists(self, order: str, limit: Optional[int], offset: int) -> List[Dict[str, Any]]:
+        query = f"SELECT album_artist, albums, tracks, duration_ms FROM artist_stats ORDER BY {ARTIST_ORDERS[order]} LIMIT ? OFFSET ?"
+        return self._fetch_all(query, (-1 if limit is None else limit, offset))
+
+    def _artist_albums(self, album_artist: str) -> List[Dict[str, Any]]:
+        query = """
+            SELECT a.id, a.title, a.release_year, a.path, a.metadata_status,
+                COALESCE(s.tracks, 0) AS tracks, COALESCE(s.duration_ms, 0) AS duration_ms, fa.genres
+            FROM albums a
+            LEFT JOIN album_stats s ON s.album_id = a.id
+            LEFT JOIN final_albums_metadata fa ON fa.album_id = a.id
+            WHERE a.album_artist = ?
+            ORDER BY a.release_year, a.title
+        """
+        return self._fetch_all(query, (album_artist,))
+
+    def _album_tracks(self, album_id: int) -> List[Dict[str, Any]]:
+        query = """
+            SELECT id, disc_number, track_number, title, duration_ms, format, path
+            FROM tracks WHERE album_id = ?
+            ORDER BY disc_number, track_number, title
+        """
+        return self._fetch_all(query, (album_id,))
+
+    #------------ SUMMARY MAINTENANCE -----------#
+
+    def is_deferred(self) -> bool:
+        """True while the summary triggers are off (the summaries are stale until rebuilt)"""
+        row = self._fetch_one("SELECT deferred FROM stats_state")
+        return bool(row and row['deferred'])
+
+    def defer_if_empty(self) -> bool:
+        """
+        Turn the summary triggers off if the library is empty: an initial scan inserts
+        without counting and rebuilds the summaries once at the end (see rebuild).
+
+        Returns:
+            bool: True if the summaries were deferred by this call (the caller rebuilds)
+        """
+        with self.transaction(immediate=True) as conn:
+            return conn.execute("UPDATE stats_state SET deferred = 1 WHERE deferred = 0 AND NOT EXISTS (SELECT 1 FROM albums)").rowcount > 0
+
+    def rebuild(self, conn: Optional[sqlite3.Connection] = None) -> None:
+        """Recompute every summary table from the library, then turn the triggers back on"""
+        if conn is None:
+            with self.transaction(immediate=True) as conn:
+                return self.rebuild(conn=conn)
+        conn.execute("DELETE FROM library_stats")
+        conn.execute("DELETE FROM artist_stats")
+        conn.execute("DELETE FROM album_stats")
+        conn.execute("""
+            INSERT INTO album_stats (album_id, album_artist, tracks, duration_ms)
+            SELECT a.id, COALESCE(a.album_artist, ''), COUNT(t.id), COALESCE(SUM(t.duration_ms), 0)
+            FROM albums a LEFT JOIN tracks t ON t.album_id = a.id
+            GROUP BY a.id
+        """)
+        conn.execute("""
+            INSERT INTO artist_stats (album_artist, albums, tracks, duration_ms)
+            SELECT album_artist, COUNT(*), SUM(tracks), SUM(duration_ms) FROM album_stats GROUP BY album_artist
+        """)
+        conn.execute("""
+            INSERT INTO library_stats (stat, key, value)
+            SELECT 'albums', '', COUNT(*) FROM albums
+            UNION ALL SELECT 'tracks', '', COUNT(*) FROM tracks
+            UNION ALL SELECT 'duration_ms', '', COALESCE(SUM(duration_ms), 0) FROM tracks
+            UNION ALL SELECT 'artists', '', COUNT(*) FROM artist_stats
+            UNION ALL SELECT 'albums_with_genres', '', COUNT(*) FROM final_albums_metadata WHERE COALESCE(genres, '') <> ''
+            UNION ALL SELECT 'albums_status', COALESCE(metadata_status, ''), COUNT(*) FROM albums GROUP BY metadata_status
+            UNION ALL SELECT 'tracks_format', COALESCE(format, ''), COUNT(*) FROM tracks GROUP BY format
+        """)
+        conn.execute("UPDATE stats_state SET deferred = 0, version = version + 1")
@@ -1,8 +1,10 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterable, Iterator, Tuple
 from datetime import datetime
+from itertools import batched, chain
 import json
-from core import TrackData, AlbumData
-from .base_rep import BaseRepository
+import sqlite3
+from core import TrackData, AlbumData, TrackBatch
+from .base_rep import BaseRepository, DEFAULT_ARRAYSIZE
 
 class ArtistRepository(BaseRepository):
     def __init__(self, db_path: str):
@@ -47,6 +49,88 @@ class AlbumRepository(BaseRepository):
         album_id = self._insert('albums', album_data)
         return album_id
 
+    def new_albums(self, albums: List[AlbumData], conn: Optional[sqlite3.Connection] = None, skip_existing: bool = False) -> List[Optional[int]]:
+        """
+        Insert a batch of newly scanned albums with a single timestamp.
+
+        Args:
+            albums: Album dataclass instances
+            conn: connection of the running transaction (optional)
+            skip_existing: ignore albums whose path is already in the database (the title
+                conflicts must be left out first, see title_conflicts)
+
+        Returns:
+            list: IDs of the new albums, in input order (None for skipped albums)
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        album_data_list = [{
+            'artist_id': 0, # placeholder, will be set later
+            'title': album.title,
+            'release_year': album.release_year,
+            'album_artist': album.album_artist,
+            'total_tracks': album.total_tracks,
+            'path': album.path,
+            'metadata_status': 'pending',
+            'created_at': now,
+            'updated_at': now
+        } for album in albums]
+
+        if skip_existing:
+            return self._insert_many('albums', album_data_list, conn=conn, on_conflict="(path) DO NOTHING", key_field='path')
+        return self._insert_many('albums', album_data_list, conn=conn)
+
+    def title_conflicts(self, albums: List[AlbumData], conn: Optional[sqlite3.Connection] = None) -> List[str]:
+        """
+        Paths of the new albums that cannot be inserted because their title is taken,
+        UNIQUE (title, artist_id), by an album at another path: already in the database
+        (e.g. the same album under another library root) or earlier in the batch.
+        Albums whose path is already in the database are not conflicts (they are skipped).
+
+        Args:
+            albums: Album dataclass instances
+            conn: connection of the running transaction (optional)
+
+        Returns:
+            list: album paths, in input order
+        """
+        if not albums:
+            return []
+        if conn is None:
+            conn = self._manager.connection()
+        titles = json.dumps([album.title for album in albums])
+        paths = json.dumps([album.path for album in albums])
+        # every album is inserted with the placeholder artist (see new_albums)
+        owners = dict(conn.execute(
+            "SELECT title, path FROM albums WHERE artist_id = 0 AND title IN (SELECT value FROM json_each(?))", (titles,)
+        ).fetchall())
+        known = {row[0] for row in conn.execute("SELECT path FROM albums WHERE path IN (SELECT value FROM json_each(?))", (paths,))}
+
+        conflicts = []
+        for album in albums:
+            if album.path not in known and owners.setdefault(album.title, album.path) != album.path:
+                conflicts.append(album.path)
+        return conflicts
+
+    def get_album_paths(self) -> set[str]:
+        """Return the paths of all the albums already in the database"""
+        rows = self._fetch_all("SELECT path FROM albums")
+        return {row['path'] for row in rows}
+
+    def get_albums_by_status(self, status: str = 'pending') -> List[Dict[str, Any]]:
+        """Albums (id, title, release_year, album_artist) with a metadata status"""
+        query = "SELECT id, title, release_year, album_artist FROM albums WHERE metadata_status = ? ORDER BY album_artist, id"
+        return self._fetch_all(query, (status,))
+
+    def iter_albums(self, arraysize: int = DEFAULT_ARRAYSIZE, row_type: str = 'row') -> Iterator[Any]:
+        """
+        Stream every album (all the columns, by ID) without loading the table in memory.
+
+        Args:
+            arraysize: rows fetched from SQLite at a time
+            row_type: 'tuple', 'row' (sqlite3.Row) or 'dict'
+        """
+        return self._iter_rows("SELECT * FROM albums ORDER BY id", arraysize=arraysize, row_type=row_type)
+
 
 
 
@@ -69,23 +153,145 @@ class TrackRepository(BaseRepository):
         """
         if not track_list:
             raise ValueError("Track list cannot be empty")
-        
-        track_data_list = []
-        for track in track_list:
-            
-            track_data = {
-                'album_id': album_id,
-                'title': track.title,
-                'path': track.path,
-                'duration_ms': track.duration_ms,
-                'fingerprint': track.fingerprint,
-                'track_number': track.track_number,
-                'disc_number': track.disc_number,
-                'format': track.format,
-                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            track_data_list.append(track_data)
-
-        track_id = self._insert_many('tracks', track_data_list)
-        return track_id
+        return self.new_tracklists([(album_id, track_list)])
+
+    def new_tracklists(self, tracklists: Iterable[Tuple[int, List[TrackData]]], conn: Optional[sqlite3.Connection] = None) -> List[int]:
+        """
+        Insert the tracks of several albums with a single timestamp.
+
+        Args:
+            tracklists: (album_id, track list) pairs
+            conn: connection of the running transaction (optional)
+
+        Returns:
+            list: IDs of the new tracks, in input order
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        track_data_list = [{
+            'album_id': album_id,
+            'title': track.title,
+            'path': track.path,
+            'duration_ms': track.duration_ms,
+            'fingerprint': track.fingerprint,
+            'track_number': track.track_number,
+            'disc_number': track.disc_number,
+            'format': track.format,
+            'created_at': now,
+            'updated_at': now
+        } for album_id, track_list in tracklists for track in track_list]
+
+        return self._insert_many('tracks', track_data_list, conn=conn)
+
+    def insert_batch(self, batch: TrackBatch, album_ids: List[Optional[int]], conn: Optional[sqlite3.Connection] = None) -> int:
+        """
+        Insert a columnar batch of tracks as row tuples with a single timestamp
+        (no per-row dict, no IDs returned: see new_tracklists when they are needed).
+
+        Args:
+            batch: tracks of several albums
+            album_ids: database ID of every album of the batch, by album index (None = skip its tracks)
+            conn: connection of the running transaction (optional)
+
+        Returns:
+            int: number of tracks inserted
+        """
+        if conn is None:
+            with self.transaction() as conn:
+                return self.insert_batch(batch, album_ids, conn=conn)
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        columns = "album_id, title, path, duration_ms, fingerprint, track_number, disc_number, format, created_at, updated_at"
+        row_placeholder = '(' + ', '.join(['?'] * 10) + ')'
+        # multi-row INSERTs, as many rows as the bound variables allow: faster than executemany here
+        rows_per_query = max(1, conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER) // 10)
+        inserted = 0
+        for chunk in batched(batch.rows(album_ids, now, now), rows_per_query):
+            query = f"INSERT INTO tracks ({columns}) VALUES {', '.join([row_placeholder] * len(chunk))}"
+            inserted += conn.execute(query, list(chain.from_iterable(chunk))).rowcount
+        return inserted
+
+    def get_album_track_paths(self, album_path: str) -> set[str]:
+        """Return the paths of the tracks of the album at a path"""
+        rows = self._fetch_all("SELECT t.path FROM tracks t JOIN albums a ON a.id = t.album_id WHERE a.path = ?", (album_path,))
+        return {row['path'] for row in rows}
+
+    def iter_tracks(self, album_id: Optional[int] = None, arraysize: int = DEFAULT_ARRAYSIZE, row_type: str = 'row') -> Iterator[Any]:
+        """
+        Stream the tracks (all the columns, by ID) without loading the table in memory.
+
+        Args:
+            album_id: only the tracks of this album (all if None)
+            arraysize: rows fetched from SQLite at a time
+            row_type: 'tuple', 'row' (sqlite3.Row) or 'dict'
+        """
+        if album_id is None:
+            return self._iter_rows("SELECT * FROM tracks ORDER BY id", arraysize=arraysize, row_type=row_type)
+        return self._iter_rows("SELECT * FROM tracks WHERE album_id = ? ORDER BY id", (album_id,), arraysize=arraysize, row_type=row_type)
+
+    def get_file_states(self) -> List[Dict[str, Any]]:
+        """Path, fingerprint and the file state it was computed on, for every track"""
+        return self._fetch_all("SELECT id, path, fingerprint, file_size, file_mtime_ns, audio_size FROM tracks")
+
+    def save_file_states(self, states: List[Dict[str, Any]]) -> None:
+        """
+        Store fingerprints and file states.
+
+        Args:
+            states: dicts with id, fingerprint, file_size, file_mtime_ns, audio_size
+        """
+        query = """
+            UPDATE tracks
+            SET fingerprint = :fingerprint, file_size = :file_size, file_mtime_ns = :file_mtime_ns,
+                audio_size = :audio_size, updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+        """
+        with self.transaction() as conn:
+            self._execute_many(query, states, conn=conn)
+
+    def get_final_tags(self, album_ids: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Aggregated metadata of the tracks to write in their files, by album.
+
+        Args:
+            album_ids: albums to get (all the aggregated ones if None)
+
+        Returns:
+            list: id, album_id, path, file_size, file_mtime_ns, title, track_number,
+                album, year, genres ('; ' separated), artist, album_artist
+                (artists None when unknown: never the 'Unknown Artist' placeholder)
+        """
+        query = """
+            SELECT t.id, t.album_id, t.path, t.file_size, t.file_mtime_ns,
+                ft.title, ft.track_number, fa.title AS album, fa.year, fa.genres,
+                NULLIF(COALESCE(ft.artist, fa.album_artist, a.album_artist), placeholder.name) AS artist,
+                NULLIF(COALESCE(fa.album_artist, a.album_artist), placeholder.name) AS album_artist
+            FROM final_tracks_metadata ft
+            JOIN tracks t ON t.id = ft.track_id
+            JOIN albums a ON a.id = t.album_id
+            LEFT JOIN final_albums_metadata fa ON fa.album_id = ft.album_id
+            LEFT JOIN artists placeholder ON placeholder.id = 0
+        """
+        params = ()
+        if album_ids is not None:
+            album_ids = list(album_ids)
+            if not album_ids:
+                return []
+            query += f" WHERE t.album_id IN ({', '.join(['?'] * len(album_ids))})"
+            params = tuple(album_ids)
+        return self._fetch_all(query + " ORDER BY t.album_id, t.disc_number, t.track_number", params)
+
+    def refresh_file_states(self, states: List[Dict[str, Any]]) -> None:
+        """
+        Store the size and mtime of files rewritten by the tag writer, where the stored
+        state was the one before the write: their audio fingerprint is still valid.
+
+        Args:
+            states: dicts with id, old_size, old_mtime_ns, file_size, file_mtime_ns
+        """
+        query = """
+            UPDATE tracks
+            SET file_size = :file_size, file_mtime_ns = :file_mtime_ns, updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id AND file_size = :old_size AND file_mtime_ns = :old_mtime_ns
+        """
+        with self.transaction() as conn:
+            self._execute_many(query, states, conn=conn)
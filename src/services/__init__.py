@@ -1,3 +1,30 @@
-from .scanner import discover_scan, init_album_DB
+from importlib import import_module
 
-__all__ = ['discover_scan', 'init_album_DB']
\ No newline at end of file
+# exported name -> submodule defining it, imported on first access: a command only loads the services it uses
+_EXPORTS = {
+    'discover_scan': '.scanner', 'init_album_DB': '.scanner', 'stream_scan': '.scanner', 'sharded_scan': '.scanner', 'incremental_scan': '.scanner',
+    'walk_library': '.walker', 'DEFAULT_WORKERS': '.walker',
+    'find_duplicates': '.dupes', 'payload_hash': '.dupes', 'DEFAULT_HASH_WORKERS': '.dupes',
+    'GenreResolver': '.genre_resolver', 'normalize_genre': '.genre_resolver',
+    'FetchEngine': '.fetch', 'ADAPTERS': '.fetch', 'DEFAULT_RETRIES': '.fetch', 'DEFAULT_LEASE': '.fetch',
+    'AlbumMatcher': '.fetch.matcher', 'MATCH_THRESHOLD': '.fetch.matcher',
+    'aggregate_metadata': '.aggregator',
+    'write_back': '.writeback', 'DEFAULT_WRITE_WORKERS': '.writeback',
+    'watch_library': '.watcher', 'Watcher': '.watcher', 'DEFAULT_QUIET': '.watcher', 'DEFAULT_POLL_INTERVAL': '.watcher',
+    'reconcile_library': '.reconcile', 'ReconcileError': '.reconcile',
+    'export_library': '.export', 'EXPORT_FORMATS': '.export', 'COMPRESSIONS': '.export',
+    'read_tags': '.tag_writer', 'write_tags': '.tag_writer', 'DEFAULT_PADDING': '.tag_writer',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted({*globals(), *_EXPORTS})
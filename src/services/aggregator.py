@@ -0,0 +1,29 @@
+import time
+from pathlib import Path
+from core import AggregateReport
+from db import AggregationRepository
+
+def aggregate_metadata(db_path: Path, full: bool = False) -> AggregateReport:
+    """
+    Merge the per-source metadata (artist/album/track_metadata) into the final_*_metadata tables.
+    Only the entities in the metadata_changes log are recomputed: triggers fill it when the
+    source metadata, its genres or a source reliability change, and the run empties it.
+
+    Args:
+        db_path (Path): database path
+        full (bool): recompute every entity with source metadata, not only the changed ones
+
+    Returns:
+        AggregateReport: changed, updated and removed entities by type
+    """
+    start = time.perf_counter()
+    aggregation_repo = AggregationRepository(db_path)
+    if full:
+        aggregation_repo.mark_all_changed()
+
+    report = AggregateReport(changed=aggregation_repo.pending_changes())
+    for entity, counts in aggregation_repo.aggregate().items():
+        report.updated[entity] = counts['updated']
+        report.removed[entity] = counts['removed']
+    report.elapsed = time.perf_counter() - start
+    return report
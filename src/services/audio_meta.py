@@ -0,0 +1,469 @@
+"""
+Header-only audio metadata: duration, track and disc numbers.
+
+Dependency-free parsers for the AUDIO_EXTS formats. Only the container
+headers are read (a few KB, seeking over pictures and audio payloads),
+no audio is decoded:
+    - FLAC: STREAMINFO + VORBIS_COMMENT blocks
+    - MP3: ID3v2 frames (TRCK/TPOS/TLEN) + Xing/Info/VBRI header or frame-size estimate
+    - WAV: fmt/data chunks (+ LIST/INFO ITRK)
+    - M4A: moov/mvhd + udta/meta/ilst trkn/disk atoms
+"""
+import os
+import re
+import struct
+from collections import deque
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from core import AlbumData, profiler
+
+# albums handed to a worker process at once
+ALBUMS_PER_TASK = 16
+
+class AudioInfo(NamedTuple):
+    duration_ms: int = 0
+    track_number: int = 0 # 0 = unknown
+    disc_number: int = 0 # 0 = unknown
+    track_total: int = 0
+    disc_total: int = 0
+
+UNKNOWN = AudioInfo()
+
+# "03", "3/12", "1-03 Title" (disc-track) at the start of a file name
+_LEADING_NUMBER = re.compile(r"^\s*(?:(\d{1,2})[-.])?(\d{1,3})(?!\d)")
+
+def read_audio_info(path: str) -> AudioInfo:
+    """
+    Read duration and numbering from the headers of an audio file.
+    Unknown values are 0, unreadable or unsupported files give UNKNOWN.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(12)
+            if head[:4] == b'fLaC' or (head[:3] == b'ID3' and path.lower().endswith('.flac')):
+                return _read_flac(f, head)
+            if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+                return _read_wav(f)
+            if head[4:8] == b'ftyp':
+                return _read_mp4(f)
+            return _read_mp3(f, head)
+    except (OSError, struct.error, ValueError, IndexError):
+        return UNKNOWN
+
+def number_from_filename(name: str) -> Tuple[int, int]:
+    """(disc, track) from a leading '03 - Title' or '1-03 Title' file name, 0 if missing"""
+    match = _LEADING_NUMBER.match(name)
+    if not match:
+        return 0, 0
+    disc, track = match.groups()
+    return int(disc or 0), int(track)
+
+def _parse_pair(value: str) -> Tuple[int, int]:
+    """'3/12' -> (3, 12), '3' -> (3, 0)"""
+    number, _, total = value.strip().partition('/')
+    number = int(number) if number.strip().isdigit() else 0
+    total = int(total) if total.strip().isdigit() else 0
+    return number, total
+
+#------------ FLAC -----------#
+
+def _read_flac(f: BinaryIO, head: bytes) -> AudioInfo:
+    if head[:3] == b'ID3':
+        f.seek(10 + _syncsafe(head[6:10]))  # some taggers prepend an ID3v2 tag
+        if f.read(4) != b'fLaC':
+            return UNKNOWN
+    else:
+        f.seek(4)
+
+    duration_ms = track = track_total = disc = disc_total = 0
+    last = False
+    while not last:
+        header = f.read(4)
+        if len(header) < 4:
+            break
+        last = bool(header[0] & 0x80)
+        block_type = header[0] & 0x7F
+        length = int.from_bytes(header[1:4], 'big')
+        if block_type == 0:  # STREAMINFO
+            data = f.read(length)
+            bits = int.from_bytes(data[10:18], 'big')
+            sample_rate = bits >> 44
+            total_samples = bits & 0xFFFFFFFFF
+            if sample_rate:
+                duration_ms = total_samples * 1000 // sample_rate
+        elif block_type == 4:  # VORBIS_COMMENT
+            comments = _vorbis_comments(f.read(length))
+            track, track_total = _parse_pair(comments.get('TRACKNUMBER', ''))
+            disc, disc_total = _parse_pair(comments.get('DISCNUMBER', ''))
+            track_total = track_total or _parse_pair(comments.get('TRACKTOTAL', comments.get('TOTALTRACKS', '')))[0]
+            disc_total = disc_total or _parse_pair(comments.get('DISCTOTAL', comments.get('TOTALDISCS', '')))[0]
+        else:
+            f.seek(length, os.SEEK_CUR)  # PICTURE, SEEKTABLE, PADDING...
+    return AudioInfo(duration_ms, track, disc, track_total, disc_total)
+
+def _vorbis_comments(data: bytes) -> dict:
+    """Vorbis comment block -> {UPPERCASE KEY: first value}"""
+    comments = {}
+    vendor_length = struct.unpack_from('<I', data, 0)[0]
+    offset = 4 + vendor_length
+    count = struct.unpack_from('<I', data, offset)[0]
+    offset += 4
+    for _ in range(count):
+        length = struct.unpack_from('<I', data, offset)[0]
+        offset += 4
+        key, _, value = data[offset:offset + length].decode('utf-8', 'replace').partition('=')
+        comments.setdefault(key.upper(), value)
+        offset += length
+    return comments
+
+#------------ MP3 -----------#
+
+# bitrates (kbps) by [MPEG1?][layer][index]
+_MP3_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# sample rates by version bits (3: MPEG1, 2: MPEG2, 0: MPEG2.5)
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+# bytes searched for the first frame after the ID3v2 tag
+_MP3_SYNC_WINDOW = 65536
+
+def _read_mp3(f: BinaryIO, head: bytes) -> AudioInfo:
+    file_size = os.fstat(f.fileno()).st_size
+    audio_start = 0
+    track = track_total = disc = disc_total = tlen = 0
+
+    if head[:3] == b'ID3':
+        frames = _id3v2_frames(f, head[3], head[5], _syncsafe(head[6:10]), {'TRCK', 'TPOS', 'TLEN', 'TRK', 'TPA', 'TLE'})
+        track, track_total = _parse_pair(frames.get('TRCK', frames.get('TRK', '')))
+        disc, disc_total = _parse_pair(frames.get('TPOS', frames.get('TPA', '')))
+        tlen = frames.get('TLEN', frames.get('TLE', '')).strip()
+        tlen = int(tlen) if tlen.isdigit() else 0
+        audio_start = 10 + _syncsafe(head[6:10]) + (10 if head[5] & 0x10 else 0)
+
+    f.seek(audio_start)
+    window = f.read(_MP3_SYNC_WINDOW)
+    audio_end = file_size
+    if file_size >= 128:
+        f.seek(file_size - 128)
+        if f.read(3) == b'TAG':
+            audio_end -= 128  # ID3v1
+
+    duration_ms = tlen or _mp3_duration(window, audio_end - audio_start)
+    return AudioInfo(duration_ms, track, disc, track_total, disc_total)
+
+def _mp3_duration(window: bytes, audio_size: int) -> int:
+    """Duration from the first MPEG frame: Xing/Info or VBRI frame count, else constant bitrate"""
+    offset = window.find(b'\xff')
+    while 0 <= offset <= len(window) - 4:
+        b1, b2, b3 = window[offset + 1], window[offset + 2], window[offset + 3]
+        version = (b1 >> 3) & 0x3
+        layer = 4 - ((b1 >> 1) & 0x3)
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 0x3
+        if (b1 & 0xE0) == 0xE0 and version != 1 and layer != 4 and 0 < bitrate_index < 15 and rate_index < 3:
+            break
+        offset = window.find(b'\xff', offset + 1)
+    else:
+        return 0
+
+    mpeg1 = version == 3
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    samples_per_frame = 384 if layer == 1 else (1152 if mpeg1 or layer == 2 else 576)
+    mono = (b3 >> 6) == 3
+
+    # Xing/Info header after the side information (layer III)
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = offset + 4 + side_info
+    if window[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = int.from_bytes(window[xing + 4:xing + 8], 'big')
+        if flags & 0x1:
+            frames = int.from_bytes(window[xing + 8:xing + 12], 'big')
+            return frames * samples_per_frame * 1000 // sample_rate
+    # VBRI header (Fraunhofer), always 32 bytes after the frame header
+    vbri = offset + 4 + 32
+    if window[vbri:vbri + 4] == b'VBRI':
+        frames = int.from_bytes(window[vbri + 14:vbri + 18], 'big')
+        return frames * samples_per_frame * 1000 // sample_rate
+
+    # constant bitrate estimate
+    return max(0, audio_size - offset) * 8 * 1000 // bitrate
+
+def _syncsafe(data: bytes) -> int:
+    """ID3v2 28-bit synchsafe integer"""
+    return (data[0] & 0x7F) << 21 | (data[1] & 0x7F) << 14 | (data[2] & 0x7F) << 7 | (data[3] & 0x7F)
+
+def _id3v2_frames(f: BinaryIO, major: int, flags: int, size: int, wanted: set) -> dict:
+    """Read the wanted text frames of an ID3v2.2/2.3/2.4 tag, seeking over the others"""
+    frames = {}
+    f.seek(10)
+    end = 10 + size
+    if flags & 0x40 and major >= 3:  # extended header
+        ext = f.read(4)
+        ext_size = _syncsafe(ext) if major == 4 else int.from_bytes(ext, 'big') + 4
+        f.seek(10 + ext_size)
+    header_size = 6 if major == 2 else 10
+    while f.tell() + header_size <= end:
+        header = f.read(header_size)
+        if header[0] == 0:  # padding
+            break
+        if major == 2:
+            frame_id = header[:3].decode('latin-1')
+            frame_size = int.from_bytes(header[3:6], 'big')
+        else:
+            frame_id = header[:4].decode('latin-1')
+            frame_size = _syncsafe(header[4:8]) if major == 4 else int.from_bytes(header[4:8], 'big')
+        if frame_id in wanted:
+            frames[frame_id] = _id3_text(f.read(frame_size))
+            if len(frames) == len(wanted):
+                break
+        else:
+            f.seek(frame_size, os.SEEK_CUR)
+    return frames
+
+def _id3_text(data: bytes) -> str:
+    """Decode an ID3v2 text frame (first value)"""
+    if not data:
+        return ''
+    encoding = {0: 'latin-1', 1: 'utf-16', 2: 'utf-16-be', 3: 'utf-8'}.get(data[0], 'latin-1')
+    return data[1:].decode(encoding, 'replace').split('\x00')[0]
+
+#------------ WAV -----------#
+
+def _read_wav(f: BinaryIO) -> AudioInfo:
+    byte_rate = data_size = track = 0
+    f.seek(12)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        chunk_id, size = header[:4], struct.unpack('<I', header[4:])[0]
+        if chunk_id == b'fmt ':
+            fmt = f.read(size)
+            byte_rate = struct.unpack_from('<I', fmt, 8)[0]
+        elif chunk_id == b'data':
+            data_size = size
+            f.seek(size, os.SEEK_CUR)
+        elif chunk_id == b'LIST':
+            info = f.read(size)
+            if info[:4] == b'INFO':
+                track = _riff_info(info[4:]).get(b'ITRK', track)
+        else:
+            f.seek(size, os.SEEK_CUR)
+        if size % 2:
+            f.seek(1, os.SEEK_CUR)  # chunks are word aligned
+    duration_ms = data_size * 1000 // byte_rate if byte_rate else 0
+    return AudioInfo(duration_ms, track, 0)
+
+def _riff_info(data: bytes) -> dict:
+    """LIST/INFO sub-chunks, numeric ones only"""
+    values = {}
+    offset = 0
+    while offset + 8 <= len(data):
+        chunk_id, size = data[offset:offset + 4], struct.unpack_from('<I', data, offset + 4)[0]
+        value = data[offset + 8:offset + 8 + size].split(b'\x00')[0]
+        number = _parse_pair(value.decode('latin-1'))[0]
+        if number:
+            values[chunk_id] = number
+        offset += 8 + size + size % 2
+    return values
+
+#------------ M4A -----------#
+
+def _read_mp4(f: BinaryIO) -> AudioInfo:
+    file_size = os.fstat(f.fileno()).st_size
+    moov = _find_atom(f, 0, file_size, b'moov')
+    if not moov:
+        return UNKNOWN
+    duration_ms = track = track_total = disc = disc_total = 0
+
+    mvhd = _find_atom(f, *moov, b'mvhd')
+    if mvhd:
+        f.seek(mvhd[0])
+        data = f.read(min(mvhd[1] - mvhd[0], 32))
+        if data[0] == 1:
+            timescale, duration = struct.unpack_from('>IQ', data, 20)
+        else:
+            timescale, duration = struct.unpack_from('>II', data, 12)
+        if timescale:
+            duration_ms = duration * 1000 // timescale
+
+    ilst = _find_path(f, moov, (b'udta', b'meta', b'ilst'))
+    if ilst:
+        for name in (b'trkn', b'disk'):
+            atom = _find_atom(f, *ilst, name)
+            data_atom = atom and _find_atom(f, *atom, b'data')
+            if not data_atom:
+                continue
+            f.seek(data_atom[0] + 8)  # type + locale
+            payload = f.read(6)
+            number, total = struct.unpack('>HH', payload[2:6]) if len(payload) == 6 else (0, 0)
+            if name == b'trkn':
+                track, track_total = number, total
+            else:
+                disc, disc_total = number, total
+    return AudioInfo(duration_ms, track, disc, track_total, disc_total)
+
+def _find_path(f: BinaryIO, atom: Tuple[int, int], path: Tuple[bytes, ...]) -> Optional[Tuple[int, int]]:
+    """Descend into nested atoms ('meta' is a full atom: 4 bytes of version/flags before its children)"""
+    for name in path:
+        atom = _find_atom(f, *atom, name)
+        if not atom:
+            return None
+        if name == b'meta':
+            atom = (atom[0] + 4, atom[1])
+    return atom
+
+def _find_atom(f: BinaryIO, start: int, end: int, name: bytes) -> Optional[Tuple[int, int]]:
+    """Find a child atom between start and end: (payload start, payload end), seeking over the others"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, atom_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:  # 64-bit size
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:  # up to the end of the file
+            size = end - offset
+        if size < header_size:
+            return None
+        if atom_type == name:
+            return offset + header_size, min(offset + size, end)
+        offset += size
+    return None
+
+#------------ AUDIO PAYLOAD -----------#
+
+def audio_payload(path: str) -> Tuple[int, int]:
+    """
+    Byte range (start, end) of the audio data of a file, tags excluded, so that
+    tag edits do not change it. Unknown formats give the whole file.
+    """
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        head = f.read(12)
+        try:
+            if head[:4] == b'fLaC' or (head[:3] == b'ID3' and path.lower().endswith('.flac')):
+                return _flac_payload(f, head, file_size)
+            if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+                return _wav_payload(f, file_size)
+            if head[4:8] == b'ftyp':
+                return _find_atom(f, 0, file_size, b'mdat') or (0, file_size)
+            return _mp3_payload(f, head, file_size)
+        except (struct.error, ValueError, IndexError):
+            return 0, file_size
+
+def _flac_payload(f: BinaryIO, head: bytes, file_size: int) -> Tuple[int, int]:
+    """Audio frames after the last metadata block"""
+    offset = 10 + _syncsafe(head[6:10]) if head[:3] == b'ID3' else 0
+    offset += 4  # 'fLaC'
+    last = False
+    while not last:
+        f.seek(offset)
+        header = f.read(4)
+        if len(header) < 4:
+            break
+        last = bool(header[0] & 0x80)
+        offset += 4 + int.from_bytes(header[1:4], 'big')
+    return min(offset, file_size), file_size
+
+def _mp3_payload(f: BinaryIO, head: bytes, file_size: int) -> Tuple[int, int]:
+    """MPEG frames between the ID3v2 tag and the APEv2/ID3v1 tags at the end"""
+    start = 10 + _syncsafe(head[6:10]) + (10 if head[5] & 0x10 else 0) if head[:3] == b'ID3' else 0
+    end = file_size
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128  # ID3v1
+    if end - start >= 32:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == b'APETAGEX':
+            end -= struct.unpack_from('<I', footer, 12)[0] + (32 if footer[23] & 0x80 else 0)  # size + optional header
+    return start, max(start, end)
+
+def _wav_payload(f: BinaryIO, file_size: int) -> Tuple[int, int]:
+    """The data chunk"""
+    offset = 12
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        chunk_id, size = struct.unpack('<4sI', f.read(8))
+        if chunk_id == b'data':
+            return offset + 8, min(offset + 8 + size, file_size)
+        offset += 8 + size + size % 2
+    return 0, file_size
+
+#------------ PARALLEL EXTRACTION -----------#
+
+def fill_audio_info(albums: Iterable[AlbumData], processes: Optional[int] = None) -> Iterator[AlbumData]:
+    """
+    Fill duration, track and disc numbers of the album tracklists from the file headers,
+    reading them on a process pool. Albums come out lazily and in input order.
+    Missing numbers fall back to the file name ('03 - Title', '1-03 Title'), discs default to 1.
+
+    Args:
+        albums: album data with tracklist (e.g. from discover_scan)
+        processes: worker processes (default: CPU count, 0 = read in this process)
+    """
+    processes = (os.cpu_count() or 1) if processes is None else processes
+    if processes == 0:
+        for album in albums:
+            yield _apply(album, [read_audio_info(track.path) for track in album.tracklist or []])
+        return
+
+    pool = None
+    pending = deque()
+    batch = []
+
+    def submit(batch):
+        nonlocal pool
+        if pool is None:
+            # started on the first batch: an empty or up to date library never pays for the pool
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            # spawn: the scan runs other threads, forking them is unsafe
+            pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        paths = [[track.path for track in album.tracklist or []] for album in batch]
+        pending.append((batch, pool.submit(_read_albums, paths)))
+
+    try:
+        for album in albums:
+            batch.append(album)
+            if len(batch) == ALBUMS_PER_TASK:
+                submit(batch)
+                batch = []
+            if len(pending) >= 2 * processes:
+                done, future = pending.popleft()
+                yield from map(_apply, done, future.result())
+        if batch:
+            submit(batch)
+        while pending:
+            done, future = pending.popleft()
+            yield from map(_apply, done, future.result())
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if pool is not None:
+            pool.shutdown()
+
+def _read_albums(albums_paths: List[List[str]]) -> List[List[AudioInfo]]:
+    """Worker process task: audio info of the tracks of a few albums"""
+    return [[read_audio_info(path) for path in paths] for paths in albums_paths]
+
+def _apply(album: AlbumData, infos: List[AudioInfo]) -> AlbumData:
+    """Copy the audio info into the album tracklist"""
+    profiler.count('headers.files', rows=len(infos))
+    for track, info in zip(album.tracklist or [], infos):
+        file_disc, file_track = number_from_filename(track.title)
+        track.duration_ms = info.duration_ms
+        track.track_number = info.track_number or file_track
+        track.disc_number = info.disc_number or file_disc or 1
+    return album
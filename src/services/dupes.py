@@ -0,0 +1,162 @@
+import hashlib
+import mmap
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Optional
+from core import DupesReport, profiler
+from db import TrackRepository
+from .audio_meta import audio_payload
+
+# bytes hashed at the head and at the tail of the audio payload (tier 2)
+SAMPLE_SIZE = 64 * 1024
+# bytes fed to the hash at once from the memory map (tier 3)
+HASH_CHUNK = 8 * 1024 * 1024
+# threads hashing: hashlib releases the GIL on large buffers
+DEFAULT_HASH_WORKERS = 8
+
+FINGERPRINT_PREFIX = 'blake2b:'
+
+def find_duplicates(db_path: Path, workers: int = DEFAULT_HASH_WORKERS) -> DupesReport:
+    """
+    Find identical tracks (same audio payload, tags excluded) in three tiers:
+        1. audio payload size (from the headers, or stored from the previous run)
+        2. hash of a head/tail sample of the payload, only for size collisions
+        3. full payload hash (memory mapped), only for sample collisions
+    Full hashes are stored in tracks.fingerprint with the file size and mtime,
+    so unchanged files are never read again.
+
+    Args:
+        db_path (Path): database path
+        workers (int): threads reading and hashing files
+
+    Returns:
+        DupesReport: duplicate groups and I/O statistics
+    """
+    track_repo = TrackRepository(db_path)
+    rows = track_repo.get_file_states()
+    report = DupesReport(files=len(rows))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dupes') as pool:
+        with profiler.stage('dupes.stat'):
+            entries = [entry for entry in pool.map(_check_file, rows) if entry is not None]
+        report.missing = len(rows) - len(entries)
+        report.bytes_total = sum(entry['audio_size'] for entry in entries)
+
+        # tier 1: audio payload size
+        size_groups = [group for group in _group_by(entries, 'audio_size').values() if len(group) > 1]
+        report.size_candidates = sum(len(group) for group in size_groups)
+
+        # tier 2: head/tail sample, only where some fingerprint is missing
+        to_sample = [entry for group in size_groups if any(not e['fingerprint'] for e in group) for entry in group]
+        with profiler.stage('dupes.sample'):
+            for entry, (sample, read) in zip(to_sample, pool.map(_sample_hash, to_sample)):
+                entry['sample'] = sample
+                report.bytes_read += read
+                profiler.count('dupes.sampled', rows=1, bytes=read)
+
+        sample_groups = []
+        for group in size_groups:
+            if all(e['fingerprint'] for e in group):
+                sample_groups.append(group)  # already fingerprinted: no I/O
+                continue
+            sample_groups.extend(g for g in _group_by(group, 'sample').values() if len(g) > 1)
+        report.sample_candidates = sum(len(group) for group in sample_groups)
+
+        # tier 3: full payload hash
+        to_hash = [entry for group in sample_groups for entry in group if not entry['fingerprint']]
+        with profiler.stage('dupes.hash'):
+            for entry, fingerprint in zip(to_hash, pool.map(lambda entry: payload_hash(entry['path'], *_payload(entry)), to_hash)):
+                entry['fingerprint'] = fingerprint
+                entry['dirty'] = entry['hashed'] = True
+                report.bytes_read += entry['audio_size']
+                profiler.count('dupes.hashed', rows=1, bytes=entry['audio_size'])
+        report.hashed = sum(entry['hashed'] for entry in entries)
+
+    for group in sample_groups:
+        for same in _group_by(group, 'fingerprint').values():
+            if len(same) > 1:
+                report.groups.append(sorted(entry['path'] for entry in same))
+    report.groups.sort(key=lambda paths: (-len(paths), paths))
+
+    # persist fingerprints and file states (payload sizes too: unchanged files skip the headers next time)
+    dirty = [entry for entry in entries if entry['dirty']]
+    track_repo.save_file_states([{key: entry[key] for key in ('id', 'fingerprint', 'file_size', 'file_mtime_ns', 'audio_size')} for entry in dirty])
+
+    return report
+
+def _group_by(entries: Iterable[Dict[str, Any]], key: str) -> Dict[Any, List[Dict[str, Any]]]:
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[entry[key]].append(entry)
+    return groups
+
+def _check_file(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Stat a track: keep the stored fingerprint if the file did not change, else read the payload range"""
+    try:
+        st = os.stat(row['path'])
+    except OSError:
+        return None
+    entry = dict(row, start=None, end=None, sample=None, dirty=False, hashed=False)
+    if row['file_size'] == st.st_size and row['file_mtime_ns'] == st.st_mtime_ns and row['audio_size'] is not None:
+        return entry
+
+    try:
+        start, end = audio_payload(row['path'])
+    except OSError:
+        return None
+    entry.update(
+        fingerprint='', file_size=st.st_size, file_mtime_ns=st.st_mtime_ns,
+        audio_size=end - start, start=start, end=end, dirty=True,
+    )
+    return entry
+
+def _payload(entry: Dict[str, Any]) -> tuple:
+    if entry['start'] is None:
+        entry['start'], entry['end'] = audio_payload(entry['path'])
+    return entry['start'], entry['end']
+
+def _sample_hash(entry: Dict[str, Any]) -> tuple:
+    """Hash of the first and last SAMPLE_SIZE bytes of the payload: (digest, bytes read)"""
+    start, end = _payload(entry)
+    digest = hashlib.blake2b(digest_size=16)
+    fd = os.open(entry['path'], os.O_RDONLY)
+    try:
+        if end - start <= 2 * SAMPLE_SIZE:
+            data = os.pread(fd, end - start, start)
+            digest.update(data)
+            read = len(data)
+            # the sample is the whole payload: it is also the full fingerprint
+            entry['fingerprint'] = FINGERPRINT_PREFIX + hashlib.blake2b(data, digest_size=20).hexdigest()
+            entry['dirty'] = entry['hashed'] = True
+        else:
+            head = os.pread(fd, SAMPLE_SIZE, start)
+            tail = os.pread(fd, SAMPLE_SIZE, end - SAMPLE_SIZE)
+            digest.update(head)
+            digest.update(tail)
+            read = len(head) + len(tail)
+    finally:
+        os.close(fd)
+    return digest.hexdigest(), read
+
+def payload_hash(path: str, start: Optional[int] = None, end: Optional[int] = None) -> str:
+    """
+    Fingerprint of the whole audio payload of a file (tags excluded, see audio_payload),
+    read through a memory map. Pass the payload byte range (start, end) if already known.
+    """
+    if start is None:
+        start, end = audio_payload(path)
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        if end > start:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, 'madvise'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mm)
+                try:
+                    for offset in range(start, end, HASH_CHUNK):
+                        digest.update(view[offset:min(offset + HASH_CHUNK, end)])
+                finally:
+                    view.release()
+    return FINGERPRINT_PREFIX + digest.hexdigest()
@@ -0,0 +1,118 @@
+"""
+Bulk export of the library database to JSON Lines or CSV, one file per table, for the
+systems fed from the library (e.g. nightly dumps).
+
+Rows are streamed from a single read snapshot (fetchmany, see db.ExportRepository) and
+written a batch at a time, so memory stays flat whatever the library size. JSON objects
+are encoded by SQLite itself. Files are written under a temporary name and renamed when
+complete: a consumer never reads a partial dump.
+"""
+import csv
+import gzip
+import io
+import os
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Optional, TextIO
+from core import ExportReport, profiler
+from db import ExportRepository, EXPORT_TABLES, DEFAULT_ARRAYSIZE
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+# file name suffix of every compression
+COMPRESSION_SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# fast levels: the dumps are rewritten every night
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+def export_library(db_path: Path, out_dir: Path, tables: Optional[Iterable[str]] = None, fmt: str = 'jsonl',
+                   compression: str = 'none', arraysize: int = DEFAULT_ARRAYSIZE,
+                   progress: Optional[Callable[[str, int], None]] = None) -> ExportReport:
+    """
+    Export tables of the library database, one file per table: <out_dir>/<table>.<fmt>[.gz|.zst]
+
+    Args:
+        db_path (Path): database path
+        out_dir (Path): directory of the dump (created if missing)
+        tables: exports to write, see db.EXPORT_TABLES (default: all)
+        fmt (str): 'jsonl' (one JSON object per line) or 'csv' (with a header row)
+        compression (str): 'none', 'gzip' or 'zstd' (needs the `zstandard` package)
+        arraysize (int): rows fetched from SQLite and written at a time
+        progress: called with (table, rows written) when a table is done
+
+    Returns:
+        ExportReport: rows by table, files and bytes written
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"unknown compression '{compression}', expected one of {', '.join(COMPRESSIONS)}")
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("the zstd compression needs the 'zstandard' package")
+    tables = list(EXPORT_TABLES if tables is None else tables)
+    unknown = [table for table in tables if table not in EXPORT_TABLES]
+    if unknown:
+        raise ValueError(f"unknown export '{unknown[0]}', expected one of {', '.join(EXPORT_TABLES)}")
+
+    start = time.perf_counter()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    repo = ExportRepository(db_path)
+    report = ExportReport()
+    # one read transaction: every table from the same snapshot, writers are not blocked (WAL)
+    with repo.low_memory(), repo.transaction():
+        for table in tables:
+            path = out_dir / f"{table}.{fmt}{COMPRESSION_SUFFIXES[compression]}"
+            with profiler.stage(f'export.{table}'):
+                rows = _write_table(repo, table, path, fmt, compression, arraysize)
+            profiler.count(f'export.{table}', rows=rows, bytes=path.stat().st_size)
+            report.rows[table] = rows
+            report.files.append(str(path))
+            report.bytes_written += path.stat().st_size
+            if progress:
+                progress(table, rows)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def _write_table(repo: ExportRepository, table: str, path: Path, fmt: str, compression: str, arraysize: int) -> int:
+    """Write a table to a temporary file next to `path`, then rename it. Returns the rows written"""
+    # not mkstemp: the dump gets the usual permissions (umask), not 0600
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    rows = 0
+    try:
+        with _open_text(tmp_path, compression) as out:
+            if fmt == 'jsonl':
+                for batch in repo.json_batches(table, arraysize=arraysize):
+                    out.write('\n'.join([row[0] for row in batch]))
+                    out.write('\n')
+                    rows += len(batch)
+            else:
+                writer = csv.writer(out)
+                writer.writerow(repo.columns(table))
+                for batch in repo.batches(table, arraysize=arraysize):
+                    writer.writerows(batch)
+                    rows += len(batch)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return rows
+
+def _open_text(path: Path, compression: str) -> TextIO:
+    """UTF-8 text stream writing a file through the compressor (closing it closes the file)"""
+    if compression == 'gzip':
+        stream = gzip.open(path, 'wb', compresslevel=GZIP_LEVEL)
+    elif compression == 'zstd':
+        stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, 'wb'))
+    else:
+        stream = open(path, 'wb')
+    # newline='': no newline translation (CSV rows end with \r\n as the csv module writes them)
+    return io.TextIOWrapper(stream, encoding='utf-8', newline='', write_through=False)
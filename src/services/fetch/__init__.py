@@ -0,0 +1,13 @@
+from .http import HttpClient, HttpResponse, HttpError
+from .limits import TokenBucket
+from .adapters import SourceAdapter, FetchError, ADAPTERS, register_adapter, MusicBrainzAdapter, DiscogsAdapter, RYMAdapter
+from .cache import ResponseCache, CachedResponse
+from .engine import FetchEngine, SourceClient, DEFAULT_RETRIES, DEFAULT_LEASE
+
+__all__ = [
+    'HttpClient', 'HttpResponse', 'HttpError',
+    'TokenBucket',
+    'SourceAdapter', 'FetchError', 'ADAPTERS', 'register_adapter', 'MusicBrainzAdapter', 'DiscogsAdapter', 'RYMAdapter',
+    'ResponseCache', 'CachedResponse',
+    'FetchEngine', 'SourceClient', 'DEFAULT_RETRIES', 'DEFAULT_LEASE'
+           ]
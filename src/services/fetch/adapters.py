@@ -0,0 +1,188 @@
+"""
+Source adapters: how a metadata source is queried and rate limited.
+
+An adapter turns an album into an api_queries row (endpoint + parameters) and,
+at fetch time, turns that row into the stored response_data through the
+SourceClient it receives (rate limited, retried and coalesced by the engine).
+Requests shared by many queries (e.g. the artist lookup behind every album of
+that artist) are sent once. Register new adapters with @register_adapter.
+"""
+import os
+import re
+from typing import Dict, Any, Optional, Tuple, Type
+from core.config import load_env
+
+class FetchError(Exception):
+    """A query failed for good (bad status, unexpected payload): no retry"""
+
+
+class SourceAdapter:
+    """Base adapter: GET base_url + endpoint with the query parameters, store the JSON body"""
+    name: str = ''                # sources.name
+    api_url: Optional[str] = None # API root, if it differs from sources.base_url
+    rate: float = 1.0             # requests per second (average)
+    burst: int = 1                # requests allowed back to back
+    concurrency: int = 2          # requests in flight
+    headers: Dict[str, str] = {}  # sent with every request
+    cache_ttl: float = 7 * 86400  # seconds a cached response is used without revalidation
+
+    def __init__(self, base_url: Optional[str] = None, match_threshold: Optional[float] = None):
+        """
+        Args:
+            base_url: API root overriding api_url and sources.base_url (e.g. a local stub server)
+            match_threshold: minimum confidence of a search result matched to an album (default: MATCH_THRESHOLD)
+        """
+        self.base_url = base_url
+        self.match_threshold = match_threshold
+        self._matcher = None
+
+    @property
+    def matcher(self) -> 'AlbumMatcher':
+        """Matcher of the search results (NumPy is loaded by the first fetch, not when the sources are listed)"""
+        if self._matcher is None:
+            from .matcher import AlbumMatcher
+            self._matcher = AlbumMatcher(threshold=self.match_threshold)
+        return self._matcher
+
+    def resolve_base_url(self, source_base_url: Optional[str]) -> str:
+        """API root actually used: override > api_url > sources.base_url"""
+        return (self.base_url or self.api_url or source_base_url or '').rstrip('/')
+
+    def available(self) -> Tuple[bool, str]:
+        """(usable, reason if not), e.g. a missing API token"""
+        return True, ''
+
+    def album_query(self, album: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(endpoint, parameters) of the query for an album row, None if the source has nothing for albums"""
+        return None
+
+    async def fetch(self, client: 'SourceClient', query: Dict[str, Any]) -> Any:
+        """Run a claimed api_queries row and return its response_data (JSON-serializable)"""
+        return await client.get_json(query['endpoint'], query['parameters'])
+
+
+ADAPTERS: Dict[str, Type[SourceAdapter]] = {}
+
+def register_adapter(cls: Type[SourceAdapter]) -> Type[SourceAdapter]:
+    """Class decorator adding an adapter to ADAPTERS under its source name"""
+    ADAPTERS[cls.name] = cls
+    return cls
+
+def _album(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Album side of a match, from the parameters of its query"""
+    return {'title': params['title'], 'album_artist': params['artist'], 'release_year': params.get('year')}
+
+
+#------------ BUILT-IN ADAPTERS -----------#
+
+@register_adapter
+class MusicBrainzAdapter(SourceAdapter):
+    """
+    MusicBrainz web service: artist search, then the release groups of the artist.
+    Both requests depend only on the artist, so all the albums of an artist share them.
+    """
+    name = 'MusicBrainz'
+    rate = 1.0  # documented limit: 1 request per second per client
+    burst = 1
+    concurrency = 1
+    headers = {'Accept': 'application/json'}
+    cache_ttl = 30 * 86400
+
+    def album_query(self, album: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        return '/ws/2/release-group', {'artist': album['album_artist'], 'title': album['title'], 'year': album['release_year']}
+
+    async def fetch(self, client: 'SourceClient', query: Dict[str, Any]) -> Any:
+        params = query['parameters']
+        artist_name = params['artist'].replace('"', '\\"')
+        artists = await client.get_json('/ws/2/artist', {'query': f'artist:"{artist_name}"', 'fmt': 'json', 'limit': 1})
+        if not artists.get('artists'):
+            return {'artist': None, 'release_group': None}
+        artist = artists['artists'][0]
+        groups = await client.get_json('/ws/2/release-group', {'artist': artist['id'], 'fmt': 'json', 'limit': 100})
+        groups = groups.get('release-groups', [])
+        candidates = [{'title': g.get('title'), 'artist': artist.get('name'), 'year': g.get('first-release-date')} for g in groups]
+        match = self.matcher.best(_album(params), candidates)
+        return {
+            'artist': {key: artist.get(key) for key in ('id', 'name', 'score', 'country', 'type')},
+            'release_group': groups[match.index] if match else None,
+            'confidence': match.confidence if match else None,
+        }
+
+@register_adapter
+class DiscogsAdapter(SourceAdapter):
+    """
+    Discogs database search (needs a personal token in DISCOGS_TOKEN).
+    The master releases of the artist are searched once and shared by all their albums,
+    with a release search only for the albums not found there.
+    """
+    name = 'Discogs'
+    api_url = 'https://api.discogs.com'
+    rate = 1.0  # 60 requests per minute with a token
+    burst = 5
+    concurrency = 2
+
+    def __init__(self, base_url: Optional[str] = None, token: Optional[str] = None, match_threshold: Optional[float] = None):
+        super().__init__(base_url, match_threshold)
+        load_env()  # the token may come from the .env file
+        self.token = token or os.getenv('DISCOGS_TOKEN')
+        self.headers = {'Accept': 'application/json'}
+        if self.token:
+            self.headers['Authorization'] = f'Discogs token={self.token}'
+
+    def available(self) -> Tuple[bool, str]:
+        if not self.token and not self.base_url:
+            return False, 'DISCOGS_TOKEN is not set'
+        return True, ''
+
+    def album_query(self, album: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        return '/database/search', {'artist': album['album_artist'], 'title': album['title'], 'year': album['release_year']}
+
+    async def fetch(self, client: 'SourceClient', query: Dict[str, Any]) -> Any:
+        params = query['parameters']
+        album = _album(params)
+        masters = await client.get_json('/database/search', {'type': 'master', 'artist': params['artist'], 'per_page': 100})
+        masters = masters.get('results', [])
+        match = self.matcher.best(album, [_discogs_candidate(result) for result in masters])
+        if match:
+            return {'type': 'master', 'result': masters[match.index], 'confidence': match.confidence}
+        releases = await client.get_json('/database/search', {'type': 'release', 'artist': params['artist'], 'release_title': params['title'], 'per_page': 5})
+        releases = releases.get('results', [])
+        match = self.matcher.best(album, [_discogs_candidate(result) for result in releases])
+        return {'type': 'release', 'result': releases[match.index] if match else None, 'confidence': match.confidence if match else None}
+
+def _discogs_candidate(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Matcher candidate of a search result: Discogs titles are 'Artist - Title'"""
+    artist, separator, title = (result.get('title') or '').partition(' - ')
+    if not separator:
+        artist, title = '', artist
+    return {'title': title, 'artist': artist, 'year': result.get('year')}
+
+@register_adapter
+class RYMAdapter(SourceAdapter):
+    """
+    RateYourMusic has no public API: the artist page is fetched (once per artist)
+    and the album page URL is looked up in its links. Very low rate: RYM bans fast clients.
+    """
+    name = 'RYM'
+    rate = 0.2
+    burst = 1
+    concurrency = 1
+    cache_ttl = 30 * 86400
+
+    def album_query(self, album: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        return f"/artist/{_rym_slug(album['album_artist'])}", {'title': album['title']}
+
+    async def fetch(self, client: 'SourceClient', query: Dict[str, Any]) -> Any:
+        response = await client.get(query['endpoint'])
+        if response.status == 404:
+            return {'artist_url': None, 'album_url': None}
+        if response.status != 200:
+            raise FetchError(f"HTTP {response.status} for {response.url}")
+        slug = _rym_slug(query['parameters']['title'])
+        match = re.search(rf'href="(/release/[a-z]+/[^/"]+/{re.escape(slug)}/)"', response.text())
+        return {'artist_url': response.url, 'album_url': client.base_url + match.group(1) if match else None}
+
+def _rym_slug(name: str) -> str:
+    """RYM URL slug: lower case, spaces to '-', punctuation dropped ('OK Computer' -> 'ok-computer')"""
+    slug = re.sub(r"[^\w\s-]", '', name.lower().replace('&', 'and'))
+    return re.sub(r"[\s_]+", '-', slug).strip('-')
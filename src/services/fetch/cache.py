@@ -0,0 +1,204 @@
+"""
+Two-tier cache of the source HTTP responses.
+
+    - memory: LRU of decoded responses, evicted by total body size
+    - database: api_cache rows with the body compressed (zstd if the optional
+      `zstandard` package is installed, zlib otherwise), written in batches
+
+Entries are keyed by (source, url, normalized parameters) and expire after the
+TTL of their source. Expired entries with an ETag or Last-Modified validator are
+revalidated with a conditional request: a 304 extends them without a download.
+"""
+import hashlib
+import json
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+from core import CacheStats
+from db import CacheRepository
+from .http import HttpResponse
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# bytes of decoded bodies kept by the memory tier
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+# bodies smaller than this are stored uncompressed
+MIN_COMPRESS_SIZE = 256
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+# statuses worth caching: successes and "not found" (negative caching)
+CACHEABLE_STATUSES = frozenset({200, 203, 204, 404, 410})
+
+@dataclass
+class CachedResponse:
+    response: HttpResponse
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+    tier: str = 'memory' # tier that served the entry: 'memory' | 'disk'
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return self.expires_at > (time.time() if now is None else now)
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Memory + database response cache (see module docstring)"""
+    def __init__(self, db_path: Path, memory_bytes: int = DEFAULT_MEMORY_BYTES, codec: Optional[str] = None):
+        """
+        Args:
+            db_path: database path
+            memory_bytes: max decoded bytes of the memory tier
+            codec: 'zstd' | 'zlib' | 'raw' for new entries (default: zstd if available, else zlib)
+        """
+        if codec == 'zstd' and zstandard is None:
+            raise ValueError("the zstd codec needs the 'zstandard' package")
+        self.codec = codec or ('zstd' if zstandard is not None else 'zlib')
+        self.memory_bytes = memory_bytes
+        self.cache_repo = CacheRepository(db_path)
+        self.stats = CacheStats()
+        self._memory: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._memory_used = 0
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._refreshed: Dict[str, Tuple[float, float, str]] = {}
+        if zstandard is not None:
+            self._zstd_compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            self._zstd_decompressor = zstandard.ZstdDecompressor()
+
+    @staticmethod
+    def make_key(source_id: int, url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Cache key: the parameter order and None values do not matter"""
+        normalized = sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None)
+        raw = f"{source_id}\n{url}\n{json.dumps(normalized, separators=(',', ':'))}"
+        return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+    def lookup(self, key: str) -> Optional[CachedResponse]:
+        """Cached response (fresh or stale), memory tier first. Not counted as a hit until hit() is called"""
+        cached = self._memory.get(key)
+        if cached is not None:
+            self._memory.move_to_end(key)
+            cached.tier = 'memory'
+            return cached
+
+        row = self._pending.get(key) or self.cache_repo.get_entry(key)
+        if row is None:
+            return None
+        try:
+            body = self._decompress(row['codec'], row['body'])
+        except (zlib.error, ValueError):
+            return None  # unreadable entry (e.g. zstd without the package): refetch it
+        headers = {'content-type': row['content_type']} if row['content_type'] else {}
+        cached = CachedResponse(
+            response=HttpResponse(url=row['url'], status=row['status'], headers=headers, body=body),
+            etag=row['etag'], last_modified=row['last_modified'], expires_at=row['expires_at'],
+        )
+        if key in self._refreshed:
+            cached.expires_at = self._refreshed[key][1]
+        self._remember(key, cached)
+        cached.tier = 'disk'
+        return cached
+
+    def hit(self, cached: CachedResponse) -> HttpResponse:
+        """Serve a fresh entry returned by lookup()"""
+        if cached.tier == 'memory':
+            self.stats.memory_hits += 1
+        else:
+            self.stats.disk_hits += 1
+        self.stats.bytes_saved += len(cached.response.body)
+        return cached.response
+
+    def store(self, key: str, source_id: int, response: HttpResponse, ttl: float) -> None:
+        """Cache a response (ignored if its status is not cacheable)"""
+        if response.status not in CACHEABLE_STATUSES:
+            return
+        now = time.time()
+        codec = self.codec if len(response.body) >= MIN_COMPRESS_SIZE else 'raw'
+        body = self._compress(codec, response.body)
+        if len(body) >= len(response.body):
+            codec, body = 'raw', response.body  # incompressible
+        self._pending[key] = {
+            'key': key,
+            'source_id': source_id,
+            'url': response.url.split('?', 1)[0],
+            'status': response.status,
+            'content_type': response.headers.get('content-type'),
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+            'codec': codec,
+            'body': body,
+            'raw_size': len(response.body),
+            'fetched_at': now,
+            'expires_at': now + ttl,
+        }
+        self._refreshed.pop(key, None)
+        self._remember(key, CachedResponse(response, response.headers.get('etag'), response.headers.get('last-modified'), now + ttl))
+        self.stats.stored += 1
+        self.stats.bytes_raw += len(response.body)
+        self.stats.bytes_stored += len(body)
+
+    def revalidated(self, key: str, cached: CachedResponse, ttl: float) -> HttpResponse:
+        """A conditional request got 304: extend the entry and return the cached response"""
+        now = time.time()
+        cached.expires_at = now + ttl
+        if key in self._pending:
+            self._pending[key].update(fetched_at=now, expires_at=cached.expires_at)
+        else:
+            self._refreshed[key] = (now, cached.expires_at, key)
+        self.stats.revalidated += 1
+        self.stats.bytes_saved += len(cached.response.body)
+        return cached.response
+
+    def flush(self) -> None:
+        """Write the new and revalidated entries to the database"""
+        pending, self._pending = list(self._pending.values()), {}
+        refreshed, self._refreshed = list(self._refreshed.values()), {}
+        self.cache_repo.save_entries(pending)
+        self.cache_repo.refresh_entries(refreshed)
+
+    def purge(self, grace: float = 0) -> int:
+        """Delete the entries expired more than `grace` seconds ago"""
+        self.flush()
+        return self.cache_repo.purge(time.time() - grace)
+
+    def _remember(self, key: str, cached: CachedResponse) -> None:
+        size = len(cached.response.body)
+        if size > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_used -= len(previous.response.body)
+        self._memory[key] = cached
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted.response.body)
+
+    def _compress(self, codec: str, data: bytes) -> bytes:
+        if codec == 'zstd':
+            return self._zstd_compressor.compress(data)
+        if codec == 'zlib':
+            return zlib.compress(data, ZLIB_LEVEL)
+        return data
+
+    def _decompress(self, codec: str, data: bytes) -> bytes:
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ValueError("zstd entry without the 'zstandard' package")
+            return self._zstd_decompressor.decompress(data)
+        if codec == 'zlib':
+            return zlib.decompress(data)
+        return bytes(data)
@@ -0,0 +1,346 @@
+import asyncio
+import json
+import random
+import time
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Set, Any, Optional, Callable, Iterable
+from core import FetchStats, profiler
+from db import QueryRepository, AlbumRepository, make_worker_id, DEFAULT_MAX_ATTEMPTS
+from .http import HttpClient, HttpResponse, HttpError
+from .limits import TokenBucket
+from .adapters import SourceAdapter, FetchError, ADAPTERS
+from .cache import ResponseCache
+
+# attempts after the first one for connection errors, 429 and 5xx
+DEFAULT_RETRIES = 4
+# first backoff delay (seconds), doubled at every retry, plus jitter
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# finished queries written per transaction
+FLUSH_EVERY = 100
+# completed responses kept for coalescing the requests that come after them
+RECENT_RESPONSES = 256
+# queue workers per unit of source concurrency: the extra ones wait on coalesced requests
+WORKERS_PER_SLOT = 4
+# queries claimed at once per queue worker
+CLAIM_PER_WORKER = 2
+# seconds a claimed query is reserved to this process (renewed while running)
+DEFAULT_LEASE = 300.0
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class SourceClient:
+    """
+    Requests of one source: response cache, concurrency limit, token bucket,
+    retries with backoff, and coalescing of identical requests (in flight or just completed).
+    """
+    def __init__(self, adapter: SourceAdapter, http: HttpClient, base_url: str, stats: FetchStats, retries: int = DEFAULT_RETRIES,
+                 cache: Optional[ResponseCache] = None, source_id: int = 0, refresh: bool = False):
+        """
+        Args:
+            cache: response cache (None: always hit the network)
+            source_id: sources.id, part of the cache keys
+            refresh: revalidate cached responses even when still fresh
+        """
+        self.adapter = adapter
+        self.http = http
+        self.base_url = base_url
+        self.stats = stats
+        self.retries = retries
+        self.cache = cache
+        self.source_id = source_id
+        self.refresh = refresh
+        self._semaphore = asyncio.Semaphore(adapter.concurrency)
+        self._bucket = TokenBucket(adapter.rate, adapter.burst)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._recent: OrderedDict[str, HttpResponse] = OrderedDict()
+
+    async def get(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> HttpResponse:
+        """
+        GET base_url + endpoint (or an absolute URL).
+
+        Raises:
+            HttpError: if every attempt failed at the connection level
+        """
+        url = endpoint if '://' in endpoint else self.base_url + endpoint
+        key = url + '?' + json.dumps(params or {}, sort_keys=True, default=str)
+
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            self.stats.coalesced += 1
+            return self._recent[key]
+        if key in self._in_flight:
+            self.stats.coalesced += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        cached = cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.source_id, url, params)
+            cached = self.cache.lookup(cache_key)
+            if cached is not None and cached.is_fresh() and not self.refresh:
+                return self.cache.hit(cached)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            response = await self._get_with_retries(url, params, cached.validators() if cached is not None else None)
+            if self.cache is not None:
+                if response.status == 304 and cached is not None:
+                    response = self.cache.revalidated(cache_key, cached, self.adapter.cache_ttl)
+                else:
+                    self.cache.stats.misses += 1
+                    self.cache.store(cache_key, self.source_id, response, self.adapter.cache_ttl)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # retrieved: no warning when nobody else waits
+            raise
+        else:
+            future.set_result(response)
+            self._recent[key] = response
+            if len(self._recent) > RECENT_RESPONSES:
+                self._recent.popitem(last=False)
+            return response
+        finally:
+            del self._in_flight[key]
+
+    async def get_json(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """GET and decode a JSON body, FetchError on non-2xx statuses"""
+        response = await self.get(endpoint, params)
+        if not 200 <= response.status < 300:
+            raise FetchError(f"HTTP {response.status} for {response.url}")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise FetchError(f"invalid JSON from {response.url}") from e
+
+    async def _get_with_retries(self, url: str, params: Optional[Dict[str, Any]], conditional: Optional[Dict[str, str]] = None) -> HttpResponse:
+        params = {key: str(value) for key, value in (params or {}).items() if value is not None}
+        headers = {**self.adapter.headers, **(conditional or {})}
+        for attempt in range(self.retries + 1):
+            error = None
+            async with self._semaphore:
+                await self._bucket.acquire()
+                self.stats.requests += 1
+                try:
+                    response = await self.http.get(url, params=params, headers=headers)
+                    profiler.count(f'http.{self.adapter.name}', rows=1, bytes=len(response.body))
+                except HttpError as e:
+                    error, response = e, None
+            if response is not None and response.status not in _RETRY_STATUSES:
+                return response
+            if attempt == self.retries:
+                if error is not None:
+                    raise error
+                return response
+
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random())
+            retry_after = _retry_after(response) if response is not None else None
+            if retry_after is not None:
+                delay = retry_after
+            if response is not None and response.status == 429:
+                self._bucket.pause(delay)  # slow down the whole source, not just this request
+            self.stats.retries += 1
+            await asyncio.sleep(delay)
+
+def _retry_after(response: HttpResponse) -> Optional[float]:
+    """Seconds from a Retry-After header (delta or HTTP date)"""
+    value = response.headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class FetchEngine:
+    """
+    Drain the pending api_queries of the enabled sources on an asyncio event loop:
+    one SourceClient per source, a few queue workers per concurrency slot,
+    results written in batches.
+
+    Queries are claimed in small batches with a lease (see QueryRepository.claim),
+    renewed while the run is alive, so several fetch processes can drain the same
+    database at once and the queries of a crashed process are picked up again
+    once its leases expire.
+    """
+    def __init__(self, db_path: Path, adapters: Optional[Iterable[SourceAdapter]] = None, retries: int = DEFAULT_RETRIES,
+                 timeout: Optional[float] = None, flush_every: int = FLUSH_EVERY, progress: Optional[Callable[[FetchStats], None]] = None,
+                 cache: Optional[ResponseCache] = None, use_cache: bool = True, refresh: bool = False,
+                 lease_seconds: float = DEFAULT_LEASE, max_attempts: int = DEFAULT_MAX_ATTEMPTS, worker_id: Optional[str] = None):
+        """
+        Args:
+            db_path: database path
+            adapters: adapter instances (default: one of every registered adapter)
+            retries: attempts after the first one for retryable failures
+            timeout: seconds per HTTP request (default: HttpClient default)
+            flush_every: finished queries written per transaction
+            progress: called with the running stats after every flush
+            cache: response cache (default: a ResponseCache on the same database)
+            use_cache: False to always hit the network
+            refresh: revalidate cached responses even when still fresh
+            lease_seconds: lease of the claimed queries (renewed every third of it)
+            max_attempts: claims of a query before it is dead-lettered
+            worker_id: id of this process in the queue (default: host:pid:random)
+        """
+        self.db_path = db_path
+        self.query_repo = QueryRepository(db_path)
+        self.adapters = {adapter.name: adapter for adapter in (adapters if adapters is not None else (cls() for cls in ADAPTERS.values()))}
+        self.retries = retries
+        self.timeout = timeout
+        self.flush_every = flush_every
+        self.progress = progress
+        self.cache = (cache or ResponseCache(db_path)) if use_cache else None
+        self.refresh = refresh
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or make_worker_id()
+        self._sources = {source['name']: source for source in self.query_repo.get_sources()}
+
+    def enabled(self) -> Dict[str, SourceAdapter]:
+        """Adapters with a source row and no missing requirement (see SourceAdapter.available)"""
+        return {
+            name: adapter for name, adapter in self.adapters.items()
+            if name in self._sources and adapter.available()[0]
+        }
+
+    def enqueue_albums(self, status: str = 'pending') -> int:
+        """
+        Queue a query per album (with the given metadata status) and enabled source.
+        Albums already queued for a source are left alone.
+
+        Returns:
+            int: number of new queries
+        """
+        albums = AlbumRepository(self.db_path).get_albums_by_status(status)
+        queries = []
+        for name, adapter in self.enabled().items():
+            source_id = self._sources[name]['id']
+            for album in albums:
+                request = adapter.album_query(album)
+                if request is None:
+                    continue
+                endpoint, parameters = request
+                queries.append({'entity_type': 'album', 'entity_id': album['id'], 'source_id': source_id,
+                                'endpoint': endpoint, 'parameters': parameters})
+        return self.query_repo.enqueue(queries)
+
+    def requeue(self, statuses: Iterable[str] = ('done', 'error')) -> int:
+        """Put the finished (or dead) queries of the enabled sources back to pending (served by the cache when possible)"""
+        return self.query_repo.requeue((self._sources[name]['id'] for name in self.enabled()), statuses=statuses)
+
+    def queue_status(self) -> Dict[str, int]:
+        """Queries per status of the enabled sources"""
+        return self.query_repo.count_by_status(self._sources[name]['id'] for name in self.enabled())
+
+    def run(self, limit: Optional[int] = None) -> FetchStats:
+        """Fetch the claimable queries of the enabled sources (at most `limit`)"""
+        return asyncio.run(self._run(limit))
+
+    async def _run(self, limit: Optional[int]) -> FetchStats:
+        stats = FetchStats()
+        start = time.perf_counter()
+        http = HttpClient() if self.timeout is None else HttpClient(timeout=self.timeout)
+        results: List[Dict[str, Any]] = []
+        held: Set[int] = set()  # claimed by this run and not stored yet
+        budget = {'left': limit}  # queries still claimable by this run (None: no limit)
+        flush_lock = asyncio.Lock()
+
+        async def flush():
+            async with flush_lock:
+                batch = results[:]
+                results.clear()
+                if self.cache is not None:
+                    self.cache.flush()  # before the results: a query is done only once its responses are stored
+                with profiler.stage('fetch.flush'):
+                    stored = await asyncio.to_thread(self.query_repo.complete, self.worker_id, batch, self.max_attempts)
+                stats.lost += len(batch) - stored
+                held.difference_update(result['id'] for result in batch)
+                stats.connections = http.connections_opened
+                stats.elapsed = time.perf_counter() - start
+                if self.progress:
+                    self.progress(stats)
+
+        async def claim(source_id: int, size: int) -> List[Dict[str, Any]]:
+            if budget['left'] is not None:
+                size = min(size, budget['left'])
+                budget['left'] -= size
+            if size <= 0:
+                return []
+            rows = await asyncio.to_thread(self.query_repo.claim, self.worker_id, [source_id], size, self.lease_seconds, self.max_attempts)
+            if budget['left'] is not None:
+                budget['left'] += size - len(rows)
+            held.update(row['id'] for row in rows)
+            stats.queries += len(rows)
+            return rows
+
+        async def worker(adapter: SourceAdapter, client: SourceClient, source_id: int, pending: deque, batch_size: int, exhausted: Dict[int, bool]):
+            while True:
+                if not pending:
+                    async with claim_locks[source_id]:  # one claim at a time: the others wait for its batch
+                        if not pending and not exhausted[source_id]:
+                            pending.extend(await claim(source_id, batch_size))
+                            exhausted[source_id] = not pending
+                    if not pending:
+                        return
+                query = pending.popleft()
+                try:
+                    data = await adapter.fetch(client, query)
+                    results.append({'id': query['id'], 'status': 'done', 'response_data': data})
+                    stats.done += 1
+                except HttpError as e:
+                    # the source is unreachable even after the client retries: try again in a later claim
+                    results.append({'id': query['id'], 'status': 'retry', 'response_data': None, 'error': str(e)})
+                    stats.requeued += 1
+                except (FetchError, KeyError, TypeError, ValueError) as e:
+                    results.append({'id': query['id'], 'status': 'error', 'response_data': None, 'error': str(e)})
+                    stats.errors += 1
+                if len(results) >= self.flush_every:
+                    await flush()
+
+        async def renew_leases():
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                if held:
+                    await asyncio.to_thread(self.query_repo.extend_leases, self.worker_id, list(held), self.lease_seconds)
+
+        tasks = []
+        renewer = asyncio.create_task(renew_leases(), name='fetch-leases')
+        try:
+            exhausted = {}
+            claim_locks = {}
+            for name, adapter in self.enabled().items():
+                source_id = self._sources[name]['id']
+                client = SourceClient(adapter, http, adapter.resolve_base_url(self._sources[name]['base_url']), stats, retries=self.retries,
+                                      cache=self.cache, source_id=source_id, refresh=self.refresh)
+                n_workers = adapter.concurrency * WORKERS_PER_SLOT
+                exhausted[source_id] = False
+                claim_locks[source_id] = asyncio.Lock()
+                pending = deque()
+                # claims of a couple of queries per worker: other processes get their share
+                batch_size = CLAIM_PER_WORKER * n_workers
+                tasks.extend(
+                    asyncio.create_task(worker(adapter, client, source_id, pending, batch_size, exhausted), name=f"fetch-{name}-{i}")
+                    for i in range(n_workers)
+                )
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks + [renewer]:
+                task.cancel()
+            await asyncio.gather(*tasks, renewer, return_exceptions=True)
+            await http.close()
+            await flush()
+            # claimed but never processed (interrupted run): back to pending for the other workers
+            if held:
+                self.query_repo.release(self.worker_id, held)
+        return stats
@@ -0,0 +1,206 @@
+"""
+Minimal asyncio HTTP/1.1 client (GET only) with keep-alive connection pools per host.
+
+Enough for JSON/HTML metadata APIs: Content-Length and chunked bodies,
+gzip/deflate content encoding, redirects, per-request timeouts. Idle
+connections are reused for the next request to the same host, so a fetch
+run opens a handful of TCP/TLS connections instead of one per request.
+"""
+import asyncio
+import json
+import ssl
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urljoin, urlencode
+
+DEFAULT_TIMEOUT = 30.0
+# idle keep-alive connections kept per host
+MAX_IDLE_PER_HOST = 8
+MAX_REDIRECTS = 5
+USER_AGENT = 'taggivm/0.0.1 ( https://github.com/ )'
+
+_REDIRECTS = {301, 302, 303, 307, 308}
+# request headers not forwarded when a redirect leads to another origin (scheme, host or port)
+_CREDENTIAL_HEADERS = {'authorization', 'proxy-authorization', 'cookie'}
+
+class HttpError(Exception):
+    """Connection failure, timeout or malformed response (the request may be retried)"""
+
+
+@dataclass
+class HttpResponse:
+    url: str
+    status: int
+    headers: Dict[str, str] = field(default_factory=dict) # lower-case names
+    body: bytes = b''
+
+    def text(self) -> str:
+        charset = 'utf-8'
+        for param in self.headers.get('content-type', '').split(';')[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'charset' and value:
+                charset = value.strip('"')
+        return self.body.decode(charset, errors='replace')
+
+    def json(self):
+        return json.loads(self.body)
+
+
+_HostKey = Tuple[str, str, int]
+_Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+class HttpClient:
+    """Keep-alive HTTP client shared by the tasks of an event loop"""
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, user_agent: str = USER_AGENT, max_idle_per_host: int = MAX_IDLE_PER_HOST):
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.max_idle_per_host = max_idle_per_host
+        self._idle: Dict[_HostKey, List[_Connection]] = {}
+        self._ssl = ssl.create_default_context()
+        self.connections_opened = 0
+
+    async def get(self, url: str, params: Optional[Dict[str, str]] = None, headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> HttpResponse:
+        """
+        GET a URL, following redirects. The credentials (Authorization, Cookie) are
+        dropped when a redirect leads to another scheme, host or port.
+
+        Raises:
+            HttpError: on connection errors, timeouts and malformed responses (not on HTTP error statuses)
+        """
+        if params:
+            url = f"{url}{'&' if urlsplit(url).query else '?'}{urlencode(params)}"
+        headers = headers or {}
+        for _ in range(MAX_REDIRECTS + 1):
+            try:
+                async with asyncio.timeout(timeout or self.timeout):
+                    response = await self._request(url, headers)
+            except TimeoutError as e:
+                raise HttpError(f"timeout: {url}") from e
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, zlib.error) as e:
+                raise HttpError(f"{type(e).__name__}: {e} ({url})") from e
+            if response.status in _REDIRECTS and 'location' in response.headers:
+                location = urljoin(url, response.headers['location'])
+                if _origin(location) != _origin(url):
+                    headers = {name: value for name, value in headers.items() if name.lower() not in _CREDENTIAL_HEADERS}
+                url = location
+                continue
+            return response
+        raise HttpError(f"too many redirects: {url}")
+
+    async def close(self) -> None:
+        """Close every idle connection"""
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
+
+    async def _request(self, url: str, headers: Dict[str, str]) -> HttpResponse:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"unsupported URL {url!r}")
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+
+        lines = [f"GET {target} HTTP/1.1", f"Host: {host}", f"User-Agent: {self.user_agent}",
+                 "Accept-Encoding: gzip, deflate", "Connection: keep-alive"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        # a pooled connection may have been closed by the server meanwhile: retry once on a new one
+        while True:
+            conn, reused = await self._acquire(key)
+            reader, writer = conn
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, response_headers, body, keep_alive = await self._read_response(reader)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()  # timeouts and cancellations leave the stream in an unknown state
+                raise
+            break
+
+        if keep_alive:
+            self._release(key, conn)
+        else:
+            writer.close()
+        return HttpResponse(url=url, status=status, headers=response_headers, body=_decode(body, response_headers.get('content-encoding', '')))
+
+    async def _acquire(self, key: _HostKey) -> Tuple[_Connection, bool]:
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+        scheme, hostname, port = key
+        conn = await asyncio.open_connection(hostname, port, ssl=self._ssl if scheme == 'https' else None)
+        self.connections_opened += 1
+        return conn, False
+
+    def _release(self, key: _HostKey, conn: _Connection) -> None:
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.max_idle_per_host:
+            idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def _read_response(self, reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str], bytes, bool]:
+        status_line = await reader.readuntil(b'\r\n')
+        version, status, _ = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        status = int(status)
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        if status in (204, 304) or 100 <= status < 200:
+            return status, headers, b'', keep_alive
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';', 1)[0], 16)
+                if size == 0:
+                    # trailers until the empty line
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            return status, headers, b''.join(chunks), keep_alive
+        if 'content-length' in headers:
+            return status, headers, await reader.readexactly(int(headers['content-length'])), keep_alive
+        # body delimited by the end of the connection
+        return status, headers, await reader.read(), False
+
+def _origin(url: str) -> Tuple[str, Optional[str], int]:
+    """(scheme, host, port) of a URL, with the default port of the scheme"""
+    parts = urlsplit(url)
+    try:
+        port = parts.port
+    except ValueError:
+        port = None  # invalid port: rejected by _request
+    return parts.scheme, parts.hostname, port or (443 if parts.scheme == 'https' else 80)
+
+def _decode(body: bytes, encoding: str) -> bytes:
+    encoding = encoding.lower()
+    if encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)  # raw deflate from some servers
+    return body
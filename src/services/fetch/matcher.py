@@ -0,0 +1,259 @@
+"""
+Fuzzy matching of local albums with the search results of a metadata source.
+
+Strings are normalized once per distinct value (case, diacritics, punctuation,
+'&'/'and', a leading 'The', edition notes such as '(Remastered 2011)') and turned
+into hashed character-trigram vectors. All the (album, candidate) pairs of a batch
+are then scored at once with NumPy: cosine similarity of the titles and of the
+artists, closeness of the years and of the track counts, weighted into a confidence
+in [0, 1] (features unknown on either side are left out of the weighting).
+Candidates released too far from the album's year are blocked, and with a shared
+pool of candidates every album is only compared with the candidates of its artist.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Sequence
+import numpy as np
+from core import AlbumMatch
+
+# minimum confidence of a match
+MATCH_THRESHOLD = 0.75
+# weight of every feature in the confidence
+WEIGHTS = {'title': 0.5, 'artist': 0.25, 'year': 0.15, 'tracks': 0.1}
+# candidates further from the album's year are never matched (None: no year blocking)
+MAX_YEAR_GAP = 10
+# year gap scored 0 (the same year scores 1)
+YEAR_SPAN = 5
+# buckets of the hashed trigram vectors
+FEATURE_DIM = 256
+# (album, candidate) pairs scored at once (bounds the vector arrays to ~PAIR_CHUNK * FEATURE_DIM floats)
+PAIR_CHUNK = 32768
+# normalized strings memoized
+NORMALIZE_CACHE_SIZE = 65536
+
+_EDITION = re.compile(r"\s*[(\[][^)\]]*\b(?:remaster(?:ed)?|deluxe|edition|expanded|anniversary|bonus|reissue|mono|stereo)\b[^)\]]*[)\]]", re.IGNORECASE)
+_AND = re.compile(r"\s*[&+]\s*")
+_NON_WORD = re.compile(r"[\W_]+")
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_name(name: str) -> str:
+    """Compared form of a title or artist: 'The Beatles' -> 'beatles', 'Abbey Road (2019 Remaster)' -> 'abbey road'"""
+    # the regular expressions only run on the strings that need them (most names are plain ASCII words)
+    if '(' in name or '[' in name:
+        name = _EDITION.sub('', name)
+    if name.isascii():
+        folded = name.casefold()
+    else:
+        decomposed = unicodedata.normalize('NFKD', name)
+        folded = ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    if '&' in folded or '+' in folded:
+        folded = _AND.sub(' and ', folded)
+    key = _NON_WORD.sub(' ', folded).strip()
+    return key[4:] if key.startswith('the ') else key
+
+def artist_key(name: str) -> str:
+    """Blocking key of an artist: normalized name without spaces"""
+    return normalize_name(name).replace(' ', '')
+
+def _number(value: Any) -> int:
+    """Year or track count as a positive int, 0 if unknown ('1997', '1997-05-21', None)"""
+    if isinstance(value, int):
+        return max(value, 0)
+    match = re.match(r"\s*(\d+)", str(value or ''))
+    return int(match.group(1)) if match else 0
+
+def _numbers(values: List[Any]) -> np.ndarray:
+    """Years or track counts as an array (see _number), converted at once when they are all ints"""
+    try:
+        return np.maximum(np.array(values, dtype=np.int64), 0)
+    except (TypeError, ValueError, OverflowError):
+        return np.fromiter(map(_number, values), dtype=np.int64, count=len(values))
+
+
+class _Vectors:
+    """
+    Hashed trigram vectors of the distinct strings of a batch (row 0: the empty string, unknown),
+    built on demand for the rows a chunk of pairs needs.
+    """
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.rows: Dict[str, int] = {'': 0}  # normalized string -> row
+        self._keys: List[str] = ['']         # row -> normalized string
+        self._raw: Dict[str, int] = {'': 0}  # raw string -> row
+
+    def column(self, values: List[Optional[str]]) -> np.ndarray:
+        """Rows of raw strings (None: unknown), each distinct one normalized once"""
+        values = [value or '' for value in values]
+        for value in set(values).difference(self._raw):
+            key = normalize_name(value)
+            row = self.rows.get(key)
+            if row is None:
+                row = self.rows[key] = len(self._keys)
+                self._keys.append(key)
+            self._raw[value] = row
+        return np.fromiter(map(self._raw.__getitem__, values), dtype=np.int64, count=len(values))
+
+    def cosine(self, left: np.ndarray, right: np.ndarray, dedupe: bool = False) -> np.ndarray:
+        """
+        Cosine similarity of the row pairs (left[i], right[i]).
+        dedupe: compute every distinct pair once (for repetitive columns such as the artists).
+        """
+        if dedupe:
+            n = len(self._keys)
+            pairs, inverse = np.unique(left * n + right, return_inverse=True)
+            return self.cosine(pairs // n, pairs % n)[inverse]
+        rows, inverse = np.unique(np.concatenate((left, right)), return_inverse=True)
+        matrix = self._matrix(rows)
+        return np.einsum('ij,ij->i', matrix[inverse[:len(left)]], matrix[inverse[len(left):]])
+
+    def _matrix(self, rows: np.ndarray) -> np.ndarray:
+        """
+        L2-normalized vectors of some rows: the UTF-8 byte trigrams of ' key ' hashed into dim buckets,
+        all the strings at once (laid out end to end, each followed by a newline; the trigrams
+        spanning two strings are dropped)
+        """
+        padded = [f" {self._keys[row]} \n".encode() for row in rows.tolist()]
+        data = np.frombuffer(b''.join(padded), dtype=np.uint8).astype(np.uint32)
+        row_of = np.repeat(np.arange(len(padded)), [len(p) for p in padded])
+        valid = (row_of[:-2] == row_of[2:]) & (data[2:] != ord('\n'))
+        trigrams = (data[:-2] << 16 | data[1:-1] << 8 | data[2:])[valid]
+        # multiplicative hashing (Knuth), the high bits spread the trigrams over the buckets
+        buckets = ((trigrams * np.uint32(2654435761)) >> np.uint32(16)) % self.dim
+        cells = row_of[:-2][valid] * self.dim + buckets
+        matrix = np.bincount(cells, minlength=len(padded) * self.dim).astype(np.float32).reshape(len(padded), self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+class _Side:
+    """Columns of the albums or of the candidates of a batch: title and artist rows, year, tracks"""
+    def __init__(self, rows: Sequence[Dict[str, Any]], titles: _Vectors, artists: _Vectors, keys: Sequence[str]):
+        title, artist, year, tracks = keys
+        self.title = titles.column([row.get(title) for row in rows])
+        self.artist = artists.column([row.get(artist) for row in rows])
+        self.year = _numbers([row.get(year) for row in rows])
+        self.tracks = _numbers([row.get(tracks) for row in rows])
+
+
+class AlbumMatcher:
+    """Batched album/search result matcher (see module docstring)"""
+    def __init__(self, threshold: Optional[float] = None, weights: Optional[Dict[str, float]] = None,
+                 max_year_gap: Optional[int] = MAX_YEAR_GAP, dim: int = FEATURE_DIM):
+        """
+        Args:
+            threshold: minimum confidence of a match (default: MATCH_THRESHOLD)
+            weights: weight of 'title', 'artist', 'year' and 'tracks' (missing ones: WEIGHTS)
+            max_year_gap: candidates further from the album's year are blocked (None: no blocking)
+            dim: buckets of the trigram vectors
+        """
+        self.threshold = MATCH_THRESHOLD if threshold is None else threshold
+        self.weights = {**WEIGHTS, **(weights or {})}
+        self.max_year_gap = max_year_gap
+        self.dim = dim
+
+    def best(self, album: Dict[str, Any], candidates: Sequence[Dict[str, Any]]) -> Optional[AlbumMatch]:
+        """Best match of a single album (see match)"""
+        return self.match([album], [candidates])[0]
+
+    def match(self, albums: Sequence[Dict[str, Any]], candidates: Sequence[Sequence[Dict[str, Any]]]) -> List[Optional[AlbumMatch]]:
+        """
+        Best candidate of every album, all the pairs scored at once.
+
+        Args:
+            albums: albums rows (title, album_artist, release_year, total_tracks)
+            candidates: search results of every album, dicts with title, artist, year and tracks
+                (missing or empty values are unknown)
+
+        Returns:
+            list: AlbumMatch of every album, None if no candidate reaches the threshold
+        """
+        counts = np.fromiter(map(len, candidates), dtype=np.int64, count=len(albums))
+        offsets = np.cumsum(counts) - counts
+        flat = [candidate for album_candidates in candidates for candidate in album_candidates]
+        pair_album = np.repeat(np.arange(len(albums)), counts)
+        matches = self._best(albums, flat, pair_album, np.arange(len(flat)))
+        for i, match in enumerate(matches):
+            if match is not None:
+                match.index -= int(offsets[i])
+        return matches
+
+    def match_pool(self, albums: Sequence[Dict[str, Any]], pool: Sequence[Dict[str, Any]]) -> List[Optional[AlbumMatch]]:
+        """
+        Best candidate of every album in a pool shared by all of them (e.g. the releases of
+        several artists), each album compared only with the candidates of the same artist.
+
+        Returns:
+            list: AlbumMatch of every album (index: position in the pool), None if unmatched
+        """
+        # blocks: the pool sorted by artist key, as (start, length) ranges
+        key_ids: Dict[str, int] = {}
+        raw_ids: Dict[Optional[str], int] = {}
+        def key_id(name: Optional[str], add: bool) -> int:
+            if name not in raw_ids:
+                key = artist_key(name or '')
+                raw_ids[name] = key_ids.setdefault(key, len(key_ids)) if add else key_ids.get(key, -1)
+            return raw_ids[name]
+        pool_key = np.fromiter((key_id(candidate.get('artist'), True) for candidate in pool), dtype=np.int64, count=len(pool))
+        raw_ids.clear()
+        album_key = np.fromiter((key_id(album.get('album_artist'), False) for album in albums), dtype=np.int64, count=len(albums))
+
+        album_key[album_key < 0] = len(key_ids)  # artist without candidates: an empty last block
+        order = np.argsort(pool_key, kind='stable')
+        block_len = np.bincount(pool_key, minlength=len(key_ids) + 1)
+        block_start = np.cumsum(block_len) - block_len
+        lengths, starts = block_len[album_key], block_start[album_key]
+        # pair i of album a: candidate order[start(a) + position of i in the block]
+        firsts = np.cumsum(lengths) - lengths
+        within = np.arange(lengths.sum()) - np.repeat(firsts, lengths)
+        pair_album = np.repeat(np.arange(len(albums)), lengths)
+        return self._best(albums, pool, pair_album, order[np.repeat(starts, lengths) + within])
+
+    def _best(self, albums: Sequence[Dict[str, Any]], candidates: Sequence[Dict[str, Any]],
+              pair_album: np.ndarray, pair_candidate: np.ndarray) -> List[Optional[AlbumMatch]]:
+        """Best of the (album, candidate) pairs of every album (pairs grouped by album, in album order)"""
+        titles, artists = _Vectors(self.dim), _Vectors(self.dim)
+        album = _Side(albums, titles, artists, ('title', 'album_artist', 'release_year', 'total_tracks'))
+        candidate = _Side(candidates, titles, artists, ('title', 'artist', 'year', 'tracks'))
+
+        if self.max_year_gap is not None:
+            # year blocking before the string similarities
+            year, other_year = album.year[pair_album], candidate.year[pair_candidate]
+            blocked = (year > 0) & (other_year > 0) & (np.abs(year - other_year) > self.max_year_gap)
+            pair_album, pair_candidate = pair_album[~blocked], pair_candidate[~blocked]
+
+        confidence = np.empty(len(pair_album))
+        for start in range(0, len(pair_album), PAIR_CHUNK):
+            chunk = slice(start, start + PAIR_CHUNK)
+            confidence[chunk] = self._confidence(album, candidate, titles, artists, pair_album[chunk], pair_candidate[chunk])
+
+        matches: List[Optional[AlbumMatch]] = [None] * len(albums)
+        if not len(pair_album):
+            return matches
+        # by album, then best first: the first pair of every album group is its best candidate
+        order = np.lexsort((-confidence, pair_album))
+        grouped = pair_album[order]
+        best = order[np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])]
+        for pair in best[confidence[best] >= self.threshold].tolist():
+            matches[pair_album[pair]] = AlbumMatch(index=int(pair_candidate[pair]), confidence=round(float(confidence[pair]), 4))
+        return matches
+
+    def _confidence(self, album: _Side, candidate: _Side, titles: _Vectors, artists: _Vectors,
+                    pair_album: np.ndarray, pair_candidate: np.ndarray) -> np.ndarray:
+        """Weighted similarity of some pairs, over the features known on both sides"""
+        title, other_title = album.title[pair_album], candidate.title[pair_candidate]
+        artist, other_artist = album.artist[pair_album], candidate.artist[pair_candidate]
+        year, other_year = album.year[pair_album], candidate.year[pair_candidate]
+        tracks, other_tracks = album.tracks[pair_album], candidate.tracks[pair_candidate]
+        features = {  # feature -> (similarity, known on both sides)
+            'title': (titles.cosine(title, other_title), (title > 0) & (other_title > 0)),
+            'artist': (artists.cosine(artist, other_artist, dedupe=True), (artist > 0) & (other_artist > 0)),
+            'year': (np.clip(1 - np.abs(year - other_year) / YEAR_SPAN, 0, 1), (year > 0) & (other_year > 0)),
+            'tracks': (1 - np.abs(tracks - other_tracks) / np.maximum(np.maximum(tracks, other_tracks), 1), (tracks > 0) & (other_tracks > 0)),
+        }
+        score = np.zeros(len(pair_album))
+        weight = np.zeros(len(pair_album))
+        for name, (similarity, known) in features.items():
+            score += np.where(known, similarity * self.weights[name], 0)
+            weight += known * self.weights[name]
+        return np.divide(score, weight, out=np.zeros(len(pair_album)), where=weight > 0)
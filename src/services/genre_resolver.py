@@ -0,0 +1,105 @@
+"""
+Free-text genre names ("post punk", "Post-Punk", "Hip Hop") to genres.id rows.
+
+The genres table is loaded once into a hash index keyed by normalized name
+(case, diacritics, punctuation, spacing and "&"/"and" ignored). Names missing
+from the index fall back to an approximate match against the indexed keys
+sharing the most trigrams. Results are memoized per raw string, so the
+repeated tags of a fetch run cost a dictionary lookup.
+"""
+import re
+import difflib
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple, Any, Iterable
+from db import GenreRepository
+
+# minimum difflib ratio for the approximate fallback
+FUZZY_CUTOFF = 0.85
+# indexed keys compared by the fallback (the ones sharing the most trigrams)
+FUZZY_CANDIDATES = 32
+# raw strings memoized by a resolver
+RESOLVER_CACHE_SIZE = 16384
+
+_AND = re.compile(r"\s*(?:&|\+|\band\b|\bn\b)\s*")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+def normalize_genre(name: str) -> str:
+    """Index key of a genre name: 'Rhythm & Blues', 'rhythm and blues', 'Rhythm-n-Blues' -> 'rhythmandblues'"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    ascii_name = ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return _NON_ALNUM.sub('', _AND.sub(' and ', ascii_name))
+
+def _trigrams(key: str) -> set:
+    """Character trigrams of a key, padded so that short keys have some"""
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class GenreResolver:
+    """In-memory genre name resolver (see module docstring)"""
+    def __init__(self, genres: Iterable[Dict[str, Any]], fuzzy_cutoff: float = FUZZY_CUTOFF, cache_size: int = RESOLVER_CACHE_SIZE):
+        """
+        Args:
+            genres: {'id', 'name'} rows, e.g. GenreRepository.get_genres()
+            fuzzy_cutoff: minimum similarity of the approximate fallback (1 disables it)
+            cache_size: raw strings memoized
+        """
+        index: Dict[str, List[int]] = {}
+        for genre in genres:
+            index.setdefault(normalize_genre(genre['name']), []).append(genre['id'])
+        self._index: Dict[str, Tuple[int, ...]] = {key: tuple(sorted(ids)) for key, ids in index.items() if key}
+        # trigram posting lists: the fallback only compares keys sharing some trigrams
+        self._trigrams: Dict[str, List[str]] = {}
+        for key in self._index:
+            for gram in _trigrams(key):
+                self._trigrams.setdefault(gram, []).append(key)
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.resolve = lru_cache(maxsize=cache_size)(self._resolve)
+
+    @classmethod
+    def from_db(cls, db_path: Path, **kwargs) -> 'GenreResolver':
+        """Build the resolver from the genres table"""
+        return cls(GenreRepository(db_path).get_genres(), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _resolve(self, name: str) -> Tuple[int, ...]:
+        """
+        Genre IDs of a free-text name (memoized as `resolve`).
+
+        Returns:
+            tuple: every genre node with that name (one name may sit under several parents), empty if unknown
+        """
+        key = normalize_genre(name)
+        if not key:
+            return ()
+        ids = self._index.get(key)
+        if ids is not None:
+            return ids
+        if self.fuzzy_cutoff >= 1:
+            return ()
+        shared = Counter(candidate for gram in _trigrams(key) for candidate in self._trigrams.get(gram, ()))
+        candidates = [candidate for candidate, _ in shared.most_common(FUZZY_CANDIDATES)]
+        match = difflib.get_close_matches(key, candidates, n=1, cutoff=self.fuzzy_cutoff)
+        return self._index[match[0]] if match else ()
+
+    def resolve_many(self, names: Iterable[str]) -> Dict[str, Tuple[int, ...]]:
+        """
+        Resolve a batch of names (duplicates resolved once).
+
+        Returns:
+            dict: name -> genre IDs (empty tuple for unknown names)
+        """
+        return {name: self.resolve(name) for name in dict.fromkeys(names)}
+
+    def unresolved(self, names: Iterable[str]) -> List[str]:
+        """Names of a batch with no matching genre"""
+        return [name for name, ids in self.resolve_many(names).items() if not ids]
+
+    def cache_info(self):
+        """Hits and misses of the memoized lookups"""
+        return self.resolve.cache_info()
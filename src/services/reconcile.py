@@ -0,0 +1,229 @@
+import os
+import posixpath
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Callable, Iterable, Optional, Tuple, Union
+from core import ReconcileReport, profiler
+from db import ReconcileRepository
+from .walker import iter_library, build_album, DEFAULT_WORKERS
+from .dupes import payload_hash, DEFAULT_HASH_WORKERS
+from .audio_meta import fill_audio_info
+
+class ReconcileError(Exception):
+    """The library on disk cannot be reconciled with the database"""
+
+
+def reconcile_library(src_filepath: Union[Path, List[Path]], db_path: Path, workers: int = DEFAULT_WORKERS, hash_workers: int = DEFAULT_HASH_WORKERS,
+                      read_headers: bool = True, dry_run: bool = False, force: bool = False) -> ReconcileReport:
+    """
+    Bring the database in line with the library on disk without losing the fetched metadata.
+    Tracks at an unknown path are matched to the tracks whose file is gone, in order by:
+        1. file identity (device, inode) recorded by the previous reconcile, same size
+        2. content: payload hash of the files of the same size as a fingerprinted track (see find_duplicates)
+        3. file name within the album folder name, then within the artist folder name (unique matches only)
+    A new album folder takes the ID of the vanished album most of its tracks come from. Matched rows
+    are updated in place, the rest is added or deleted (see ReconcileRepository.apply).
+    With several roots, tracks and albums move across them too; albums outside every root are left alone.
+
+    Args:
+        src_filepath (Path): root of the music library (or list of roots)
+        db_path (Path): database path
+        workers (int): threads listing and stating the library
+        hash_workers (int): threads hashing the candidates of a content match
+        read_headers (bool): read duration and track numbers of the new tracks
+        dry_run (bool): plan only, do not write the database
+        force (bool): apply even if no album is found on disk (unmounted library)
+
+    Returns:
+        ReconcileReport: what was (or would be, on dry run) renamed, moved, added and removed
+    """
+    roots = [src_filepath] if isinstance(src_filepath, Path) else list(src_filepath)
+    prefixes = tuple(Path(root).as_posix().rstrip('/') + '/' for root in roots)
+    repo = ReconcileRepository(db_path)
+    report = ReconcileReport()
+    db_albums = {}
+    unresolved = set()  # albums without artist yet (artist_id 0, as new albums: UNIQUE (title, artist_id))
+    taken_titles = set()  # titles of the unresolved albums of other roots
+    for row in repo.get_albums():
+        if row['path'].startswith(prefixes):
+            db_albums[row['id']] = row['path']
+            if row['artist_id'] == 0:
+                unresolved.add(row['id'])
+        elif row['artist_id'] == 0:
+            taken_titles.add(row['title'])
+    db_tracks = [row for row in repo.get_tracks() if row['album_id'] in db_albums]
+
+    with profiler.stage('reconcile.walk'):
+        folders = []
+        for root, prefix in zip(roots, prefixes):
+            found = list(iter_library(root, workers=workers))
+            if not found and not force and any(path.startswith(prefix) for path in db_albums.values()):
+                raise ReconcileError(f"no album found in '{root}' (not mounted?), force the reconcile to remove its albums")
+            folders.extend(found)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile') as pool:
+            files = [f for album_files in pool.map(_stat_album, folders) for f in album_files]
+
+    with profiler.stage('reconcile.match'):
+        matches = _match_tracks(db_tracks, files, hash_workers, report)
+    row_of = {f['path']: row for row, f in matches}
+
+    # albums: same path, else the vanished album most of the folder's tracks come from
+    disk_albums = {album_path: (artist, album, audio_files) for artist, album, album_path, audio_files in folders}
+    album_ids = {path: album_id for album_id, path in db_albums.items()}
+    assigned = {path: album_ids[path] for path in disk_albums if path in album_ids}
+    claimed = set(assigned.values())
+    for album_path, (_, _, audio_files) in disk_albums.items():
+        if album_path in assigned:
+            continue
+        votes = Counter(row_of[p]['album_id'] for p in (f"{album_path}/{name}" for name in audio_files) if p in row_of)
+        for album_id, _ in votes.most_common():
+            if album_id not in claimed and db_albums[album_id] not in disk_albums:
+                assigned[album_path] = album_id
+                claimed.add(album_id)
+                break
+
+    album_moves = []
+    new_albums = []
+    built = {album_path: build_album(artist, album, Path(album_path), audio_files)
+             for album_path, (artist, album, audio_files) in disk_albums.items()}
+    taken_titles.update(built[album_path].title for album_path, album_id in assigned.items() if album_id in unresolved)
+    for album_path, album_data in built.items():
+        album_id = assigned.get(album_path)
+        if album_id is None and album_data.title in taken_titles:
+            report.conflicts.append(album_path)
+        elif album_id is None:
+            new_albums.append(album_data)
+            taken_titles.add(album_data.title)
+            report.albums_added.append(album_path)
+        elif db_albums[album_id] != album_path:
+            album_moves.append({'id': album_id, 'path': album_path, 'title': album_data.title,
+                                'release_year': album_data.release_year, 'album_artist': album_data.album_artist})
+            report.albums_moved.append((db_albums[album_id], album_path))
+    album_deletes = [album_id for album_id in db_albums if album_id not in claimed]
+    report.albums_removed = [db_albums[album_id] for album_id in album_deletes]
+
+    track_moves = []
+    identities = []
+    for row, f in matches:
+        if row['path'] != f['path'] or db_albums[row['album_id']] != f['album_path']:
+            title, format = f['name'].rsplit('.', 1)
+            track_moves.append({'id': row['id'], 'album_path': f['album_path'], 'path': f['path'], 'title': title, 'format': format.lower()})
+        else:
+            report.tracks_unchanged += 1
+        if (row['file_inode'], row['file_device']) != (f['ino'], f['dev']):
+            identities.append((f['ino'], f['dev'], row['id']))
+    report.tracks_moved = len(track_moves)
+    matched_ids = {row['id'] for row, _ in matches}
+    track_deletes = [row['id'] for row in db_tracks if row['id'] not in matched_ids]
+    report.tracks_removed = len(track_deletes)
+
+    # new files, as albums holding only their unmatched tracks
+    unmatched = defaultdict(list)
+    conflicts = set(report.conflicts)
+    for f in files:
+        if f['path'] not in row_of and f['album_path'] not in conflicts:
+            unmatched[f['album_path']].append(f['name'])
+    new_track_albums = [build_album(*disk_albums[album_path][:2], Path(album_path), names) for album_path, names in unmatched.items()]
+    report.tracks_added = sum(len(names) for names in unmatched.values())
+
+    if dry_run:
+        return report
+
+    if read_headers and new_track_albums:
+        with profiler.stage('reconcile.headers'):
+            new_track_albums = list(fill_audio_info(new_track_albums))
+    new_tracks = [(album.path, track) for album in new_track_albums for track in album.tracklist]
+
+    with profiler.stage('reconcile.apply'):
+        repo.apply(album_moves, track_moves, track_deletes, album_deletes, new_albums, new_tracks, identities)
+    report.applied = True
+    return report
+
+#------------ MATCHING -----------#
+
+def _stat_album(folder: Tuple[str, str, str, List[str]]) -> List[Dict[str, Any]]:
+    """Stat the audio files of an album folder (files gone since the listing are skipped)"""
+    artist, album, album_path, audio_files = folder
+    album_posix = Path(album_path).as_posix()
+    files = []
+    for name in audio_files:
+        path = f"{album_posix}/{name}"
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        files.append({'path': path, 'album_path': album_posix, 'artist': artist, 'album': album, 'name': name,
+                      'size': st.st_size, 'ino': st.st_ino, 'dev': st.st_dev})
+    return files
+
+def _match_tracks(rows: List[Dict[str, Any]], files: List[Dict[str, Any]], hash_workers: int,
+                  report: ReconcileReport) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Pair the database tracks with the files on disk: (row, file) of every match"""
+    by_path = {row['path']: row for row in rows}
+    matches = [(by_path[f['path']], f) for f in files if f['path'] in by_path]
+    matched_rows = {row['id'] for row, _ in matches}
+    rows = [row for row in rows if row['id'] not in matched_rows]
+    files = [f for f in files if f['path'] not in by_path]
+
+    def match(rule: str, row_key: Callable, file_key: Callable, check: Callable = lambda row, f: True) -> None:
+        nonlocal rows, files
+        if not rows or not files:
+            return
+        pairs = [(row, f) for row, f in _unique_pairs(rows, files, row_key, file_key) if check(row, f)]
+        if pairs:
+            matches.extend(pairs)
+            report.matched_by[rule] = report.matched_by.get(rule, 0) + len(pairs)
+            paired_rows = {row['id'] for row, _ in pairs}
+            paired_files = {f['path'] for _, f in pairs}
+            rows = [row for row in rows if row['id'] not in paired_rows]
+            files = [f for f in files if f['path'] not in paired_files]
+
+    match('inode', lambda row: row['file_inode'] is not None and (row['file_device'], row['file_inode']),
+          lambda f: (f['dev'], f['ino']), lambda row, f: row['file_size'] in (None, f['size']))
+
+    # content: hash only the files whose size matches a fingerprinted track
+    sizes = {row['file_size'] for row in rows if row['fingerprint'] and row['file_size'] is not None}
+    candidates = [f for f in files if f['size'] in sizes] if rows else []
+    if candidates:
+        with profiler.stage('reconcile.hash'), ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix='reconcile') as pool:
+            for f, fingerprint in zip(candidates, pool.map(_hash_file, candidates)):
+                f['fingerprint'] = fingerprint
+        report.files_hashed = len(candidates)
+    match('content', lambda row: row['fingerprint'] or None, lambda f: f.get('fingerprint'))
+    # same audio in several tracks (e.g. the same file in two albums): the one from the same album folder name
+    match('content', lambda row: row['fingerprint'] and (row['fingerprint'], _name_key(row['path'], 1)[0]),
+          lambda f: f.get('fingerprint') and (f['fingerprint'], f['album']))
+
+    match('name', lambda row: _name_key(row['path'], 1), lambda f: (f['album'], f['name']))
+    match('name', lambda row: _name_key(row['path'], 2), lambda f: (f['artist'], f['name']))
+    return matches
+
+def _unique_pairs(rows: Iterable[Dict[str, Any]], files: Iterable[Dict[str, Any]],
+                  row_key: Callable, file_key: Callable) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Pairs of row and file sharing a key held by no other row or file (falsy keys never match)"""
+    row_groups = defaultdict(list)
+    for row in rows:
+        key = row_key(row)
+        if key:
+            row_groups[key].append(row)
+    file_groups = defaultdict(list)
+    for f in files:
+        key = file_key(f)
+        if key and key in row_groups:
+            file_groups[key].append(f)
+    return [(row_groups[key][0], group[0]) for key, group in file_groups.items()
+            if len(group) == 1 and len(row_groups[key]) == 1]
+
+def _name_key(path: str, level: int) -> Tuple[str, str]:
+    """(album folder name, file name) for level 1, (artist folder name, file name) for level 2"""
+    folder, name = posixpath.split(path)
+    for _ in range(level - 1):
+        folder = posixpath.dirname(folder)
+    return posixpath.basename(folder), name
+
+def _hash_file(f: Dict[str, Any]) -> Optional[str]:
+    try:
+        return payload_hash(f['path'])
+    except (OSError, ValueError):
+        return None
@@ -1,103 +1,411 @@
 import os
-import re
+import hashlib
+import queue
+import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List
-from core import TrackData, AlbumData
-from db import MusicRepository
+from typing import Dict, List, Iterator, Iterable, Optional, Callable
+from core import AlbumData, ScanReport, IngestStats, profiler
+from db import MusicRepository, AlbumRepository, ScanStateRepository, SearchRepository, StatsRepository, ShardRepository, DEFAULT_BATCH_SIZE
+from .walker import ALBUM_NAME_PATTERN, AUDIO_EXTS, DEFAULT_WORKERS, is_audio, iter_albums, build_album
+from .audio_meta import fill_audio_info
 
-# regex for album folder name like "1999 - OK Computer"
-ALBUM_NAME_PATTERN = re.compile(r"^\d{4} - .+")
+# end of stream marker for the DB writer
+_END = object()
 
-# supported audio file extensions
-AUDIO_EXTS = ('.mp3', '.flac', '.wav', '.m4a')
-def discover_scan(src_filepath: Path ) -> Dict[str, Dict[str, Path]]:
+def discover_scan(src_filepath: Path, workers: int = DEFAULT_WORKERS) -> Iterator[AlbumData]:
     """
-    Discover scan files in the current directory.
+    Discover the albums of the music library, lazily.
+
+    Args:
+        src_filepath (Path): root of the music library
+        workers (int): threads listing the artist subtrees in parallel
+
+    Yields:
+        AlbumData: every valid album, with its tracklist
+    """
+    src_filepath = src_filepath.resolve()  # force absolute path
+    yield from iter_albums(src_filepath, workers=workers)
+
+    # touch .scanned file to mark as scanned
+    # (album_path / '.scanned').touch()
+
+    ## IMPROVEMENT: musicobject function that handdles album and artist id, make no sense to have it on the data structure
+
+def init_album_DB(albums: Iterable[AlbumData], db_path: Path, batch_size: int = DEFAULT_BATCH_SIZE) -> List[int]:
+    """
+    Insert initial data for newly discovered artists, albums, and tracks into the database.
+    Albums already in the database (same path) are skipped, and so are the albums whose
+    title is taken by another album (see MusicRepository.bulk_ingest).
+
+    Args:
+        albums (iterable): album data, e.g. from discover_scan
+        batch_size (int): albums written per transaction
 
     Returns:
-        dict: A dictionary mapping artist names to their album paths.
+        list: IDs of the new albums
     """
+    music_repo = MusicRepository(db_path)
+    deferred = _defer_summaries(db_path)
+    album_ids, _ = music_repo.bulk_ingest(albums, batch_size=batch_size, skip_existing=True)
+    _rebuild_summaries(deferred)
+    return album_ids
 
-    to_scan_albums = []
-    to_skip_albums = []
-    src_filepath = src_filepath.resolve()  # force absolute path
+def stream_scan(src_filepath: Path, db_path: Path, workers: int = DEFAULT_WORKERS, batch_size: int = DEFAULT_BATCH_SIZE,
+                queue_size: Optional[int] = None, progress: Optional[Callable[[IngestStats], None]] = None,
+                read_headers: bool = True, processes: Optional[int] = None) -> IngestStats:
+    """
+    Scan the music library and initialize the new albums in a single pass.
 
-    scan_tree = {}
-    
-    for root, dirs, files in os.walk(src_filepath):
-        root_path = Path(root)
+    Discovery runs on the calling thread (fanning out on the walker threads and,
+    for the audio headers, on a process pool) and feeds a bounded queue drained
+    by a dedicated DB writer thread, so listing and SQLite writes overlap and
+    memory stays flat whatever the library size.
 
-        if '.scanned' in files:
-            to_skip_albums.append(root_path)
-            continue
+    Args:
+        src_filepath (Path): root of the music library
+        db_path (Path): database path
+        workers (int): threads listing the artist subtrees in parallel
+        batch_size (int): albums written per transaction
+        queue_size (int): max albums waiting for the writer (default 2 * batch_size)
+        progress (callable): called with the running stats while scanning
+        read_headers (bool): fill duration, track and disc numbers from the audio file headers
+        processes (int): processes reading the headers (default: CPU count)
 
-        if not any(f.lower().endswith(AUDIO_EXTS) for f in files):
-            continue
+    Returns:
+        IngestStats: albums found, written, skipped (already in the database) and left out (title conflicts)
+    """
+    albums_queue = queue.Queue(maxsize=queue_size or 2 * batch_size)
+    stats = IngestStats()
+    errors = []
+    start = time.perf_counter()
 
-        rel_parts = root_path.relative_to(src_filepath).parts
+    def on_batch(read: int, written: int, tracks: int, conflicts: List[str]):
+        stats.albums += written
+        stats.tracks += tracks
+        stats.skipped += read - written - len(conflicts)
+        stats.conflicts.extend(conflicts)
 
-        if len(rel_parts) != 2:
-            print(f"⚠️ Invalid folder structure: '{root_path}' should be two levels deep (e.g., 'Artist/Album').")
-            to_skip_albums.append(root_path)
-            continue
+    def writer():
+        try:
+            music_repo = MusicRepository(db_path)
+            music_repo.bulk_ingest(iter(albums_queue.get, _END), batch_size=batch_size, skip_existing=True, progress=on_batch)
+        except BaseException as e:
+            errors.append(e)
+            # keep draining so that the scan never blocks on a full queue
+            while albums_queue.get() is not _END:
+                pass
 
-        album_folder = rel_parts[1]
-        if not ALBUM_NAME_PATTERN.match(album_folder):
-            print(f"⚠️  Naming issue: '{album_folder}' does not match 'YYYY - Album Title'")
-            to_skip_albums.append(root_path)
-            continue
+    # initial scan: the search indexes and statistics are built once at the end instead of row by row
+    deferred = _defer_summaries(db_path)
 
-        to_scan_albums.append(root_path)
+    writer_thread = threading.Thread(target=writer, name='db-writer', daemon=True)
+    writer_thread.start()
+    albums = discover_scan(src_filepath, workers=workers)
+    if read_headers:
+        albums = fill_audio_info(albums, processes=processes)
+    try:
+        # discovery time, without the waits on a full queue
+        for album in profiler.timed_iter('scan.discover', albums):
+            with profiler.stage('scan.queue_wait'):
+                albums_queue.put(album)
+            stats.scanned += 1
+            if errors:
+                break
+            if progress and stats.scanned % 100 == 0:
+                stats.elapsed = time.perf_counter() - start
+                progress(stats)
+    finally:
+        albums_queue.put(_END)
+        writer_thread.join()
 
-        artist_folder = rel_parts[0]
+    if errors:
+        raise errors[0]
+    _rebuild_summaries(deferred)
 
-        if artist_folder not in scan_tree:
-            scan_tree[artist_folder] = {}
-        scan_tree[artist_folder][album_folder] = root_path
+    stats.elapsed = time.perf_counter() - start
+    if progress:
+        progress(stats)
+    return stats
 
-    return scan_tree
 
-    
+#------------ SEARCH INDEXES AND STATISTICS -----------#
 
-def init_album_DB(scan_tree:  Dict[str, Dict[str, Path]], db_path: Path) -> None:
+def _defer_summaries(db_path: Path) -> list:
     """
-    Insert initial data for newly discovered artists, albums, and tracks into the database.
+    Turn off the triggers maintaining the search indexes and the library statistics if the
+    database is empty (initial scan). Returns the (profiler stage, repository) pairs to rebuild.
+    """
+    repos = (('scan.search_index', SearchRepository(db_path)), ('scan.stats', StatsRepository(db_path)))
+    return [(stage, repo) for stage, repo in repos if repo.defer_if_empty()]
+
+def _rebuild_summaries(deferred: list) -> None:
+    """Rebuild in bulk what _defer_summaries turned off"""
+    for stage, repo in deferred:
+        with profiler.stage(stage):
+            repo.rebuild()
+
+
+#------------ SHARDED SCAN -----------#
+
+def sharded_scan(roots: List[Path], db_path: Path, workers: int = DEFAULT_WORKERS, batch_size: int = DEFAULT_BATCH_SIZE,
+                 read_headers: bool = True, processes: Optional[int] = None,
+                 on_root: Optional[Callable[[Path, IngestStats], None]] = None) -> IngestStats:
+    """
+    Scan several library roots at the same time, one worker process per root, each writing a
+    private staging database (shard) next to the main one. Every shard is merged into the main
+    database as soon as its root is done (see ShardRepository.merge), so a slow spindle does not
+    hold back the SSD roots. Albums already in the database or whose title is taken by an album
+    of another root are skipped.
 
     Args:
-        scan_tree (dict): Nested dict of artist -> album -> path.
+        roots: library roots (e.g. lossless, lossy and archive mounts)
+        db_path (Path): main database path
+        workers (int): threads listing the artist subtrees of each root
+        batch_size (int): albums written per transaction (in the shards)
+        read_headers (bool): fill duration, track and disc numbers from the audio file headers
+        processes (int): processes reading the headers of each root (default: CPU count / roots)
+        on_root (callable): called with (root, stats of its merge) when a root is merged
+
+    Returns:
+        IngestStats: totals of every root (elapsed: wall time of the whole scan), the title
+            conflicts of every root
     """
-    for artist, albums in scan_tree.items():
-        for album, album_path in albums.items():
-            year, album_title = album.split(' - ', 1)
-            for root, dirs, files in os.walk(album_path):
-                
-                total_tracks = sum(1 for f in files if f.lower().endswith(AUDIO_EXTS))
-                album_obj = AlbumData(
-                    title=album_title,
-                    release_year=year,
-                    album_artist=artist,
-                    total_tracks=total_tracks,
-                    path=album_path.as_posix(),
-                    tracklist=[]
-                )
-                
-                for f in files:
-                    if f.lower().endswith(AUDIO_EXTS):
-                        title, format = f.rsplit('.', 1)
-                        # check why with e.. di yeat seams spaced
-                        track_obj = TrackData(
-                            title=title,
-                            path=(Path(root) / f).as_posix(),
-                            format=format,
-                        )
-                        album_obj.tracklist.append(track_obj)
-                
-            # Initialize the album in the database
-            music_repo = MusicRepository(db_path)
-            album_id = music_repo.new_album_tracklist(album_obj)
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+
+    start = time.perf_counter()
+    if processes is None:
+        processes = max(1, (os.cpu_count() or 1) // len(roots))
+    total = IngestStats()
+    shard_repo = ShardRepository(db_path)
+    deferred = _defer_summaries(db_path)
+
+    with tempfile.TemporaryDirectory(prefix='.taggivm-shards-', dir=Path(db_path).parent) as shards_dir:
+        # spawn: the parent may run threads (writer, walker), forking them is unsafe
+        with ProcessPoolExecutor(max_workers=len(roots), mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {
+                pool.submit(_scan_shard, root, Path(shards_dir) / f"shard-{i}.db", workers, batch_size, read_headers, processes): root
+                for i, root in enumerate(roots)
+            }
+            for future in as_completed(futures):
+                root = futures[future]
+                shard_path, shard_stats = future.result()
+                with profiler.stage('scan.merge'):
+                    merged = shard_repo.merge(shard_path)
+                os.remove(shard_path)
+                # title conflicts inside the root (left out of the shard) and with the database
+                stats = IngestStats(scanned=shard_stats.scanned, albums=merged['albums'], tracks=merged['tracks'],
+                                    skipped=merged['skipped'], conflicts=shard_stats.conflicts + merged['conflicts'],
+                                    elapsed=shard_stats.elapsed)
+                total.scanned += stats.scanned
+                total.albums += stats.albums
+                total.tracks += stats.tracks
+                total.skipped += stats.skipped
+                total.conflicts.extend(stats.conflicts)
+                if on_root:
+                    on_root(root, stats)
+
+    _rebuild_summaries(deferred)
+    total.elapsed = time.perf_counter() - start
+    return total
+
+def _scan_shard(root: Path, shard_path: Path, workers: int, batch_size: int, read_headers: bool, processes: int):
+    """Worker process: scan a root into a new staging database, return (shard path, stats)"""
+    from db import init_db, get_manager, close_all, BULK_PRAGMAS
+    init_db(shard_path)
+    # throwaway database: no fsync, no search index nor statistics (the main database builds its own)
+    get_manager(shard_path, BULK_PRAGMAS)
+    _defer_summaries(shard_path)
+    stats = stream_scan(root, shard_path, workers=workers, batch_size=batch_size, read_headers=read_headers, processes=processes)
+    close_all()
+    return shard_path, stats
+
+
+#------------ INCREMENTAL SCAN -----------#
+
+def incremental_scan(src_filepath: Path, db_path: Path, read_headers: bool = True, processes: Optional[int] = None,
+                     check_files: bool = False) -> ScanReport:
+    """
+    Scan the music library using the directory-state manifest stored in the database.
+
+    Artist folders whose (mtime, inode) did not change are not listed again: only their
+    known album folders are stat'ed. Album folders are listed only when their own state
+    changed. Newly found albums are initialized on the database, changed and removed
+    albums are reported, and so are the new albums left out because their title is taken
+    by another album. Nothing is written into the music tree.
+
+    An album is changed when the names, sizes or mtimes of its audio files differ from the
+    manifest. A file rewritten in place (e.g. a tag editor) does not change the state of
+    its folder: such edits are found only with check_files, which lists every known album
+    folder again and compares the stat of its audio files.
+
+    Albums new to the manifest but already in the database (e.g. the first incremental scan
+    after a full scan) are not added again: they are only recorded in the manifest.
+
+    Args:
+        src_filepath (Path): root of the music library
+        db_path (Path): database path
+        read_headers (bool): fill duration, track and disc numbers of the new albums from the audio file headers
+        processes (int): processes reading the headers (default: CPU count)
+        check_files (bool): stat the audio files of the unchanged album folders too
+
+    Returns:
+        ScanReport: added, changed, removed and conflicting album paths, albums already in the database
+    """
+    src_filepath = src_filepath.resolve()  # force absolute path
+    state_repo = ScanStateRepository(db_path)
+    # the manifest holds the folders of every library root: only this one is compared
+    root_prefix = os.path.join(os.fspath(src_filepath), '')
+    previous = {path: state for path, state in state_repo.get_states().items() if path.startswith(root_prefix)}
+
+    prev_artists = {}
+    prev_albums = {}  # artist path -> {album path -> state}
+    for path, state in previous.items():
+        if state['kind'] == 'artist':
+            prev_artists[path] = state
+        else:
+            prev_albums.setdefault(state['parent'], {})[path] = state
+
+    report = ScanReport()
+    new_states = []
+    new_albums = []  # AlbumData to initialize
+    gone_paths = []
+
+    report.dirs_listed += 1
+    with os.scandir(src_filepath) as it:
+        artist_entries = [e for e in it if e.is_dir()]
+
+    for artist_entry in artist_entries:
+        artist_path = artist_entry.path
+        artist_stat = artist_entry.stat()
+        prev_artist = prev_artists.pop(artist_path, None)
+        known_albums = prev_albums.pop(artist_path, {})
+
+        if prev_artist and _same_dir(prev_artist, artist_stat):
+            # same album folders as last time: only stat them
+            for album_path, prev_album in known_albums.items():
+                report.dirs_checked += 1
+                try:
+                    album_stat = os.stat(album_path)
+                except FileNotFoundError:
+                    # may happen on filesystems not updating the parent mtime
+                    gone_paths.append(album_path)
+                    if prev_album['is_album']:
+                        report.removed.append(Path(album_path))
+                    continue
+                if _same_dir(prev_album, album_stat) and not (check_files and prev_album['is_album']):
+                    report.unchanged += prev_album['is_album']
+                    continue
+                _rescan_album(artist_entry.name, album_path, album_stat, artist_path, prev_album, report, new_states, new_albums)
+            continue
+
+        # artist folder changed: list it again
+        report.dirs_listed += 1
+        with os.scandir(artist_path) as it:
+            entries = list(it)
+        album_entries = [e for e in entries if e.is_dir()]
+        new_states.append(_dir_state(artist_path, 'artist', None, artist_stat, len(entries)))
+
+        for album_entry in album_entries:
+            album_path = album_entry.path
+            album_stat = album_entry.stat()
+            prev_album = known_albums.pop(album_path, None)
+            if prev_album and _same_dir(prev_album, album_stat) and not (check_files and prev_album['is_album']):
+                report.unchanged += prev_album['is_album']
+                continue
+            _rescan_album(artist_entry.name, album_path, album_stat, artist_path, prev_album, report, new_states, new_albums)
+
+        # album folders that disappeared
+        for album_path, prev_album in known_albums.items():
+            gone_paths.append(album_path)
+            if prev_album['is_album']:
+                report.removed.append(Path(album_path))
+
+    # artist folders that disappeared
+    for artist_path in prev_artists:
+        gone_paths.append(artist_path)
+        for album_path, prev_album in prev_albums.pop(artist_path, {}).items():
+            if prev_album['is_album']:
+                report.removed.append(Path(album_path))
+
+    # albums ingested by a full scan (or another tool) only enter the manifest
+    if new_albums:
+        in_database = AlbumRepository(db_path).get_album_paths()
+        known = {album.path for album in new_albums if album.path in in_database}
+        if known:
+            report.in_database += len(known)
+            report.added = [path for path in report.added if path.as_posix() not in known]
+            new_albums = [album for album in new_albums if album.path not in known]
+
+    # initialize the new albums
+    if new_albums:
+        if read_headers:
+            new_albums = fill_audio_info(new_albums, processes=processes)
+        deferred = _defer_summaries(db_path)
+        _, conflicts = MusicRepository(db_path).bulk_ingest(new_albums, skip_existing=True)
+        _rebuild_summaries(deferred)
+        if conflicts:
+            # not written: not added, and their folder and its artist folder are left out of the
+            # manifest so that the next scan lists them (and tries them) again
+            report.conflicts = [Path(path) for path in conflicts]
+            report.added = [path for path in report.added if path not in report.conflicts]
+            excluded = set(conflicts) | {os.path.dirname(path) for path in conflicts}
+            new_states = [state for state in new_states if state['path'] not in excluded]
+
+    # the manifest is updated only after the albums are safely stored
+    with profiler.stage('scan.manifest'):
+        state_repo.delete_states(gone_paths)
+        state_repo.save_states(new_states)
+
+    return report
+
+def _same_dir(state: dict, st: os.stat_result) -> bool:
+    """Check if a stored directory state matches the current stat"""
+    return state['mtime_ns'] == st.st_mtime_ns and state['inode'] == st.st_ino
+
+def _dir_state(path: str, kind: str, parent: str, st: os.stat_result, entry_count: int, audio_digest: str = None, is_album: bool = False) -> dict:
+    """Build a manifest row"""
+    return {
+        'path': path,
+        'kind': kind,
+        'parent': parent,
+        'mtime_ns': st.st_mtime_ns,
+        'inode': st.st_ino,
+        'entry_count': entry_count,
+        'audio_digest': audio_digest,
+        'is_album': int(is_album),
+    }
+
+def _rescan_album(artist: str, album_path: str, album_stat: os.stat_result, artist_path: str, prev_album: dict, report: ScanReport, new_states: list, new_albums: list) -> None:
+    """List an album folder whose state changed and classify it as added, changed or unchanged"""
+    report.dirs_listed += 1
+    with os.scandir(album_path) as it:
+        entries = list(it)
+
+    album = os.path.basename(album_path)
+    audio_entries = [e for e in entries if is_audio(e.name) and e.is_file()]
+    digest = hashlib.blake2b(digest_size=16)
+    for e in sorted(audio_entries, key=lambda e: e.name):
+        st = e.stat()
+        digest.update(f"{e.name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8', 'surrogateescape'))
+    audio_digest = digest.hexdigest()
 
-            # touch .scanned file to mark as scanned
-            # (album_path / '.scanned').touch()
+    is_album = bool(audio_entries)
+    if is_album and not ALBUM_NAME_PATTERN.match(album):
+        print(f"⚠️  Naming issue: '{album}' does not match 'YYYY - Album Title'")
+        is_album = False
 
+    new_states.append(_dir_state(album_path, 'album', artist_path, album_stat, len(entries), audio_digest, is_album))
+    was_album = bool(prev_album and prev_album['is_album'])
 
-            ## IMPROVEMENT: musicobject function that handdles album and artist id, make no sense to have it on the data structure
\ No newline at end of file
+    if is_album and not was_album:
+        report.added.append(Path(album_path))
+        new_albums.append(build_album(artist, album, Path(album_path), [e.name for e in audio_entries]))
+    elif is_album and prev_album['audio_digest'] != audio_digest:
+        report.changed.append(Path(album_path))
+    elif is_album:
+        report.unchanged += 1
+    elif was_album:
+        report.removed.append(Path(album_path))
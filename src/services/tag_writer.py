@@ -0,0 +1,641 @@
+"""
+In-place tag writing: FLAC Vorbis comments, MP3 ID3v2.3/2.4 frames, M4A ilst atoms.
+
+The wanted tags are diffed against the file first: matching files are not touched.
+A changed tag is written over the old one when it fits in the space the file already
+reserves for tags (old tag + PADDING block / ID3 padding / free atom), so only a few
+KB change. Otherwise the file is rewritten through a temporary file in the same
+directory, renamed over the original, with fresh padding for the next writes.
+
+Tags are {field: [values]} with the FIELDS keys. Fields missing or empty in the
+wanted tags are left as they are in the file.
+"""
+import os
+import shutil
+import struct
+import tempfile
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple, Union
+from .audio_meta import _syncsafe, _parse_pair
+
+FIELDS = ('title', 'artist', 'album', 'albumartist', 'date', 'genre', 'tracknumber')
+# padding reserved when a file has to be rewritten
+DEFAULT_PADDING = 8192
+# separator of multiple values in formats with a single value per field (ID3v2.3, MP4)
+VALUE_SEPARATOR = '; '
+# largest moov atom loaded in memory
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+COPY_BUFFER = 1024 * 1024
+
+Tags = Dict[str, List[str]]
+
+class WriteResult(NamedTuple):
+    status: str  # 'unchanged' | 'in_place' | 'rewritten' | 'unsupported'
+    bytes_written: int = 0
+    file_size: int = 0  # size before the write (what a full rewrite would write)
+
+class TagWriteError(Exception):
+    """The file cannot be tagged (unsupported layout or corrupted headers)"""
+
+
+class _Plan(NamedTuple):
+    """How a file is updated: patches written in place, or a rewrite from parts"""
+    patches: List[Tuple[int, bytes]] = []  # (offset, data)
+    truncate: Optional[int] = None  # new file size after the patches
+    parts: List[Union[bytes, Tuple[int, int]]] = []  # rewrite: new bytes or (start, end) ranges of the old file
+
+
+def read_tags(path: str) -> Tags:
+    """Tags of a file (FIELDS only), empty for unsupported formats"""
+    try:
+        with open(path, 'rb') as f:
+            reader = _format(path, f.read(12))
+            return reader[0](f) if reader else {}
+    except (struct.error, ValueError, IndexError, TagWriteError):
+        return {}
+
+def write_tags(path: str, tags: Tags, padding: int = DEFAULT_PADDING, dry_run: bool = False) -> WriteResult:
+    """
+    Write tags to a file, in place when they fit.
+
+    Args:
+        path: audio file
+        tags: wanted tags ({field: [values]})
+        padding: padding bytes reserved when the file is rewritten
+        dry_run: only diff and plan, write nothing
+
+    Returns:
+        WriteResult: what was done (or would be done) and the bytes written
+
+    Raises:
+        OSError: the file cannot be read or written
+    """
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        head = f.read(12)
+        handlers = _format(path, head)
+        if handlers is None:
+            return WriteResult('unsupported', 0, file_size)
+        try:
+            plan = handlers[1](f, head, file_size, tags, padding)
+        except (struct.error, ValueError, IndexError, TagWriteError):
+            return WriteResult('unsupported', 0, file_size)
+    if plan is None:
+        return WriteResult('unchanged', 0, file_size)
+
+    if plan.parts:
+        written = sum(len(part) if isinstance(part, bytes) else part[1] - part[0] for part in plan.parts)
+        if not dry_run:
+            _replace_file(path, plan.parts)
+        return WriteResult('rewritten', written, file_size)
+    written = sum(len(data) for _, data in plan.patches)
+    if not dry_run:
+        _patch_file(path, plan.patches, plan.truncate)
+    return WriteResult('in_place', written, file_size)
+
+def _format(path: str, head: bytes):
+    """(reader, planner) of the tag format of a file, None if unsupported"""
+    if head[:4] == b'fLaC' or (head[:3] == b'ID3' and path.lower().endswith('.flac')):
+        return _read_flac_tags, _plan_flac
+    if head[4:8] == b'ftyp':
+        return _read_mp4_tags, _plan_mp4
+    if head[:3] == b'ID3' or path.lower().endswith('.mp3'):
+        return _read_id3_tags, _plan_id3
+    return None
+
+def _merge(old: Tags, new: Tags, single_value: bool = False) -> Optional[Tags]:
+    """
+    Fields to write: the wanted values differing from the file, None if nothing changes.
+    A track total in the file is kept ('3' over '2/12' -> '3/12').
+    """
+    changed = {}
+    for key, values in new.items():
+        values = [str(value) for value in values or [] if value not in (None, '')]
+        if not values:
+            continue
+        if single_value and len(values) > 1:
+            values = [VALUE_SEPARATOR.join(values)]
+        if key == 'tracknumber' and old.get(key):
+            number, total = _parse_pair(values[0])
+            old_total = _parse_pair(old[key][0])[1]
+            if number and old_total and not total:
+                values = [f"{number}/{old_total}"]
+        if old.get(key) != values:
+            changed[key] = values
+    return changed or None
+
+#------------ FILE UPDATES -----------#
+
+def _patch_file(path: str, patches: List[Tuple[int, bytes]], truncate: Optional[int] = None) -> None:
+    with open(path, 'r+b') as f:
+        for offset, data in patches:
+            f.seek(offset)
+            f.write(data)
+        if truncate is not None:
+            f.truncate(truncate)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _replace_file(path: str, parts: List[Union[bytes, Tuple[int, int]]]) -> None:
+    """Stream the new content to a temporary file next to the original, then rename it over"""
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+    try:
+        with open(path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            for part in parts:
+                if isinstance(part, bytes):
+                    dst.write(part)
+                    continue
+                start, end = part
+                src.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = src.read(min(COPY_BUFFER, remaining))
+                    if not chunk:
+                        raise TagWriteError(f"{path} is shorter than expected")
+                    dst.write(chunk)
+                    remaining -= len(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+#------------ FLAC -----------#
+
+VORBIS_KEYS = {'title': 'TITLE', 'artist': 'ARTIST', 'album': 'ALBUM', 'albumartist': 'ALBUMARTIST',
+               'date': 'DATE', 'genre': 'GENRE', 'tracknumber': 'TRACKNUMBER'}
+_FLAC_PADDING, _FLAC_VORBIS = 1, 4
+
+class _FlacBlock(NamedTuple):
+    offset: int
+    type: int
+    length: int
+
+    @property
+    def end(self) -> int:
+        return self.offset + 4 + self.length
+
+def _flac_blocks(f: BinaryIO, head: bytes) -> Tuple[int, List[_FlacBlock]]:
+    """(offset of 'fLaC', metadata blocks)"""
+    start = 10 + _syncsafe(head[6:10]) if head[:3] == b'ID3' else 0
+    f.seek(start)
+    if f.read(4) != b'fLaC':
+        raise TagWriteError("no FLAC stream marker")
+    blocks = []
+    offset, last = start + 4, False
+    while not last:
+        f.seek(offset)
+        header = f.read(4)
+        if len(header) < 4:
+            raise TagWriteError("truncated FLAC metadata")
+        last = bool(header[0] & 0x80)
+        block = _FlacBlock(offset, header[0] & 0x7F, int.from_bytes(header[1:4], 'big'))
+        blocks.append(block)
+        offset = block.end
+    return start, blocks
+
+def _vorbis_entries(data: bytes) -> Tuple[bytes, List[str]]:
+    """Vorbis comment block -> (vendor, ['KEY=value', ...])"""
+    vendor_length = struct.unpack_from('<I', data, 0)[0]
+    vendor = data[4:4 + vendor_length]
+    offset = 4 + vendor_length
+    count = struct.unpack_from('<I', data, offset)[0]
+    offset += 4
+    entries = []
+    for _ in range(count):
+        length = struct.unpack_from('<I', data, offset)[0]
+        entries.append(data[offset + 4:offset + 4 + length].decode('utf-8', 'replace'))
+        offset += 4 + length
+    return vendor, entries
+
+def _vorbis_tags(entries: List[str]) -> Tags:
+    keys = {key: field for field, key in VORBIS_KEYS.items()}
+    tags = {}
+    for entry in entries:
+        key, _, value = entry.partition('=')
+        field = keys.get(key.upper())
+        if field:
+            tags.setdefault(field, []).append(value)
+    return tags
+
+def _read_flac_tags(f: BinaryIO) -> Tags:
+    f.seek(0)
+    _, blocks = _flac_blocks(f, f.read(12))
+    vorbis = next((b for b in blocks if b.type == _FLAC_VORBIS), None)
+    if vorbis is None:
+        return {}
+    f.seek(vorbis.offset + 4)
+    return _vorbis_tags(_vorbis_entries(f.read(vorbis.length))[1])
+
+def _flac_block(block_type: int, data: bytes, last: bool = False) -> bytes:
+    if len(data) >= 1 << 24:
+        raise TagWriteError("FLAC metadata block too large")
+    return bytes([block_type | (0x80 if last else 0)]) + len(data).to_bytes(3, 'big') + data
+
+def _plan_flac(f: BinaryIO, head: bytes, file_size: int, tags: Tags, padding: int) -> Optional[_Plan]:
+    start, blocks = _flac_blocks(f, head)
+    index = next((i for i, b in enumerate(blocks) if b.type == _FLAC_VORBIS), None)
+    vendor, entries = b'taggivm', []
+    if index is not None:
+        f.seek(blocks[index].offset + 4)
+        vendor, entries = _vorbis_entries(f.read(blocks[index].length))
+    changed = _merge(_vorbis_tags(entries), tags)
+    if changed is None:
+        return None
+
+    # replace the changed fields where they were, append the new ones
+    keys = {VORBIS_KEYS[field]: values for field, values in changed.items()}
+    new_entries = []
+    for entry in entries:
+        key = entry.partition('=')[0].upper()
+        if key not in keys:
+            new_entries.append(entry)
+        elif keys[key] is not None:
+            new_entries.extend(f"{key}={value}" for value in keys[key])
+            keys[key] = None
+    new_entries.extend(f"{key}={value}" for key, values in keys.items() if values is not None for value in values)
+    encoded = [entry.encode('utf-8') for entry in new_entries]
+    data = (struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', len(encoded))
+            + b''.join(struct.pack('<I', len(entry)) + entry for entry in encoded))
+
+    def block_bytes(i: int, block: _FlacBlock) -> bytes:
+        if i == index:
+            return data
+        f.seek(block.offset + 4)
+        return f.read(block.length)
+
+    last_end = blocks[-1].end
+    if index is not None:
+        old = blocks[index]
+        # same size, or smaller with room for a PADDING header: write the block alone
+        if len(data) == old.length or old.length - len(data) >= 4:
+            is_last = old.end == last_end
+            patch = _flac_block(_FLAC_VORBIS, data, is_last and len(data) == old.length)
+            if len(data) < old.length:
+                patch += _flac_block(_FLAC_PADDING, b'', is_last)[:1] + (old.length - len(data) - 4).to_bytes(3, 'big')
+            return _Plan(patches=[(old.offset, patch)])
+
+    # take the space from the nearest PADDING block: rewrite the blocks between it and the comments
+    paddings = [i for i, b in enumerate(blocks) if b.type == _FLAC_PADDING]
+    position = index if index is not None else len(blocks)
+    for pad in sorted(paddings, key=lambda i: abs(i - position)):
+        first, last = min(pad, position), max(pad, position if index is not None else pad)
+        span = blocks[first:last + 1]
+        body = b''
+        if index is None and first == pad:
+            body += _flac_block(_FLAC_VORBIS, data)  # new comments before the padding
+        for i, block in enumerate(span, first):
+            if i != pad:
+                body += _flac_block(block.type, block_bytes(i, block))
+        room = span[-1].end - span[0].offset - len(body) - 4
+        if room < 0:
+            continue
+        body += _flac_block(_FLAC_PADDING, b'', span[-1].end == last_end)[:1] + room.to_bytes(3, 'big')
+        # the old bytes left inside the new padding need no zeroing, unless they were not padding
+        old_data_end = blocks[pad].offset + 4 if pad == last else span[-1].end
+        written = max(len(body), old_data_end - span[0].offset)
+        body += bytes(written - len(body))
+        return _Plan(patches=[(span[0].offset, body)])
+
+    # no room: rewrite with the comments after STREAMINFO and fresh padding at the end
+    new_blocks = []
+    for i, block in enumerate(blocks):
+        if block.type != _FLAC_PADDING:
+            new_blocks.append((block.type, block_bytes(i, block)))
+        if index is None and i == 0:
+            new_blocks.append((_FLAC_VORBIS, data))
+    new_blocks.append((_FLAC_PADDING, bytes(padding)))
+    metadata = b''.join(_flac_block(t, d, i == len(new_blocks) - 1) for i, (t, d) in enumerate(new_blocks))
+    return _Plan(parts=[(0, start + 4), metadata, (last_end, file_size)])
+
+#------------ MP3 (ID3v2) -----------#
+
+ID3_FRAMES = {'title': 'TIT2', 'artist': 'TPE1', 'album': 'TALB', 'albumartist': 'TPE2',
+              'date': 'TDRC', 'genre': 'TCON', 'tracknumber': 'TRCK'}
+ID3V23_FRAMES = {**ID3_FRAMES, 'date': 'TYER'}
+
+class _Id3Tag(NamedTuple):
+    major: int  # 0: no tag
+    flags: int
+    size: int  # tag size, header excluded
+    frames: List[Tuple[str, bytes, bytes]]  # (id, flags, data)
+    frames_end: int  # file offset of the padding
+
+def _id3_tag(f: BinaryIO) -> _Id3Tag:
+    f.seek(0)
+    header = f.read(10)
+    if header[:3] != b'ID3':
+        return _Id3Tag(0, 0, 0, [], 0)
+    major, flags, size = header[3], header[5], _syncsafe(header[6:10])
+    # v2.2, unsynchronisation, extended header (CRC) and footer are not rewritten
+    if major not in (3, 4) or flags & 0xD0:
+        raise TagWriteError(f"unsupported ID3v2.{major} layout")
+    data = f.read(size)
+    frames, offset = [], 0
+    while offset + 10 <= len(data) and data[offset] != 0:
+        frame_id = data[offset:offset + 4].decode('latin-1')
+        frame_size = _syncsafe(data[offset + 4:offset + 8]) if major == 4 else int.from_bytes(data[offset + 4:offset + 8], 'big')
+        if offset + 10 + frame_size > len(data):
+            raise TagWriteError("truncated ID3v2 frame")
+        frames.append((frame_id, data[offset + 8:offset + 10], data[offset + 10:offset + 10 + frame_size]))
+        offset += 10 + frame_size
+    return _Id3Tag(major, flags, size, frames, 10 + offset)
+
+def _id3_values(data: bytes) -> List[str]:
+    """All the values of an ID3v2 text frame"""
+    if not data:
+        return []
+    encoding = {0: 'latin-1', 1: 'utf-16', 2: 'utf-16-be', 3: 'utf-8'}.get(data[0], 'latin-1')
+    text = data[1:].decode(encoding, 'replace')
+    return [value.lstrip('\ufeff') for value in text.rstrip('\x00').split('\x00')]
+
+def _id3_tags(tag: _Id3Tag) -> Tags:
+    frame_ids = {frame_id: field for field, frame_id in (ID3_FRAMES if tag.major == 4 else ID3V23_FRAMES).items()}
+    tags = {}
+    for frame_id, _, data in tag.frames:
+        field = frame_ids.get(frame_id)
+        if field and field not in tags:
+            tags[field] = _id3_values(data)
+    return tags
+
+def _read_id3_tags(f: BinaryIO) -> Tags:
+    return _id3_tags(_id3_tag(f))
+
+def _id3_frame(major: int, frame_id: str, values: List[str]) -> bytes:
+    if major == 4:
+        data = b'\x03' + '\x00'.join(values).encode('utf-8')
+        size = len(data)
+        size_bytes = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    else:
+        text = values[0]
+        try:
+            data = b'\x00' + text.encode('latin-1')
+        except UnicodeEncodeError:
+            data = b'\x01' + text.encode('utf-16')
+        size_bytes = len(data).to_bytes(4, 'big')
+    return frame_id.encode('latin-1') + size_bytes + b'\x00\x00' + data
+
+def _id3_header(major: int, flags: int, size: int) -> bytes:
+    if size >= 1 << 28:
+        raise TagWriteError("ID3v2 tag too large")
+    return b'ID3' + bytes([major, 0, flags]) + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+
+def _plan_id3(f: BinaryIO, head: bytes, file_size: int, tags: Tags, padding: int) -> Optional[_Plan]:
+    tag = _id3_tag(f)
+    major = tag.major or 4
+    changed = _merge(_id3_tags(tag), tags, single_value=major == 3)
+    if changed is None:
+        return None
+
+    frame_ids = ID3_FRAMES if major == 4 else ID3V23_FRAMES
+    pending = {frame_ids[field]: values for field, values in changed.items()}
+    frames = []
+    for frame_id, flags, data in tag.frames:
+        if frame_id not in pending:
+            size = len(data)
+            size_bytes = _id3_header(major, 0, size)[6:] if major == 4 else size.to_bytes(4, 'big')
+            frames.append(frame_id.encode('latin-1') + size_bytes + flags + data)
+        elif pending[frame_id] is not None:
+            frames.append(_id3_frame(major, frame_id, pending[frame_id]))
+            pending[frame_id] = None
+    frames.extend(_id3_frame(major, frame_id, values) for frame_id, values in pending.items() if values is not None)
+    body = b''.join(frames)
+
+    if tag.major and len(body) <= tag.size:
+        # fits in the old tag: same size, the rest is padding (zeroed over the old frames only)
+        written = max(len(body), tag.frames_end - 10)
+        return _Plan(patches=[(0, _id3_header(major, tag.flags, tag.size) + body + bytes(written - len(body)))])
+    new_tag = _id3_header(major, tag.flags, len(body) + padding) + body + bytes(padding)
+    return _Plan(parts=[new_tag, (10 + tag.size if tag.major else 0, file_size)])
+
+#------------ M4A -----------#
+
+MP4_ATOMS = {'title': b'\xa9nam', 'artist': b'\xa9ART', 'album': b'\xa9alb', 'albumartist': b'aART',
+             'date': b'\xa9day', 'genre': b'\xa9gen', 'tracknumber': b'trkn'}
+_FREE_ATOMS = (b'free', b'skip')
+# iTunes metadata handler of the meta atom
+_MDIR_HDLR = b'\x00' * 8 + b'mdirappl' + b'\x00' * 9
+
+class _Atom(NamedTuple):
+    offset: int  # header start
+    header_size: int
+    end: int
+    type: bytes
+
+    @property
+    def start(self) -> int:
+        return self.offset + self.header_size
+
+def _atoms(data: bytes, start: int, end: int) -> List[_Atom]:
+    """Child atoms of a buffer range"""
+    atoms = []
+    offset = start
+    while offset + 8 <= end:
+        size, atom_type = struct.unpack_from('>I4s', data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise TagWriteError("corrupted MP4 atom")
+        atoms.append(_Atom(offset, header_size, offset + size, atom_type))
+        offset += size
+    return atoms
+
+def _child(data: bytes, parent: _Atom, name: bytes) -> Optional[_Atom]:
+    start = parent.start + (4 if parent.type == b'meta' else 0)  # meta is a full atom
+    return next((atom for atom in _atoms(data, start, parent.end) if atom.type == name), None)
+
+def _atom(name: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), name) + payload
+
+def _mp4_moov(f: BinaryIO, file_size: int) -> Tuple[_Atom, List[_Atom], bytes]:
+    """(moov atom in the file, top-level atoms, moov bytes)"""
+    top, offset = [], 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        header = f.read(16)
+        size, atom_type = struct.unpack_from('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size, header_size = struct.unpack_from('>Q', header, 8)[0], 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            raise TagWriteError("corrupted MP4 atom")
+        top.append(_Atom(offset, header_size, min(offset + size, file_size), atom_type))
+        offset += size
+    moov = next((atom for atom in top if atom.type == b'moov'), None)
+    if moov is None or moov.end - moov.offset > MAX_MOOV_SIZE:
+        raise TagWriteError("no usable moov atom")
+    f.seek(moov.offset)
+    return moov, top, f.read(moov.end - moov.offset)
+
+def _ilst_path(data: bytes) -> List[Optional[_Atom]]:
+    """[moov, udta, meta, ilst] in the moov buffer, None from the first missing one"""
+    path = [_atoms(data, 0, len(data))[0]]
+    for name in (b'udta', b'meta', b'ilst'):
+        path.append(_child(data, path[-1], name) if path[-1] is not None else None)
+    return path
+
+def _mp4_items(data: bytes, ilst: Optional[_Atom]) -> List[Tuple[bytes, bytes]]:
+    """(name, raw atom) of the ilst items"""
+    if ilst is None:
+        return []
+    return [(atom.type, data[atom.offset:atom.end]) for atom in _atoms(data, ilst.start, ilst.end)]
+
+def _mp4_item_values(raw: bytes) -> List[str]:
+    name = raw[4:8]
+    values = []
+    for atom in _atoms(raw, 8, len(raw)):
+        if atom.type != b'data':
+            continue
+        payload = raw[atom.start + 8:atom.end]  # type + locale
+        if name == b'trkn':
+            number, total = struct.unpack_from('>HH', payload, 2) if len(payload) >= 6 else (0, 0)
+            values.append(f"{number}/{total}" if total else str(number))
+        else:
+            values.append(payload.decode('utf-8', 'replace'))
+    return values
+
+def _mp4_tags(items: List[Tuple[bytes, bytes]]) -> Tags:
+    names = {name: field for field, name in MP4_ATOMS.items()}
+    tags = {}
+    for name, raw in items:
+        field = names.get(name)
+        if field and field not in tags:
+            tags[field] = _mp4_item_values(raw)
+    return tags
+
+def _read_mp4_tags(f: BinaryIO) -> Tags:
+    _, _, data = _mp4_moov(f, os.fstat(f.fileno()).st_size)
+    return _mp4_tags(_mp4_items(data, _ilst_path(data)[3]))
+
+def _mp4_item(field: str, value: str) -> bytes:
+    if field == 'tracknumber':
+        number, total = _parse_pair(value)
+        return _atom(MP4_ATOMS[field], _atom(b'data', struct.pack('>II', 0, 0) + struct.pack('>HHHH', 0, number, total, 0)))
+    return _atom(MP4_ATOMS[field], _atom(b'data', struct.pack('>II', 1, 0) + value.encode('utf-8')))
+
+def _resize(data: bytearray, ancestors: List[_Atom], delta: int) -> None:
+    """Add delta to the size of enclosing atoms"""
+    for atom in ancestors:
+        if atom.header_size == 16:
+            struct.pack_into('>Q', data, atom.offset + 8, atom.end - atom.offset + delta)
+        else:
+            struct.pack_into('>I', data, atom.offset, atom.end - atom.offset + delta)
+
+def _shift_chunk_offsets(data: bytearray, moov: _Atom, after: int, delta: int) -> None:
+    """Move the stco/co64 chunk offsets pointing past `after` by delta"""
+    for trak in _atoms(data, moov.start, moov.end):
+        if trak.type != b'trak':
+            continue
+        stbl = trak
+        for name in (b'mdia', b'minf', b'stbl'):
+            stbl = _child(data, stbl, name)
+            if stbl is None:
+                break
+        if stbl is None:
+            continue
+        for table in _atoms(data, stbl.start, stbl.end):
+            if table.type not in (b'stco', b'co64'):
+                continue
+            fmt, width = ('>I', 4) if table.type == b'stco' else ('>Q', 8)
+            count = struct.unpack_from('>I', data, table.start + 4)[0]
+            for i in range(count):
+                position = table.start + 8 + i * width
+                value = struct.unpack_from(fmt, data, position)[0]
+                if value >= after:
+                    if table.type == b'stco' and value + delta >= 1 << 32:
+                        raise TagWriteError("chunk offset overflow: stco would need co64")
+                    struct.pack_into(fmt, data, position, value + delta)
+
+def _plan_mp4(f: BinaryIO, head: bytes, file_size: int, tags: Tags, padding: int) -> Optional[_Plan]:
+    moov, top, data = _mp4_moov(f, file_size)
+    path = _ilst_path(data)
+    items = _mp4_items(data, path[3])
+    changed = _merge(_mp4_tags(items), tags, single_value=True)
+    if changed is None:
+        return None
+
+    pending = {MP4_ATOMS[field]: (field, values) for field, values in changed.items()}
+    new_items = []
+    for name, raw in items:
+        if name == b'gnre' and 'genre' in changed:
+            continue  # ID3v1 genre number, superseded by the ©gen text
+        if name not in pending:
+            new_items.append(raw)
+        elif pending[name] is not None:
+            new_items.append(_mp4_item(pending[name][0], pending[name][1][0]))
+            pending[name] = None
+    new_items.extend(_mp4_item(field, values[0]) for field, values in (p for p in pending.values() if p is not None))
+    ilst = _atom(b'ilst', b''.join(new_items))
+    meta, old_ilst = path[2], path[3]
+
+    if old_ilst is not None:
+        # free space right after the ilst, inside meta
+        siblings = _atoms(data, meta.start + 4, meta.end)
+        following = next((atom for atom in siblings if atom.offset == old_ilst.end), None)
+        free = following.end - following.offset if following is not None and following.type in _FREE_ATOMS else 0
+        room = old_ilst.end - old_ilst.offset + free - len(ilst)
+        if room == 0 or room >= 8:
+            patch = ilst + (struct.pack('>I4s', room, b'free') if room else b'')
+            return _Plan(patches=[(moov.offset + old_ilst.offset, patch)])
+
+    following = next((atom for atom in top if atom.offset == moov.end), None)
+    if following is not None and following.type in _FREE_ATOMS:
+        new_moov, ancestors, start, delta = _splice_ilst(data, path, ilst)
+        room = following.end - following.offset - delta
+        if room == 0 or room >= 8:
+            # top-level free atom after moov absorbs the growth: the media data does not move
+            free = struct.pack('>I4s', room, b'free') if room else b''
+            return _Plan(patches=_header_patches(new_moov, moov, ancestors) + [(moov.offset + start, bytes(new_moov[start:]) + free)])
+
+    # new ilst + padding for the next writes
+    new_moov, ancestors, start, delta = _splice_ilst(data, path, ilst + _atom(b'free', bytes(padding)))
+    if following is None:
+        # moov at the end of the file: grow it in place, nothing moves
+        patches = _header_patches(new_moov, moov, ancestors) + [(moov.offset + start, bytes(new_moov[start:]))]
+        return _Plan(patches=patches, truncate=moov.offset + len(new_moov))
+
+    # the media data after moov moves by delta: shift the chunk offsets
+    _shift_chunk_offsets(new_moov, _atoms(new_moov, 0, len(new_moov))[0], moov.end, delta)
+    return _Plan(parts=[(0, moov.offset), bytes(new_moov), (moov.end, file_size)])
+
+def _splice_ilst(data: bytes, path: List[Optional[_Atom]], ilst: bytes) -> Tuple[bytearray, List[_Atom], int, int]:
+    """
+    Put a new ilst (and a free atom after it, replaced) in the moov buffer, creating the
+    missing udta/meta parents. Returns (new moov, resized parents, splice offset, size change).
+    """
+    moov, udta, meta, old_ilst = path
+    if old_ilst is not None:
+        start, end, ancestors = old_ilst.offset, old_ilst.end, [moov, udta, meta]
+        following = next((atom for atom in _atoms(data, meta.start + 4, meta.end) if atom.offset == old_ilst.end), None)
+        if following is not None and following.type in _FREE_ATOMS:
+            end = following.end
+        insert = ilst
+    elif meta is not None:
+        start = end = meta.end
+        insert, ancestors = ilst, [moov, udta, meta]
+    elif udta is not None:
+        start = end = udta.end
+        insert, ancestors = _atom(b'meta', b'\x00' * 4 + _atom(b'hdlr', _MDIR_HDLR) + ilst), [moov, udta]
+    else:
+        start = end = moov.end
+        insert, ancestors = _atom(b'udta', _atom(b'meta', b'\x00' * 4 + _atom(b'hdlr', _MDIR_HDLR) + ilst)), [moov]
+    delta = len(insert) - (end - start)
+    new_moov = bytearray(data)
+    _resize(new_moov, ancestors, delta)
+    new_moov[start:end] = insert
+    return new_moov, ancestors, start, delta
+
+def _header_patches(new_moov: bytearray, moov: _Atom, ancestors: List[_Atom]) -> List[Tuple[int, bytes]]:
+    """File patches of the resized parent headers"""
+    return [(moov.offset + atom.offset, bytes(new_moov[atom.offset:atom.start])) for atom in ancestors]
@@ -0,0 +1,176 @@
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple, Iterator
+from core import TrackData, AlbumData, profiler
+
+# regex for album folder name like "1999 - OK Computer"
+ALBUM_NAME_PATTERN = re.compile(r"^\d{4} - .+")
+
+# supported audio file extensions
+AUDIO_EXTS = ('.mp3', '.flac', '.wav', '.m4a')
+_AUDIO_SUFFIXES = frozenset(ext[1:] for ext in AUDIO_EXTS)
+
+# threads listing artist subtrees: the walk is latency-bound (NAS, network mounts), not CPU-bound
+DEFAULT_WORKERS = 8
+
+def is_audio(name: str) -> bool:
+    """Check the file extension against AUDIO_EXTS"""
+    _, dot, suffix = name.rpartition('.')
+    return bool(dot) and suffix.lower() in _AUDIO_SUFFIXES
+
+
+# album folders found by the walk: (artist folder, album folder, album path, audio file names)
+AlbumFolder = Tuple[str, str, str, List[str]]
+
+def iter_library(src_filepath: Path, workers: int = DEFAULT_WORKERS) -> Iterator[AlbumFolder]:
+    """
+    Walk the music library with os.scandir, one artist subtree per worker thread,
+    yielding the valid album folders as soon as their artist subtree is listed.
+
+    Same rules of the os.walk based scan: folders holding audio files must be
+    'Artist/YYYY - Album', folders with a '.scanned' marker are skipped.
+    Every folder is listed once, file types come from the DirEntry (no extra
+    stat calls), warnings and albums come out in listing order. At most
+    2 * workers artist subtrees are in flight, so memory does not grow with
+    the library size.
+
+    Args:
+        src_filepath (Path): root of the music library
+        workers (int): max number of threads listing artist subtrees
+
+    Yields:
+        tuple: (artist folder, album folder, album path, audio file names)
+    """
+    root = os.fspath(src_filepath)
+    subdirs, files = _list_dir(root)
+
+    if '.scanned' not in files and any(is_audio(f) for f in files):
+        print(f"⚠️ Invalid folder structure: '{root}' should be two levels deep (e.g., 'Artist/Album').")
+
+    if workers <= 1 or len(subdirs) <= 1:
+        for artist_entry in subdirs:
+            yield from _emit(artist_entry, _walk_artist(artist_entry))
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='walker') as pool:
+        pending = deque()
+        try:
+            for artist_entry in subdirs:
+                pending.append((artist_entry, pool.submit(_walk_artist, artist_entry)))
+                if len(pending) >= 2 * workers:
+                    artist, future = pending.popleft()
+                    yield from _emit(artist, future.result())
+            while pending:
+                artist, future = pending.popleft()
+                yield from _emit(artist, future.result())
+        finally:
+            # consumer stopped early: do not list the remaining artists
+            for _, future in pending:
+                future.cancel()
+
+def walk_library(src_filepath: Path, workers: int = DEFAULT_WORKERS) -> Dict[str, Dict[str, Path]]:
+    """
+    Walk the whole music library (see iter_library).
+
+    Returns:
+        dict: A dictionary mapping artist names to their album paths.
+    """
+    scan_tree = {}
+    for artist, album, album_path, _ in iter_library(src_filepath, workers=workers):
+        scan_tree.setdefault(artist, {})[album] = Path(album_path)
+    return scan_tree
+
+def iter_albums(src_filepath: Path, workers: int = DEFAULT_WORKERS) -> Iterator[AlbumData]:
+    """Walk the music library yielding the album data (with tracklist) of every valid album"""
+    for artist, album, album_path, audio_files in iter_library(src_filepath, workers=workers):
+        yield build_album(artist, album, Path(album_path), audio_files)
+
+def build_album(artist: str, album: str, album_path: Path, files: List[str]) -> AlbumData:
+    """Build the album data (with its tracklist) from the file names of an album folder"""
+    year, album_title = album.split(' - ', 1)
+    audio_files = [f for f in files if is_audio(f)]
+    album_posix = album_path.as_posix()
+    album_obj = AlbumData(
+        title=album_title,
+        release_year=year,
+        album_artist=artist,
+        total_tracks=len(audio_files),
+        path=album_posix,
+        tracklist=[]
+    )
+    for f in audio_files:
+        title, format = f.rsplit('.', 1)
+        # check why with e.. di yeat seams spaced
+        track_obj = TrackData(
+            title=title,
+            path=f"{album_posix}/{f}",
+            format=sys.intern(format.lower()),  # a handful of distinct values across the library
+        )
+        album_obj.tracklist.append(track_obj)
+    return album_obj
+
+def _emit(artist_entry: os.DirEntry, result: Tuple[List[Tuple[str, str, List[str]]], List[str]]) -> Iterator[AlbumFolder]:
+    """Print the warnings of an artist subtree and yield its albums"""
+    albums, warnings = result
+    for warning in warnings:
+        print(warning)
+    for album, album_path, audio_files in albums:
+        yield artist_entry.name, album, album_path, audio_files
+
+def _list_dir(path: str) -> Tuple[List[os.DirEntry], List[str]]:
+    """List a folder: (subfolders to descend into, names of everything else)"""
+    subdirs = []
+    files = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                # like os.walk: symlinks to folders are listed but not followed
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry)
+                else:
+                    files.append(entry.name)
+    except OSError:
+        pass  # os.walk ignores unreadable folders too
+    return subdirs, files
+
+def _walk_artist(artist_entry: os.DirEntry) -> Tuple[List[Tuple[str, str, List[str]]], List[str]]:
+    """Walk a single artist subtree, returning its valid albums (folder, path, audio files) and the warnings"""
+    albums = []
+    warnings = []
+
+    listed = entries = 0
+
+    # depth-first, top-down like os.walk
+    stack = [(artist_entry, 1)]
+    while stack:
+        entry, depth = stack.pop()
+        subdirs, files = _list_dir(entry.path)
+        listed += 1
+        entries += len(subdirs) + len(files)
+        stack.extend((sub, depth + 1) for sub in reversed(subdirs))
+
+        if '.scanned' in files:
+            continue
+
+        audio_files = [f for f in files if is_audio(f)]
+        if not audio_files:
+            continue
+
+        if depth != 2:
+            warnings.append(f"⚠️ Invalid folder structure: '{entry.path}' should be two levels deep (e.g., 'Artist/Album').")
+            continue
+
+        if not ALBUM_NAME_PATTERN.match(entry.name):
+            warnings.append(f"⚠️  Naming issue: '{entry.name}' does not match 'YYYY - Album Title'")
+            continue
+
+        albums.append((entry.name, entry.path, audio_files))
+
+    profiler.count('walk.folders', rows=listed)
+    profiler.count('walk.entries', rows=entries)
+    return albums, warnings
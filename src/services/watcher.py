@@ -0,0 +1,409 @@
+"""
+Watch mode: ingest new albums seconds after they land in the library.
+
+The library is followed with Linux inotify (through ctypes, no dependencies) or,
+where inotify is missing or out of watches, by polling the folder mtimes. Both
+backends report the album folders touched by file writes; an album is ingested
+once it has been quiet for `quiet` seconds (no event in that time), so a download
+writing its files one by one is ingested once, complete. Only the
+'Artist/YYYY - Album' folders not yet in the database are ingested, under any of
+the library roots. Folders without audio files yet (e.g. a download writing '.part'
+files) are followed until their audio lands, and the tracks landing in an album
+folder after its ingest are added to the album: by every event with inotify, for
+LATE_TRACKS_WINDOW seconds after the album was written while polling. Albums
+completed while nothing was watching are left to scan and reconcile.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Set, Iterable, Optional, Callable, Tuple
+from core import AlbumData, WatchStats
+from db import AlbumRepository, MusicRepository
+from .walker import ALBUM_NAME_PATTERN, is_audio, build_album, _list_dir
+from .audio_meta import fill_audio_info
+
+# seconds without events before an album folder is ingested
+DEFAULT_QUIET = 3.0
+# seconds between two scans of the folder mtimes (polling backend)
+DEFAULT_POLL_INTERVAL = 2.0
+# max seconds the inotify backend sleeps (checks the stop event in between)
+IDLE_WAKEUP = 1.0
+# seconds the polling backend keeps listing a written album folder for late tracks
+LATE_TRACKS_WINDOW = 3600.0
+
+class WatchLimitError(OSError):
+    """The inotify watch limit (fs.inotify.max_user_watches) is reached"""
+
+#------------ INOTIFY BACKEND -----------#
+
+# inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# folders: entries added or removed; album folders: file writes too
+_TREE_MASK = IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_ALBUM_MASK = _TREE_MASK | IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+def _libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class InotifySource:
+    """
+    inotify watches on the library roots, their artist folders and their album folders
+    (depth <= 2, one tree per root): folders added later are watched as soon as they appear.
+    """
+    name = 'inotify'
+
+    def __init__(self, roots: List[str]):
+        self.roots = roots
+        self._libc = _libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, Tuple[str, int]] = {}  # wd -> (folder, depth)
+        try:
+            for root in roots:
+                self._watch_tree(root, 0, set())
+        except OSError:
+            self.close()
+            raise
+
+    def wait(self, timeout: Optional[float], followed: Iterable[str] = ()) -> Set[str]:
+        """Block up to timeout seconds (None: IDLE_WAKEUP), returning the album folders touched (all are watched)"""
+        readable, _, _ = select.select([self._fd], [], [], IDLE_WAKEUP if timeout is None else timeout)
+        touched = set()
+        if not readable:
+            return touched
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return touched
+            self._parse(data, touched)
+
+    def albums(self) -> Set[str]:
+        """Album folders currently watched"""
+        return {folder for folder, depth in self._watches.values() if depth == 2}
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _parse(self, data: bytes, touched: Set[str]) -> None:
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0'))
+            offset += _EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped: every album folder may have changed
+                for root in self.roots:
+                    self._watch_tree(root, 0, touched)
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches:
+                continue
+            folder, depth = self._watches[wd]
+            if depth == 2:
+                touched.add(folder)
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # new artist or album folder, maybe moved in with its content: watch and list it
+                self._watch_tree(os.path.join(folder, name), depth + 1, touched)
+
+    def _watch_tree(self, folder: str, depth: int, touched: Set[str]) -> None:
+        """Watch a folder and its subfolders down to the album level, adding the albums to touched"""
+        self._add_watch(folder, depth)
+        if depth == 2:
+            touched.add(folder)
+            return
+        subdirs, _ = _list_dir(folder)
+        for entry in subdirs:
+            self._watch_tree(entry.path, depth + 1, touched)
+
+    def _add_watch(self, folder: str, depth: int) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), _ALBUM_MASK if depth == 2 else _TREE_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise WatchLimitError(error, "inotify watch limit reached (see fs.inotify.max_user_watches)")
+            if error in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return  # gone already or unreadable: like the scan, skip it
+            raise OSError(error, f"inotify_add_watch failed on '{folder}'")
+        self._watches[wd] = (folder, depth)
+
+#------------ POLLING BACKEND -----------#
+
+class PollingSource:
+    """
+    Poll the mtime of the root and artist folders (an entry added or removed changes it)
+    and the listing (file sizes and mtimes) of the album folders followed by the watcher:
+    a file added or renamed inside an album folder does not change its artist folder.
+    Cost of a poll: one stat per artist folder of every root, one listing per followed album.
+    """
+    name = 'polling'
+
+    def __init__(self, roots: List[str], interval: float = DEFAULT_POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self._mtimes: Dict[str, int] = {}  # roots and artist folders -> mtime_ns
+        self._albums: Dict[str, Optional[Set[str]]] = {}  # artist folder -> album folders (None: not listed yet)
+        self._signatures: Dict[str, tuple] = {}  # followed album folder -> listing signature
+        self._stop = threading.Event()
+        self._poll(set())
+
+    def wait(self, timeout: Optional[float], followed: Iterable[str] = ()) -> Set[str]:
+        """Sleep up to the poll interval, returning the album folders touched (listing of the followed ones changed)"""
+        self._stop.wait(self.interval if timeout is None else min(timeout, self.interval))
+        touched = set()
+        self._poll(touched)
+        followed = set(followed)
+        for album in followed:
+            signature = _signature(album)
+            if self._signatures.get(album) != signature:
+                self._signatures[album] = signature
+                touched.add(album)
+        for album in set(self._signatures) - followed - touched:
+            del self._signatures[album]
+        return touched
+
+    def albums(self) -> Set[str]:
+        """Album folders found by the last poll"""
+        return {album for albums in self._albums.values() if albums for album in albums}
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def _poll(self, touched: Set[str]) -> None:
+        for root in self.roots:
+            if not self._changed(root):
+                continue
+            artists = {entry.path for entry in _list_dir(root)[0]}
+            for artist in artists:
+                self._albums.setdefault(artist, None)
+            for gone in [artist for artist in self._albums if os.path.dirname(artist) == root and artist not in artists]:
+                del self._albums[gone]
+                self._mtimes.pop(gone, None)
+        for artist, known in self._albums.items():
+            if self._changed(artist):
+                albums = {entry.path for entry in _list_dir(artist)[0]}
+                touched.update(albums - (known or set()))
+                self._albums[artist] = albums
+
+    def _changed(self, folder: str) -> bool:
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            return False
+        if self._mtimes.get(folder) == mtime:
+            return False
+        self._mtimes[folder] = mtime
+        return True
+
+def _signature(folder: str) -> tuple:
+    """Names, sizes and mtimes of the files of a folder"""
+    entries = []
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((entry.name, st.st_size, st.st_mtime_ns))
+    except OSError:
+        pass
+    return tuple(sorted(entries))
+
+#------------ WATCHER -----------#
+
+class Watcher:
+    """
+    Follow the library roots and ingest the new albums once their folder is quiet.
+
+    Args:
+        roots (list): roots of the music library (e.g. lossless, lossy and archive mounts)
+        db_path (Path): database path
+        quiet (float): seconds without events before an album is ingested
+        polling (bool): use the polling backend even where inotify works
+        poll_interval (float): seconds between two polls (polling backend)
+        read_headers (bool): fill duration, track and disc numbers from the audio file headers
+        on_album: called with (album data, ingested) for every quiescent album folder, and with
+            (album data holding the new tracks only, True) when late tracks are added to an album
+        on_warning: called with the warnings (naming issues, backend fallback)
+    """
+    def __init__(self, roots: List[Path], db_path: Path, quiet: float = DEFAULT_QUIET, polling: bool = False,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, read_headers: bool = True,
+                 on_album: Optional[Callable[[AlbumData, bool], None]] = None,
+                 on_warning: Optional[Callable[[str], None]] = print):
+        self.roots = [os.fspath(root) for root in roots]
+        self.quiet = quiet
+        self.poll_interval = poll_interval
+        self.read_headers = read_headers
+        self.on_album = on_album
+        self.on_warning = on_warning or (lambda message: None)
+        self.music_repo = MusicRepository(db_path)
+        self.known = AlbumRepository(db_path).get_album_paths()
+        self.stats = WatchStats()
+        self._pending: Dict[str, float] = {}  # album folder -> monotonic time of its last event
+        self._waiting: Set[str] = set()  # quiescent album folders without audio files yet
+        self._written: Dict[str, float] = {}  # album folder -> monotonic time it was last written (late tracks)
+        self.source = self._open_source(polling)
+        # albums that landed while nobody was watching
+        self._add_pending(self.source.albums(), known=False)
+
+    def run(self, stop: Optional[threading.Event] = None) -> WatchStats:
+        """Watch until stop is set (or KeyboardInterrupt), returning the stats"""
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                self.step()
+        finally:
+            self.source.close()
+        return self.stats
+
+    def step(self) -> None:
+        """Wait for events (at most until the next album is due) and ingest the quiescent albums"""
+        timeout = None
+        if self._pending:
+            timeout = max(0.0, min(self._pending.values()) + self.quiet - time.monotonic())
+        try:
+            touched = self.source.wait(timeout, self._followed())
+        except WatchLimitError as e:
+            self.on_warning(f"⚠️ {e.strerror}: switching to polling.")
+            self.source.close()
+            self.source = PollingSource(self.roots, self.poll_interval)
+            self.stats.backend = self.source.name
+            # the events lost in the switch: every album folder not in the database
+            self._add_pending(self.source.albums(), known=False)
+            return
+
+        self._add_pending(touched)
+        now = time.monotonic()
+        for folder in [folder for folder, last in self._pending.items() if now - last >= self.quiet]:
+            del self._pending[folder]
+            self._ingest(folder)
+
+    def _add_pending(self, folders: Iterable[str], known: bool = True) -> None:
+        """(Re)start the quiet period of the touched album folders (known: also the ones in the database, for late tracks)"""
+        now = time.monotonic()
+        for folder in folders:
+            if known or folder not in self.known:
+                self.stats.events += 1
+                self._pending[folder] = now
+                self._waiting.discard(folder)
+
+    def _followed(self) -> Set[str]:
+        """Album folders whose listing the polling backend compares: pending, waiting for audio, recently written"""
+        expired = time.monotonic() - LATE_TRACKS_WINDOW
+        for folder in [folder for folder, written in self._written.items() if written < expired]:
+            del self._written[folder]
+        return set(self._pending) | self._waiting | set(self._written)
+
+    def _open_source(self, polling: bool):
+        if not polling:
+            try:
+                source = InotifySource(self.roots)
+                self.stats.backend = source.name
+                return source
+            except OSError as e:
+                self.on_warning(f"⚠️ inotify unavailable ({e.strerror or e}): polling every {self.poll_interval:g}s.")
+        self.stats.backend = PollingSource.name
+        return PollingSource(self.roots, self.poll_interval)
+
+    def _ingest(self, folder: str) -> None:
+        """Validate a quiescent album folder and ingest it if new"""
+        artist_path, album = os.path.split(folder)
+        if os.path.dirname(artist_path) not in self.roots or not os.path.isdir(folder):
+            return  # moved away or not at the album level
+        _, files = _list_dir(folder)
+        audio_files = [f for f in files if is_audio(f)]
+        if '.scanned' in files:
+            return
+        if not audio_files:
+            # empty or still downloading ('.part' files): followed until its audio lands
+            self._waiting.add(folder)
+            return
+        if folder in self.known:
+            self._add_late_tracks(artist_path, album, folder, audio_files)
+            return
+        if not ALBUM_NAME_PATTERN.match(album):
+            self.stats.rejected += 1
+            self.on_warning(f"⚠️  Naming issue: '{album}' does not match 'YYYY - Album Title'")
+            return
+
+        album_data = build_album(os.path.basename(artist_path), album, Path(folder), audio_files)
+        if self.read_headers:
+            album_data = next(fill_audio_info([album_data], processes=0))
+        album_ids, conflicts = self.music_repo.bulk_ingest([album_data], skip_existing=True)
+        if conflicts:
+            # not known: tried again on its next event (e.g. once renamed)
+            self.stats.conflicts += 1
+            self.on_warning(f"⚠️  Title conflict: '{album_data.path}' has the title of an album already in the database, not initialized.")
+            return
+        ingested = bool(album_ids)
+        self.known.add(album_data.path)
+        if ingested:
+            self.stats.albums += 1
+            self.stats.tracks += len(album_data.tracklist)
+            self._written[folder] = time.monotonic()
+        else:
+            self.stats.skipped += 1
+        if self.on_album:
+            self.on_album(album_data, ingested)
+
+    def _add_late_tracks(self, artist_path: str, album: str, folder: str, audio_files: List[str]) -> None:
+        """Add to an album of the database the audio files of its folder not in the database yet"""
+        album_data = build_album(os.path.basename(artist_path), album, Path(folder), audio_files)
+        known_tracks = self.music_repo.track_repo.get_album_track_paths(album_data.path)
+        album_data.tracklist = [track for track in album_data.tracklist if track.path not in known_tracks]
+        if not album_data.tracklist:
+            return  # tags rewritten, files removed...
+        if self.read_headers:
+            album_data = next(fill_audio_info([album_data], processes=0))
+        tracks = self.music_repo.add_tracks(album_data)
+        if not tracks:
+            return
+        self.stats.completed += 1
+        self.stats.tracks += tracks
+        self._written[folder] = time.monotonic()
+        if self.on_album:
+            self.on_album(album_data, True)
+
+def watch_library(roots: List[Path], db_path: Path, stop: Optional[threading.Event] = None, **options) -> WatchStats:
+    """Watch the roots of the music library ingesting the new albums (see Watcher for the options)"""
+    return Watcher(roots, db_path, **options).run(stop)
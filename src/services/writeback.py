@@ -0,0 +1,102 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, List, Any, Callable, Iterable, Optional, Tuple
+from core import WritebackReport, profiler
+from db import TrackRepository
+from .tag_writer import write_tags, WriteResult, DEFAULT_PADDING
+
+# threads writing albums: the work is file I/O
+DEFAULT_WRITE_WORKERS = 4
+
+def write_back(db_path: Path, workers: int = DEFAULT_WRITE_WORKERS, album_ids: Optional[Iterable[int]] = None,
+               padding: int = DEFAULT_PADDING, dry_run: bool = False,
+               progress: Optional[Callable[[WritebackReport], None]] = None) -> WritebackReport:
+    """
+    Write the aggregated metadata (final_*_metadata) into the audio files, one album per task.
+    Files whose tags already match are not touched, the others are updated in place when the
+    new tags fit in their padding (see services.tag_writer).
+
+    Args:
+        db_path (Path): database path
+        workers (int): albums written at the same time
+        album_ids: albums to write (all the aggregated ones if None)
+        padding (int): padding bytes reserved in the files that must be rewritten
+        dry_run (bool): only count what would be written
+        progress: called with the report after every album
+
+    Returns:
+        WritebackReport: files by outcome and bytes written
+    """
+    start = time.perf_counter()
+    track_repo = TrackRepository(db_path)
+    rows = track_repo.get_final_tags(album_ids)
+    report = WritebackReport(files=len(rows))
+    albums = [list(tracks) for _, tracks in groupby(rows, key=lambda row: row['album_id'])]
+
+    states = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='writeback') as pool:
+        futures = [pool.submit(_write_album, tracks, padding, dry_run) for tracks in albums]
+        for future in as_completed(futures):
+            for row, result, state in future.result():
+                _count(report, row, result)
+                if state is not None:
+                    states.append(state)
+            if progress:
+                progress(report)
+
+    if states:
+        track_repo.refresh_file_states(states)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def track_tags(row: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Tags of a get_final_tags() row (unknown artists are left out: the file keeps its own)"""
+    tags = {
+        'title': [row['title']],
+        'album': [row['album']],
+        'date': [row['year']],
+        'genre': [genre for genre in (row['genres'] or '').split('; ') if genre],
+        'tracknumber': [row['track_number']],
+    }
+    if row['artist']:
+        tags['artist'] = [row['artist']]
+    if row['album_artist']:
+        tags['albumartist'] = [row['album_artist']]
+    return tags
+
+def _write_album(tracks: List[Dict[str, Any]], padding: int, dry_run: bool) -> List[Tuple[Dict[str, Any], Any, Optional[Dict[str, Any]]]]:
+    """Worker task: (row, WriteResult or error, new file state) of every track of an album"""
+    results = []
+    for row in tracks:
+        state = None
+        try:
+            before = os.stat(row['path'])
+            result = write_tags(row['path'], track_tags(row), padding=padding, dry_run=dry_run)
+            if result.status in ('in_place', 'rewritten') and not dry_run:
+                after = os.stat(row['path'])
+                state = {
+                    'id': row['id'],
+                    'old_size': before.st_size, 'old_mtime_ns': before.st_mtime_ns,
+                    'file_size': after.st_size, 'file_mtime_ns': after.st_mtime_ns,
+                }
+        except FileNotFoundError:
+            result = None
+        except OSError as e:
+            result = e
+        results.append((row, result, state))
+    return results
+
+def _count(report: WritebackReport, row: Dict[str, Any], result: Any) -> None:
+    if result is None:
+        report.missing += 1
+    elif isinstance(result, WriteResult):
+        setattr(report, result.status, getattr(report, result.status) + 1)
+        if result.status in ('in_place', 'rewritten'):
+            report.bytes_written += result.bytes_written
+            report.bytes_rewrite += result.file_size
+        profiler.count(f'writeback.{result.status}', rows=1, bytes=result.bytes_written)
+    else:
+        report.errors.append(f"{row['path']}: {result}")